@@ -1,37 +1,141 @@
 import numpy as np
+from .forecast import Forecaster, Schedule
+from .dispatch import merit_order, SIGNS
+
+
+# same time negotiation of the opf with the grid (see negotiate): price of the grid in the first opf, factor applied
+# to the price at every further iteration, iterations at most and smallest change of the power of the feeder [MW]
+# for the negotiation to go on
+GRID_PRICE = 2
+PRICE_STEP = 1.5
+MAX_ITERATIONS = 5
+NEGOTIATION_TOL = 1e-3
 
 
 class DsoModel(object):
 
-    def __init__(self, TH):
-        self.P_sch24 = None
-        self.P_fake = []
+    def __init__(self, TH, step_size=15 * 60, method='seasonal_naive', bus_width=0, feeders=1, bus_slices=None):
+        '''TH is the threshold of every feeder or an array with the one of each feeder, bus_slices the columns of the
+        buses of each feeder in the bus_width powers of the buses (all of them for the first feeder by default)'''
+        self.steps_per_day = int(24 * 60 * 60 / step_size)
+        self.feeders = feeders
+        self.forecaster = Forecaster(self.steps_per_day, method, width=feeders, bus_width=bus_width)
+        self.schedule = Schedule(2 * self.steps_per_day, feeders) # day ahead + the rest of the current day
+        self.P_sch_buses = None # disaggregated day ahead schedule (steps, buses)
+        self.bus_slices = bus_slices if bus_slices is not None else [slice(0, bus_width)]
         self.report = dict()
+        self._elements_key = None # participants and elements of the index of prepare_res
+        self._elements = None
+        self._participants_key = None # elements of the participants of grid_participants
+        self._participants = None
         self.TH = TH
         pass
 
+    @property
+    def P_sch24(self):
+        '''scheduled power of the next 24 hours, (steps, feeders) with more than one feeder'''
+        P_sch24 = self.schedule.next(self.steps_per_day)
+        return P_sch24[:, 0] if self.feeders == 1 else P_sch24
+
     def power_forecast(self):
         ''' This function furnish the scheduling for next 24 hours
-        here should act a forecasting model of the reading of some written data'''
-        #self.P_sch24 = list(np.zeros(24 * 4))
-        self.P_sch24 = list(np.random.uniform(0, 3, 24*4))
-
-    def check_threshold(self, P_rt):
-        #for testing purpose********* cancelled when load forecasting is present
-        self.P_sch24[0] = P_rt - (P_rt * 0.1)
-        self.P_fake.append(self.P_sch24[0])
-        #*****************
-        delta = abs(self.P_sch24[0] - P_rt)
-        if delta < abs(self.TH * self.P_sch24[0]):
-            print('Threshold compliant!')
-            self.P_sch24.pop(0)
-            return False
+        the day ahead forecast of the history of P_rt (see forecast.Forecaster), the one of each feeder
+        disaggregated on its buses when their history is kept'''
+        P_sch24 = self.forecaster.forecast(self.steps_per_day)
+        self.schedule.set(P_sch24)
+        if self.forecaster.buses is not None:
+            P_sch_buses = np.full((self.steps_per_day, self.forecaster.buses.data.shape[1]), np.nan)
+            for feeder, columns in enumerate(self.bus_slices):
+                P_sch_buses[:, columns] = self.forecaster.disaggregate(P_sch24[:, feeder], columns)
+            self.P_sch_buses = P_sch_buses
+
+    def intraday_forecast(self, horizon):
+        '''updates the schedule of the next horizon steps with the latest history'''
+        self.schedule.set(self.forecaster.forecast(horizon))
+
+    def check_threshold(self, P_rt, P_buses=None):
+        '''compares P_rt (scalar or one per feeder) with the schedule of the step and stores it (and the power of the
+        buses) in the history'''
+        exceeded = self.exceeds_threshold(P_rt)
+        self.forecaster.observe(np.atleast_1d(P_rt), P_buses)
+        return exceeded
+
+    def exceeds_threshold(self, P_rt):
+        '''compares P_rt with the scheduled power of the step, the schedule moves to the next step
+        returns a bool for a scalar P_rt or the array of the feeders exceeding the threshold. A feeder without
+        schedule for the step is compliant'''
+        P_sch = self.schedule.pop()
+        delta = np.abs(P_sch - np.atleast_1d(P_rt))
+        exceeded = delta >= np.abs(self.TH * P_sch) # nan (no schedule) is compliant
+        if np.isnan(P_sch).all():
+            print('no schedule for the step')
+        elif exceeded.any():
+            print('threshold exceeded by %i of %i feeders' % (exceeded.sum(), len(exceeded)))
         else:
-            print('threshold exceeded')
-            self.P_sch24.pop(0)
-            return True
+            print('Threshold compliant!')
+        return exceeded if np.ndim(P_rt) else bool(exceeded[0])
+
+    def negotiate(self, feeder, P_sch, P_opf, P_previous, iteration, price):
+        '''one iteration of the negotiation of a feeder exceeding the threshold: the opf of the grid at price gave
+        P_opf. The negotiation converges when P_opf complies with the threshold on the schedule P_sch and stops when
+        the power of the feeder no longer moves (or did not converge) or after MAX_ITERATIONS
+        returns converged, stop and the price of the next opf'''
+        if np.isnan(P_opf):
+            return False, True, price
+        TH = np.broadcast_to(self.TH, (self.feeders,))[feeder]
+        if abs(P_sch - P_opf) < abs(TH * P_sch):
+            return True, True, price
+        if abs(P_opf - P_previous) < NEGOTIATION_TOL or iteration >= MAX_ITERATIONS:
+            return False, True, price
+        return False, False, price * PRICE_STEP
+
+    def required_flexibility(self, feeder, P_sch, P_rt):
+        '''change of the power of a feeder [MW] bringing P_rt back within the threshold on the schedule P_sch,
+        positive when the feeder draws too much'''
+        TH = np.broadcast_to(self.TH, (self.feeders,))[feeder]
+        band = abs(TH * P_sch)
+        excess = P_rt - P_sch
+        return float(np.sign(excess) * max(abs(excess) - band, 0.))
+
+    def dispatch(self, src_id, required, flexibility, participant_list, time, step):
+        '''demand response of the participants covering the required flexibility (see required_flexibility) without
+        running an opf: the elements of all the participants are allocated at once in merit order of their cost (see
+        dispatch.merit_order). flexibility is sent by the grid (see GridModule.pandapower.flexibility)
+        returns the setpoints of the participants, in the same form as prepare_res, and a summary of the dispatch'''
+        results = {src_id: {building: {'opf_results': {'load': None, 'sgen': None, 'storage': None}}
+                            for building in participant_list}}
+        selected = []
+        for type, (buildings, ids) in self._participant_elements(flexibility['name2index'], participant_list).items():
+            table = flexibility.get(type)
+            if table is None or not len(buildings):
+                continue
+            rows = table.index.get_indexer(ids)
+            selected.append((type, buildings, table.iloc[rows]))
+        if not selected:
+            return results, {'required': required, 'allocated': 0., 'shortfall': required, 'cost': 0.}
+
+        tables = [table for _, _, table in selected]
+        signs = np.concatenate([np.full(len(table), SIGNS[type]) for type, _, table in selected])
+        columns = {column: np.concatenate([table[column].values for table in tables])
+                   for column in ['p_mw', 'q_mvar', 'min_p_mw', 'max_p_mw', 'cost']}
+        setpoints, allocated, shortfall = merit_order(required, columns['p_mw'], columns['min_p_mw'],
+                                                      columns['max_p_mw'], columns['cost'], signs)
+
+        start = 0
+        for type, buildings, table in selected:
+            end = start + len(table)
+            for building, p, q in zip(buildings, setpoints[start:end].tolist(), columns['q_mvar'][start:end].tolist()):
+                results[src_id][building]['opf_results'][type] = {'p_mw': p, 'q_mvar': q}
+                results[src_id][building]['time'] = time + step
+            start = end
+        summary = {'required': required, 'allocated': float(allocated.sum()), 'shortfall': shortfall,
+                   'cost': float(np.nansum(np.abs(allocated) * columns['cost']))}
+        return results, summary
 
     def prepare_res(self,src_id,values,participant_list, time, step):
+        '''opf results of the elements of every participant, the elements are named <participant>_<type> by the grid
+        (see GridModule.pandapower.set_inputs_bulk) and matched exactly through an index built once (see
+        _participant_elements), the result tables are read as arrays once per element type'''
         results = {}
         results[src_id] = {}
         for building in participant_list:
@@ -39,15 +143,44 @@ class DsoModel(object):
                                                 {'load':None,
                                                 'sgen':None,
                                                 'storage':None}}
-            for el,id in values['name2index'].items():
-                if building in el:
-                    type = el.split('_')[-1]
-                    key = 'res_'+ type
-                    results[src_id][building]['opf_results']= {type:{'p_mw':values[key].loc[id,'p_mw'],
-                                                    'q_mvar':values[key].loc[id,'q_mvar']}}
-                    results[src_id][building]['time'] = time+step
-        return results
-
 
+        for type, (buildings, ids) in self._participant_elements(values['name2index'], participant_list).items():
+            table = values.get('res_' + type)
+            if table is None or not len(buildings):
+                continue
+            rows = table.index.get_indexer(ids)
+            p_mw = table['p_mw'].values[rows].tolist()
+            q_mvar = table['q_mvar'].values[rows].tolist()
+            for building, p, q in zip(buildings, p_mw, q_mvar):
+                results[src_id][building]['opf_results'][type] = {'p_mw': p, 'q_mvar': q}
+                results[src_id][building]['time'] = time+step
+        return results
 
+    def grid_participants(self, name2index):
+        '''participants owning elements of the grid (named <participant>_<type>, see
+        GridModule.pandapower.set_inputs_bulk), used when the buildings are connected to the grid only'''
+        if self._participants_key != len(name2index):
+            participants = {}
+            for name in name2index:
+                building, _, type = name.rpartition('_')
+                if building and type in ('load', 'sgen', 'storage'):
+                    participants[building] = None
+            self._participants_key = len(name2index)
+            self._participants = list(participants)
+        return self._participants
 
+    def _participant_elements(self, name2index, participant_list):
+        '''element type > (participants, element indices) of the elements of the participants, rebuilt only when
+        elements or participants are added'''
+        key = (len(name2index), tuple(participant_list))
+        if self._elements_key != key:
+            participants = set(participant_list)
+            elements = {'load': ([], []), 'sgen': ([], []), 'storage': ([], [])}
+            for name, id in name2index.items():
+                building, _, type = name.rpartition('_')
+                if building in participants and type in elements:
+                    elements[type][0].append(building)
+                    elements[type][1].append(id)
+            self._elements_key = key
+            self._elements = elements
+        return self._elements
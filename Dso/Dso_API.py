@@ -1,15 +1,26 @@
+import time as timer
 import mosaik_api
-from .DsoModel import DsoModel
+from .DsoModel import DsoModel, GRID_PRICE
 import numpy as np
 from config import *
 
 meta = {
-    'type': 'time-based',  # or hybrid...
+    'type': 'hybrid',  # stepped every step_size and, at the same time, by the opf results of the grids
     'models': {
         'Dso': {
             'public': True,
             'params': ['TH'],
-            'attrs': ['P_rt']
+            'attrs': ['P_rt',
+                      'flexibility',  # bounds and costs of the participants sent by the grids with P_rt
+                      'P_buses',  # power of the buses of the grids, with bus_forecast
+                      'P_sch_buses',  # day ahead schedule of the buses of the feeders (steps x buses), with bus_forecast
+                      'results',  # opf results of the grids (same time negotiation)
+                      'opf_request',  # {grid full id: {'price', 'iteration'}} opf asked to the grids
+                      'negotiation',  # report of the violations resolved at the step (dispatch or opf negotiation)
+                      'dr_setpoints',  # {participant: {'opf_results', 'time'}} demand response decided at the step
+                      ],
+            'trigger': ['P_rt', 'results'],
+            'persistent': ['negotiation', 'P_sch_buses'],  # the others are events, opf_request and dr_setpoints only when sent
         },
     },
 }
@@ -20,18 +31,41 @@ class DsoApi(mosaik_api.Simulator):
     def __init__(self):
         super().__init__(meta)
         self.step_size = None
-        self._entities = {}
+        self._entities = []
         self.res_cache = {}
         self.relations = []
         self.P_rt = []
         self.P_sch = []
         self.P_res = []
         self.sameTime = True
-        self.DR_list_participants = []
-
-    def init(self, sid, step_size, TH):
+        self.DR_list_participants = {} # dso eid > buildings related, from the relations at the first step
+        self.feeders = [] # (dso eid, grid full id) of the feeders supervised, one column of the model each
+        self.feeder_index = {} # (dso eid, grid full id) > column
+        self.exceeded = None # feeders exceeding the threshold at the last step
+        self.P_sch_step = None # schedule of the feeders at the current step
+        self.negotiations = {} # feeder > state of the open negotiations of the step
+        self.opf_requests = {} # dso eid > {grid full id: request} sent at the next get_data
+        self.negotiation_log = [] # one record per negotiation: time, feeder, iterations, wall time, converged
+        self.results = {}
+        self.setpoints = {} # dso eid > {participant: setpoints} of the step, sent at the next get_data
+        self.time = None
+        self.bus_slices = {} # feeder > slice of its buses in the powers of the buses of all the feeders
+
+    def init(self, sid, step_size, TH, dispatch='merit_order', intraday_horizon=0, bus_forecast=False):
+        '''dispatch is how the violations are resolved: 'merit_order' allocates the flexibility of the participants
+        directly (see DsoModel.dispatch), 'opf' negotiates an opf with the grid (see DsoModel.negotiate). Without
+        flexibility from the grid merit_order falls back to the opf
+        with intraday_horizon the schedule of the next intraday_horizon steps is forecast again at every step from
+        the latest P_rt (see DsoModel.intraday_forecast), with bus_forecast the history of the P_buses sent by the
+        grids is kept and the day ahead schedule is also disaggregated on the buses (P_sch_buses)'''
+        if dispatch not in ('merit_order', 'opf'):
+            raise ValueError('Unknown dispatch "%s"' % dispatch)
         self.step_size = step_size
-        self.model = DsoModel(TH)
+        self.TH = TH
+        self.dispatch = dispatch
+        self.intraday_horizon = intraday_horizon
+        self.bus_forecast = bus_forecast
+        self.model = None # created at the first step, once the feeders are known from the relations
         return self.meta
 
     def create(self, num, modelname):
@@ -40,98 +74,171 @@ class DsoApi(mosaik_api.Simulator):
             raise ValueError('Unknown model: "%s"' % modelname)
         # in case more than one dso must be created
         entities = []
-        for i in range(num):
+        for i in range(len(self._entities), len(self._entities) + num):
             eid = 'Dso_%d' % i
             entities.append({'eid': eid, 'type': modelname, 'rel': []})
-        self._entities = entities
+        self._entities.extend(entities)
         return entities
 
     def step(self, time, inputs, max_advance):
 
-        src_id = '%s.%s' % (self.mosaik.sim_id, self._entities[0]['eid'])
         if time == 0:
-            rel = yield self.mosaik.get_related_entities(src_id)
-            for dest in rel.keys():
-                edge = (src_id, dest)
-                if edge not in self.relations: self.relations.append(edge)
-
+            for entity in self._entities:
+                eid = entity['eid']
+                src_id = '%s.%s' % (self.mosaik.sim_id, eid)
+                rel = yield self.mosaik.get_related_entities(src_id)
+                for dest in rel.keys():
+                    edge = (src_id, dest)
+                    if edge not in self.relations: self.relations.append(edge)
+                    if dest.endswith('grid'):
+                        self.feeder_index[(eid, dest)] = len(self.feeders)
+                        self.feeders.append((eid, dest))
+                #the participants of the demand response do not change during the simulation
+                self.DR_list_participants[eid] = [dest for dest in rel.keys() if 'Building' in dest]
+            bus_width = 0
+            if self.bus_forecast: # the buses of each feeder, from the powers sent with the first P_rt
+                for feeder, (eid, grid) in enumerate(self.feeders):
+                    P_buses = inputs.get(eid, {}).get('P_buses', {}).get(grid)
+                    if not P_buses: # its buses could never be added to the history later
+                        raise ValueError('bus_forecast: no P_buses from the feeder %s of %s at time 0, connect its '
+                                         'P_buses to the dso' % (grid, eid))
+                    width = len(P_buses)
+                    self.bus_slices[feeder] = slice(bus_width, bus_width + width)
+                    bus_width += width
+            self.model = DsoModel(self.TH, self.step_size, bus_width=bus_width, feeders=max(len(self.feeders), 1),
+                                  bus_slices=[self.bus_slices[feeder] for feeder in range(len(self.feeders))]
+                                  if self.bus_slices else None)
+
+        first_call = time != self.time # the same time negotiation steps again at the same time
         self.time = time
-        #self.proceed = False
-
-        # if time % (SEC_IN_DAY) == 0:
-        #     #TODO FORECAST
-        #     self.model.power_forecast()
-        #     self.P_sch.extend(self.model.P_sch24)
-
-        # # reading inputs
-        # if self.sameTime:
-        #      # calculate the forecast
-        #         #self.P_sch.extend(self.model.P_sch24) this is correct commented only when testing
-        #     print('Dso receive P_rt value at time %s \n ' %self.time)
-        #     for eid, attrs in inputs.items():
-        #         for name, values in attrs.items():
-        #             if name == 'P_rt':
-        #                 p_rt = list(attrs[name].values())[0] # todo must be generalised in case of more than one grid
-        #                 self.P_rt.append(p_rt)
-        #                 #checking the threshold
-        #                 self.proceed = self.model.check_threshold(p_rt)
-
-        #                 #only for testing must be deleted***********
-        #                 self.P_sch.append(self.model.P_fake[0])
-        #                 self.model.P_fake.pop(0)
-        #                 #****************
-
-        # else:
-        #     print('Dso received OPF results at time %s\n' %self.time)
-        #     #todo avoid the cycle keeping it generalised
-        #     #TODO prepare the results from grid in dict by buildings/aggregators to be spread back
-
-        #     for eid, attrs in inputs.items():
-        #         for name, values in attrs.items():
-        #             if name=='results':
-        #                 pre_results = list(values.values())[0]
-        #                 #self.P_res.append(attrs[name]['Grid-0.0-grid'])
-
-        #     self.DR_list_participants = [building[1] for building in self.relations if 'Building' in building[1]]
-        #     self.results = self.model.prepare_res(src_id,pre_results,self.DR_list_participants, time,self.step_size)
-        #     #results = {aid: {self.uids[aid][1]: dictionary}  # todo check well self.uid
-        #     #          for aid, dictionary in builds_state.items()}
-        #     #yield self.mosaik.set_data(results)
-
-            #print('============TS END==============\n')
 
-        return self.time + self.step_size
-
-    # def get_data(self, outputs):
-    #     data = {}
-    #     if self.sameTime:  # se siamo al primo scambio passiamo proceed
-    #         for eid, attrs in outputs.items():
-    #             data[eid] = {}
-    #             for attr in attrs:
-    #                 if attr not in self.meta['models']['Dso']['attrs']: #todo this check as in all others API could be useless
-    #                     raise ValueError('Unknown output attribute "%s"' % attr)
-    #                 if attr == 'proceed':
-    #                     data[eid][attr] = self.proceed
-    #                 else:
-    #                     data[eid][attr] = None
-    #         self.sameTime = False
-    #         return data
-    #     else:
-    #         self.sameTime = True
-    #         for eid, attrs in outputs.items():
-    #             data[eid]={}
-    #             for attr in attrs:
-    #                 if attr == 'aggr_msg':
-    #                     data[eid][attr] = 'dict with all the info per aggr and components'
-    #                 elif attr == 'proceed':
-    #                     data[eid][attr] = False
-    #                 elif attr == 'opf_results':
-    #                     data[eid][attr] = self.results
-
-
-    #             data['time'] = self.time + self.step_size
-    #             #yield self.mosaik.set_data(results)
-
-    #         return data
+        if first_call and time % (SEC_IN_DAY) == 0:
+            self.model.power_forecast()
+
+        # reading inputs, the P_rt of all the feeders are checked at once
+        P_rt = np.full(self.model.feeders, np.nan)
+        for eid, attrs in inputs.items():
+            for src, value in attrs.get('P_rt', {}).items():
+                if (eid, src) in self.feeder_index:
+                    P_rt[self.feeder_index[(eid, src)]] = value
+        if self.feeders and any('P_rt' in attrs for attrs in inputs.values()):
+            print('Dso receive P_rt value at time %s \n ' %self.time)
+            self.P_rt.append(P_rt)
+            self.P_sch_step = self.model.schedule.current().copy()
+            self.P_sch.append(self.P_sch_step)
+            self.exceeded = self.model.check_threshold(P_rt, self._bus_powers(inputs))
+            if self.intraday_horizon:
+                self.model.intraday_forecast(self.intraday_horizon)
+            for feeder, ((eid, grid), exceeded) in enumerate(zip(self.feeders, self.exceeded)):
+                flexibility = inputs.get(eid, {}).get('flexibility', {}).get(grid)
+                if exceeded and self.dispatch == 'merit_order' and flexibility is not None:
+                    exceeded = not self._dispatch(feeder, P_rt[feeder], flexibility)
+                if exceeded: # only the violating feeders not solved by the dispatch run an opf
+                    self.negotiations[feeder] = {'iteration': 0, 'price': GRID_PRICE, 'P': P_rt[feeder],
+                                                 'start': timer.perf_counter()}
+                    self._request_opf(feeder)
+
+        # same time negotiation: opf results of the grids asked at the previous iteration
+        for eid, attrs in inputs.items():
+            for grid, values in attrs.get('results', {}).items():
+                feeder = self.feeder_index.get((eid, grid))
+                if feeder is None or feeder not in self.negotiations or values is None:
+                    continue
+                state = self.negotiations[feeder]
+                P_opf = values['P_opf'] if values.get('converged') else np.nan
+                converged, stop, price = self.model.negotiate(feeder, self.P_sch_step[feeder], P_opf, state['P'],
+                                                              state['iteration'], state['price'])
+                state['P'] = P_opf
+                if values.get('converged'): # a failed opf leaves nan results, the last converged one is kept
+                    state['values'] = values
+                if not stop:
+                    state['price'] = price
+                    self._request_opf(feeder)
+                    continue
+                del self.negotiations[feeder]
+                record = {'time': self.time, 'feeder': grid, 'method': 'opf', 'iterations': state['iteration'],
+                          'wall_time': timer.perf_counter() - state['start'], 'converged': converged, 'P_opf': P_opf}
+                self.negotiation_log.append(record)
+                print('Dso negotiation of %s at time %s: %s after %i opf in %.3f s' % (
+                    grid, self.time, 'converged' if converged else 'stopped', record['iterations'],
+                    record['wall_time']))
+                if 'values' in state:
+                    src_id = '%s.%s' % (self.mosaik.sim_id, eid)
+                    participants = self._participants(eid, state['values']['name2index'])
+                    self._send_setpoints(eid, self.model.prepare_res(src_id, state['values'], participants, time,
+                                                                     self.step_size))
 
+        return self.time + self.step_size
 
+    def _bus_powers(self, inputs):
+        '''powers of the buses of all the feeders in one array (nan for the feeders not received), None without
+        bus_forecast'''
+        if self.model.forecaster.buses is None:
+            return None
+        P_buses = np.full(self.model.forecaster.buses.data.shape[1], np.nan)
+        for feeder, (eid, grid) in enumerate(self.feeders):
+            values = inputs.get(eid, {}).get('P_buses', {}).get(grid)
+            if values is not None:
+                P_buses[self.bus_slices[feeder]] = values
+        return P_buses
+
+    def _participants(self, eid, name2index):
+        '''participants of the demand response of a dso entity: the buildings related to it or, when the buildings
+        are connected to the grid only, the owners of the elements of the grid'''
+        return self.DR_list_participants[eid] or self.model.grid_participants(name2index)
+
+    def _send_setpoints(self, eid, results):
+        self.results.update(results)
+        for participants in results.values():
+            self.setpoints.setdefault(eid, {}).update(participants)
+
+    def _dispatch(self, feeder, P_rt, flexibility):
+        '''merit order demand response of the participants of a feeder, resolved within the step. Returns False when
+        the participants cannot cover the violation, which is then left to the opf negotiation'''
+        eid, grid = self.feeders[feeder]
+        start = timer.perf_counter()
+        required = self.model.required_flexibility(feeder, self.P_sch_step[feeder], P_rt)
+        src_id = '%s.%s' % (self.mosaik.sim_id, eid)
+        results, summary = self.model.dispatch(src_id, required, flexibility,
+                                               self._participants(eid, flexibility['name2index']),
+                                               self.time, self.step_size)
+        covered = abs(summary['shortfall']) < 1e-9 and summary['allocated'] != 0
+        if covered:
+            self._send_setpoints(eid, results)
+        record = {'time': self.time, 'feeder': grid, 'method': 'merit_order', 'iterations': 0,
+                  'wall_time': timer.perf_counter() - start, 'converged': covered}
+        record.update(summary)
+        self.negotiation_log.append(record)
+        print('Dso dispatch of %s at time %s: %.3f of %.3f MW allocated in %.4f s%s' % (
+            grid, self.time, summary['allocated'], required, record['wall_time'],
+            '' if covered else ', falling back to the opf'))
+        return covered
+
+    def _request_opf(self, feeder):
+        eid, grid = self.feeders[feeder]
+        state = self.negotiations[feeder]
+        state['iteration'] += 1
+        self.opf_requests.setdefault(eid, {})[grid] = {'price': state['price'], 'iteration': state['iteration']}
+
+    def get_data(self, outputs):
+        '''the opf requests are sent only when there are some (non-persistent), which triggers the grids again at the
+        same time'''
+        data = {}
+        for eid, attrs in outputs.items():
+            data[eid] = {}
+            for attr in attrs:
+                if attr not in self.meta['models']['Dso']['attrs']:
+                    raise ValueError('Unknown output attribute "%s"' % attr)
+                if attr == 'opf_request':
+                    if eid in self.opf_requests:
+                        data[eid][attr] = self.opf_requests.pop(eid)
+                elif attr == 'P_sch_buses':
+                    P_sch_buses = self.model.P_sch_buses if self.model is not None else None
+                    data[eid][attr] = P_sch_buses.tolist() if P_sch_buses is not None else None
+                elif attr == 'dr_setpoints':
+                    if eid in self.setpoints:
+                        data[eid][attr] = self.setpoints.pop(eid)
+                elif attr == 'negotiation':
+                    data[eid][attr] = [record for record in self.negotiation_log if record['time'] == self.time
+                                       and (eid, record['feeder']) in self.feeder_index]
+        return data
@@ -0,0 +1,39 @@
+import numpy as np
+
+
+# direction of the power of each element type on the power drawn by the feeder: consuming more increases it,
+# generating more decreases it
+SIGNS = {'load': 1, 'storage': 1, 'sgen': -1}
+
+
+def merit_order(required, p_mw, min_p_mw, max_p_mw, cost, sign=1):
+    '''
+    allocation of the flexibility required to the feeder [MW] among the elements of the participants, cheapest first
+
+    every element can move its power between min_p_mw and max_p_mw, with sign it changes the power of the feeder in
+    the same (1, consumers) or in the opposite (-1, generators) direction. A positive required lowers the power of
+    the feeder, a negative one raises it. The elements are sorted once by cost and each one gives all its capacity
+    until the required flexibility is covered, O(n log n) in the elements and vectorized
+
+    returns the new p_mw of the elements, the flexibility allocated to each one (in the feeder direction) and the
+    shortfall not covered by the participants
+    '''
+    p_mw = np.asarray(p_mw, dtype=float)
+    sign = np.broadcast_to(np.asarray(sign, dtype=float), p_mw.shape)
+    # capacity of each element in the direction required, missing bounds give none
+    if required >= 0:
+        capacity = np.where(sign > 0, p_mw - np.asarray(min_p_mw, dtype=float),
+                            np.asarray(max_p_mw, dtype=float) - p_mw)
+    else:
+        capacity = np.where(sign > 0, np.asarray(max_p_mw, dtype=float) - p_mw,
+                            p_mw - np.asarray(min_p_mw, dtype=float))
+    capacity = np.clip(np.nan_to_num(capacity), 0, None)
+
+    order = np.argsort(np.nan_to_num(np.asarray(cost, dtype=float), nan=np.inf), kind='stable')
+    before = np.cumsum(capacity[order]) - capacity[order] # capacity of the cheaper elements
+    allocated = np.empty_like(capacity)
+    allocated[order] = np.clip(abs(required) - before, 0, capacity[order])
+    direction = 1 if required >= 0 else -1
+    setpoints = p_mw - direction * sign * allocated
+    shortfall = abs(required) - allocated.sum()
+    return setpoints, direction * allocated, direction * max(float(shortfall), 0.)
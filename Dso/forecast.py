@@ -0,0 +1,115 @@
+import numpy as np
+
+
+METHODS = ('persistence', 'seasonal_naive', 'exp_smoothing')
+
+
+class RingBuffer(object):
+    '''fixed size history of vectors (e.g. P_rt or the power of every bus), appending is O(1)'''
+
+    def __init__(self, capacity, width=1):
+        self.capacity = capacity
+        self.data = np.full((capacity, width), np.nan)
+        self.cursor = 0 # next row written
+        self.count = 0 # values appended so far
+
+    def append(self, values):
+        self.data[self.cursor] = values
+        self.cursor = (self.cursor + 1) % self.capacity
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def last(self, n):
+        '''the last n values, oldest first (n, width)'''
+        n = min(n, len(self))
+        return self.data[(self.cursor - n + np.arange(n)) % self.capacity]
+
+    def lag(self, lag, horizon):
+        '''values from lag steps back onwards for horizon steps, wrapping on the lag window (horizon, width)'''
+        return self.data[(self.cursor - lag + np.arange(horizon) % lag) % self.capacity]
+
+
+class Schedule(object):
+    '''scheduled power of the next steps of one or more feeders in a fixed size array (steps, width), moving to the
+    next step is O(1)'''
+
+    def __init__(self, size, width=1):
+        self.size = size
+        self.values = np.full((size, width), np.nan)
+        self.cursor = 0 # current step
+
+    def set(self, values, offset=0):
+        '''writes the schedule (steps,) or (steps, width) of the steps from the current one + offset, at most size
+        steps'''
+        values = np.asarray(values, dtype=float).reshape(-1, self.values.shape[1])[:self.size]
+        self.values[(self.cursor + offset + np.arange(len(values))) % self.size] = values
+
+    def current(self):
+        return self.values[self.cursor]
+
+    def pop(self):
+        '''scheduled power of the current step (width,), the schedule moves to the next one'''
+        value = self.values[self.cursor].copy()
+        self.values[self.cursor] = np.nan # consumed, rewritten by the next forecast
+        self.cursor = (self.cursor + 1) % self.size
+        return value
+
+    def next(self, n):
+        return self.values[(self.cursor + np.arange(n)) % self.size]
+
+
+class Forecaster(object):
+    '''
+    rolling forecast of a power series from its own history: every step observe stores the measured values (one or
+    more series, e.g. P_rt or the power of every bus) and forecast returns the next horizon steps, vectorized over
+    the series
+
+        persistence      the last value
+        seasonal_naive   the values of one day before (persistence until a day of history is available)
+        exp_smoothing    per step of the day, exponential smoothing with factor alpha of the values of the past days
+
+    with bus_width the forecaster also keeps the history of the buses and disaggregate splits a forecast of the total
+    on the buses with their shares over the last day
+    '''
+
+    def __init__(self, steps_per_day, method='seasonal_naive', history_days=7, alpha=0.3, width=1, bus_width=0):
+        if method not in METHODS:
+            raise ValueError('Unknown forecast method "%s"' % method)
+        self.steps_per_day = steps_per_day
+        self.method = method
+        self.alpha = alpha
+        self.history = RingBuffer(history_days * steps_per_day, width)
+        self.level = np.full((steps_per_day, width), np.nan) # smoothed value of each step of the day
+        self.buses = RingBuffer(steps_per_day, bus_width) if bus_width else None
+
+    def observe(self, values, buses=None):
+        '''stores the values measured at the current step (and of the buses with bus_width)'''
+        values = np.asarray(values, dtype=float)
+        slot = self.history.count % self.steps_per_day
+        level = self.level[slot]
+        self.level[slot] = np.where(np.isnan(level), values, self.alpha * values + (1 - self.alpha) * level)
+        self.history.append(values)
+        if self.buses is not None and buses is not None:
+            self.buses.append(buses)
+
+    def forecast(self, horizon):
+        '''forecast of the next horizon steps (horizon, width), nan without history'''
+        history = self.history
+        if not len(history):
+            return np.full((horizon, history.data.shape[1]), np.nan)
+        if self.method == 'seasonal_naive' and len(history) >= self.steps_per_day:
+            return history.lag(self.steps_per_day, horizon)
+        if self.method == 'exp_smoothing':
+            forecast = self.level[(history.count + np.arange(horizon)) % self.steps_per_day]
+            return np.where(np.isnan(forecast), history.last(1), forecast) # steps of the day not observed yet
+        return np.repeat(history.last(1), horizon, axis=0)
+
+    def disaggregate(self, total, columns=slice(None)):
+        '''splits a forecast of the total (horizon,) on the buses (horizon, buses) with their shares over the last
+        day of history, columns selects the buses of the total (e.g. the ones of a feeder)'''
+        buses = self.buses.last(self.steps_per_day)[:, columns]
+        sums = buses.sum(axis=0)
+        shares = sums / sums.sum() if sums.sum() else np.full(len(sums), 1. / len(sums))
+        return np.asarray(total, dtype=float)[:, None] * shares[None, :]
@@ -0,0 +1,130 @@
+import copy
+import multiprocessing
+import numpy as np
+import pandas as pd
+from .DsoModel import DsoModel
+
+
+# step of the replayed profiles [s]
+SWEEP_STEP = 60 * 60
+# price of the grid in the opf triggered by a threshold violation, the one set by the Grid model at each step
+GRID_PRICE = 2
+
+
+def run_sweep(grid, profiles, variants, processes=None, hours=None):
+    '''
+    Sensitivity sweep of the DSO threshold study: every variant replays the hours of the profiles on its own copy of
+    the grid, checks the DSO threshold at each hour against the schedule forecast by the DSO from the replayed history
+    (DsoModel.power_forecast every day, so the first day has no schedule) and runs the opf when it is exceeded,
+    without starting a mosaik world. The variants run in parallel worker processes that share the pre-loaded grid
+    and profiles (inherited from the parent with fork, sent once per worker otherwise).
+
+    a variant is a dict with the keys
+        TH      threshold of the DSO (see DsoModel)
+        price   price of the grid in the opf (default GRID_PRICE)
+        method  forecast method of the DSO (see forecast.METHODS, default 'seasonal_naive')
+        noise   std of a relative perturbation of the forecast schedule (default 0)
+        bias    relative bias added to the forecast schedule (default 0)
+        seed    seed of the perturbation (default the index of the variant)
+
+    :param grid: pre-loaded grid model
+    :type grid: Grid.GridModule.pandapower
+    :param profiles: {(element type, column): DataFrame (hours x element indices)}, see building_load_profiles
+    :param variants: list of variants
+    :param processes: worker processes, None uses all the cores, 1 runs in process
+    :param hours: number of hours replayed, all the hours of the profiles by default
+    :return: one row per variant and hour with the variant, P_rt, P_sch, exceeded, P_opf and opf_cost
+    :rtype: pd.DataFrame
+    '''
+    tasks = list(enumerate(variants))
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(tasks))
+
+    _sweep_state.update(grid=grid, profiles=profiles, hours=hours)
+    try:
+        if processes > 1:
+            if 'fork' in multiprocessing.get_all_start_methods():
+                #the workers inherit the scenario from the parent instead of unpickling a copy each
+                pool = multiprocessing.get_context('fork').Pool(processes)
+            else:
+                pool = multiprocessing.Pool(processes, _init_sweep_worker, (grid, profiles, hours))
+            try:
+                results = pool.map(_sweep_worker, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [_sweep_worker(task) for task in tasks]
+    finally:
+        _sweep_state.clear()
+
+    return pd.DataFrame([row for rows in results for row in rows])
+
+
+def run_variant(grid, profiles, variant, hours=None, seed=0):
+    '''replays the profiles on a copy of the grid for one variant, returns the rows of the sweep table'''
+    model = copy.deepcopy(grid)
+    dso = DsoModel(variant['TH'], SWEEP_STEP, variant.get('method', 'seasonal_naive'))
+    price = variant.get('price', GRID_PRICE)
+    noise = variant.get('noise', 0.)
+    bias = variant.get('bias', 0.)
+    rng = np.random.default_rng(variant.get('seed', seed))
+    if hours is None:
+        hours = min(len(values) for values in profiles.values())
+
+    rows = []
+    for hour in range(hours):
+        for (type, column), values in profiles.items():
+            model.net[type].loc[values.columns, column] = values.iloc[hour].values
+        row = dict(variant, hour=hour, P_rt=np.nan, P_sch=np.nan, exceeded=False, P_opf=np.nan, opf_cost=np.nan)
+        rows.append(row)
+        if hour % dso.steps_per_day == 0:
+            dso.power_forecast()
+        # the forecast schedule of the hour, perturbed
+        row['P_sch'] = dso.schedule.current()[0] * (1 + bias + noise * rng.standard_normal())
+        dso.schedule.set([row['P_sch']])
+        try:
+            model.powerflow()
+        except Exception:
+            dso.check_threshold(np.nan) # the schedule and the history still move to the next hour
+            continue # not converged, the hour is reported with nan
+        row['P_rt'] = P_rt = model.net.res_ext_grid['p_mw'].values[0]
+        row['exceeded'] = dso.check_threshold(P_rt)
+        if row['exceeded']:
+            model.set_grid_price(price)
+            try:
+                model.optimalpowerflow()
+            except Exception:
+                continue
+            row['P_opf'] = model.net.res_ext_grid['p_mw'].values[0]
+            row['opf_cost'] = model.net.res_cost
+    return rows
+
+
+def building_load_profiles(scenario, loads, key='E_sys'):
+    '''
+    load profiles of the sweep from the reference annual run of the building scenario
+
+    :param scenario: the initialized building scenario
+    :type scenario: building_model.initialize.Initialize
+    :param loads: {building name: index of its load in the grid}
+    :param key: time step data of the active power of the buildings [W]
+    :return: {('load', 'p_mw'): DataFrame (hours x load indices)}
+    '''
+    data = {idx: np.asarray(scenario.tsd_ref_log[name][key]) * 1e-6 for name, idx in loads.items()}
+    return {('load', 'p_mw'): pd.DataFrame(data)}
+
+
+#state of the sweep workers: set in the parent before forking or by _init_sweep_worker
+_sweep_state = {}
+
+def _init_sweep_worker(grid, profiles, hours):
+    _sweep_state.update(grid=grid, profiles=profiles, hours=hours)
+
+def _sweep_worker(task):
+    index, variant = task
+    rows = run_variant(_sweep_state['grid'], _sweep_state['profiles'], variant, _sweep_state['hours'], seed=index)
+    for row in rows:
+        row['variant'] = index
+    return rows
@@ -4,6 +4,8 @@ import pandas as pd
 import json
 import math
 import os.path
+import pickle
+import hashlib
 from pandapower.timeseries import DFData
 from pandapower.timeseries import OutputWriter
 from pandapower.control import ConstControl
@@ -13,6 +15,67 @@ import pandapower.networks as ppn
 #import simbench as sb
 import numpy as np
 import math
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from pandapower.run import _internal_stored
+from pandapower.results import reset_results
+from pandapower.pypower.dSbus_dV import dSbus_dV
+from pandapower.pypower.idx_bus import BUS_TYPE, NONE
+
+
+# power flow structures reused by the warm started power flow: only the PQ injections of the buses are updated,
+# the trafo parameters and the gen table are kept (see pandapower.runpp recycle)
+PF_RECYCLE = dict(bus_pq=True, trafo=False, gen=False)
+# retries of a step power flow that did not converge (see pandapower.solve_powerflow): relaxed tolerance, flat start,
+# then another algorithm. The iterations are capped so a pathological step costs a bounded time
+PF_RETRIES = [
+    ('relaxed', dict(tolerance_mva=1e-5, max_iteration=20)),
+    ('flat_start', dict(init='flat', tolerance_mva=1e-5, max_iteration=20)),
+    ('fast_decoupled', dict(algorithm='fdbx', init='flat', tolerance_mva=1e-5, max_iteration=30)),
+]
+
+# fast (linearized) power flow, see pandapower.fast_powerflow: voltage limits used when the buses have none (the +-10%
+# band of the distribution grids, the cigre mv grid runs below 0.95 in the base case), margin to the limits under
+# which the estimate escalates to an AC power flow and largest change of the injections (relative to the ones of the
+# linearization point) served by the estimate. The defaults of each grid, see the fast_pf params of the Grid
+FAST_PF_VM_LIMITS = (0.9, 1.1)
+FAST_PF_MARGIN = 0.02
+FAST_PF_MAX_CHANGE = 0.1
+
+# element and result table of each entity type (see ResultSnapshot)
+ENTITY_TABLES = {
+    'Bus': ('bus', 'res_bus'),
+    'Load': ('load', 'res_load'),
+    'Sgen': ('sgen', 'res_sgen'),
+    'Transformer': ('trafo', 'res_trafo'),
+    'Line': ('line', 'res_line'),
+    'Ext_grid': ('ext_grid', 'res_ext_grid'),
+}
+
+# results cached for each entity type by get_cache_entries
+RESULT_ATTRS = {
+    'Bus': ['p_mw', 'q_mvar', 'vm_pu', 'va_degree'],
+    'Load': ['p_mw', 'q_mvar'],
+    'Sgen': ['p_mw', 'q_mvar'],
+    'Transformer': ['va_lv_degree', 'loading_percent'],
+    'Line': ['i_ka', 'loading_percent'],
+    'Ext_grid': ['p_mw', 'q_mvar'],
+}
+
+# results logged by the output writer of the time series (see create_output_writer and pandapower.run_batch)
+OUTPUT_VARIABLES = [
+    ('res_load', 'p_mw'), ('res_load', 'q_mvar'),
+    ('res_bus', 'vm_pu'), ('res_bus', 'q_mvar'), ('res_bus', 'va_degree'), ('res_bus', 'p_mw'),
+    ('res_line', 'loading_percent'), ('res_line', 'i_ka'),
+    ('res_trafo', 'va_lv_degree'), ('res_trafo', 'loading_percent'),
+    ('res_sgen', 'p_mw'), ('res_sgen', 'q_mvar'),
+]
+
+# attributes of the model stored by the case cache (see pandapower.load_case), bump the version when they change
+CASE_ATTRS = ('net', 'bus_id', 'load_id', 'sgen_id', 'line_id', 'trafo_id', 'switch_id', 'slack_bus_idx', 'slack_eid',
+              'entity_map')
+CASE_CACHE_VERSION = 1
 
 
 #CLASS MODEL IN PANDAPOWER FOR GRID ACTIONS AND ANALYSIS
@@ -25,65 +88,69 @@ class pandapower(object):
         self.entity_map={}
         self.Sch_24 = None
         self.name2index = {}
-
-
-
-    def load_case(self,path,grid_idx):
+        self.element_index = {'load': {}, 'sgen': {}, 'storage': {}} # element type > name > pandapower index
+        self.cost_index = {} # (element type, element index) > poly_cost row
+        self.warm_start = True # warm started power flow, see powerflow
+        self._pf_signature = None
+        self._pf_signature_last = None
+        self.result_index = {} # entity type > (eids, result table rows), see _index_results
+        self._results_snapshot = None
+        self.slack_eid = None # entity of the external grid
+        self.result_cache = None # optional ResultCache of the (optimal) power flows, see enable_result_cache
+        self.fast_pf = False # step power flows with fast_powerflow, see run_powerflow
+        self._sensitivities = None # linearization of fast_powerflow
+        self.fast_pf_vm_limits = FAST_PF_VM_LIMITS
+        self.fast_pf_margin = FAST_PF_MARGIN
+        self.fast_pf_max_change = FAST_PF_MAX_CHANGE
+        self.pf_status = None # status record of the last step power flow, see solve_powerflow
+
+
+
+    def load_case(self, path, grid_idx, cache_dir=None):
         """
         Loads a pandapower network, the network should be ready in a separate json or excel file or as stated above
+        with cache_dir the loaded net and its entities are stored on disk (see case_cache_path) and the following
+        loads of the same grid are read from there
         TODO: pypower converter and network building with only parameter as input
         """
-        #TO DO aggiungere il load da matlab con ,a conversione in pandapower net
-        loaders = {
-          '.json': 1,
-          '.xlsx': 2,
-          '': 3
-          }
-        try:
-           ext = os.path.splitext(path)[-1]
-           loader = loaders[ext]
-        except KeyError:
-            raise ValueError("Don't know how to open '%s'" % path)
-
-        if loader == 1:
-            self.net = pp.from_json(path)
-        elif loader == 2:
-            self.net = pp.from_excel(path)
+        cache_path = case_cache_path(cache_dir, path, grid_idx) if cache_dir else None
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, 'rb') as f:
+                case = pickle.load(f)
+            for attr in CASE_ATTRS:
+                setattr(self, attr, case[attr])
         else:
-            if path == 'cigre_hv':
-                self.net = ppn.create_cigre_network_hv()
-            elif path == 'cigre_mv_all':
-                self.net = ppn.create_cigre_network_mv(with_der='all')
-            elif path == 'cigre_mv_pv_wind':
-                self.net = ppn.create_cigre_network_mv(with_der='pv_wind')
-            elif path == 'cigre_lv':
-                self.net = ppn.create_cigre_network_lv()
-            elif path == 'test_pp':
-                self.net =  ppn.simple_four_bus_system()
-        self.bus_id = self.net.bus.name.to_dict()
-
-        #create virtual loads and gens on each bus ready to be plugged in WHYYYYY?
-        #for i in self.bus_id:
-        # if self.net.ext_grid.bus[0] != i:
-         #   pp.create_load(self.net, i, p_mw=0, name=('ext_load_%s' % i))
-          #  pp.create_sgen(self.net, i, p_mw=0, name=('ext_gen_%s' % i))
-
-        #create elements indices, to create entities
-        self.load_id = self.net.load.name.to_dict()
-        self.sgen_id = self.net.sgen.name.to_dict()
-        self.line_id = self.net.line.name.to_dict()
-        self.trafo_id = self.net.trafo.name.to_dict()
-        self.switch_id = self.net.switch.name.to_dict()
-        #todo add storage
-
-        #load the entity map
-        self._get_slack(grid_idx)
-        self._get_buses(grid_idx)
-        self._get_lines(grid_idx)
-        self._get_trafos(grid_idx)
-        self._get_loads(grid_idx)
-        self._get_sgen(grid_idx)
-        # todo add storage + create the _get_storage function
+            self.net = read_case(path)
+            self.bus_id = self.net.bus.name.to_dict()
+
+            #create elements indices, to create entities
+            self.load_id = self.net.load.name.to_dict()
+            self.sgen_id = self.net.sgen.name.to_dict()
+            self.line_id = self.net.line.name.to_dict()
+            self.trafo_id = self.net.trafo.name.to_dict()
+            self.switch_id = self.net.switch.name.to_dict()
+            #todo add storage
+
+            #load the entity map
+            self._get_slack(grid_idx)
+            self._get_buses(grid_idx)
+            self._get_lines(grid_idx)
+            self._get_trafos(grid_idx)
+            self._get_loads(grid_idx)
+            self._get_sgen(grid_idx)
+            # todo add storage + create the _get_storage function
+
+            if cache_path:
+                os.makedirs(cache_dir, exist_ok=True)
+                with open(cache_path + '.tmp', 'wb') as f:
+                    pickle.dump({attr: getattr(self, attr) for attr in CASE_ATTRS}, f, pickle.HIGHEST_PROTOCOL)
+                os.replace(cache_path + '.tmp', cache_path)
+
+        for type in self.element_index:
+            self.element_index[type] = {name: idx for idx, name in self.net[type].name.items()}
+        self.cost_index = {(et, element): row for row, et, element in
+                           zip(self.net.poly_cost.index, self.net.poly_cost.et, self.net.poly_cost.element)}
+        self._index_results()
 
         entity_map = self.entity_map
         ppc = self.net #pandapower case
@@ -106,6 +173,7 @@ class pandapower(object):
                            'va_degree': self.net.ext_grid['va_degree']
                 }
         }
+        self.slack_eid = eid
         slack = (0, self.slack_bus_idx)
 
         return slack
@@ -114,24 +182,19 @@ class pandapower(object):
 
     def _get_buses(self,grid_idx):
         """Create entities of the buses"""
+        table = self.net.bus
         buses = []
 
-        for idx in self.bus_id:
-         if self.slack_bus_idx != idx:
-            element = self.net.bus.iloc[idx]
-            bid = element['name']
-            eid = make_eid(bid, grid_idx)
-            buses.append((idx, element['vn_kv']))
-            #etype = bid
-            self.entity_map[eid] = {
-                'etype': 'Bus',
-                'idx': idx,
-                'static': {
-                    'vn_kv':  element['vn_kv']
-                },
-            }
-         else:
-             pass
+        for idx, bid, vn_kv in zip(table.index, table['name'], table['vn_kv']):
+            if self.slack_bus_idx != idx:
+                buses.append((idx, vn_kv))
+                self.entity_map[make_eid(bid, grid_idx)] = {
+                    'etype': 'Bus',
+                    'idx': idx,
+                    'static': {
+                        'vn_kv': vn_kv
+                    },
+                }
 
         return buses
 
@@ -139,158 +202,87 @@ class pandapower(object):
 
     def _get_loads(self, grid_idx):
         """Create load entities"""
-        loads = []
-
-        for idx in self.load_id:
-                element = self.net.load.iloc[idx]
-                eid = make_eid(element['name'], grid_idx)
-                bid = make_eid(self.bus_id[element['bus']], grid_idx)
-
-                element_data = element.to_dict()
-                element_data_static = {key:element_data[key] for key in element_data}
-                #keys_to_del = ['name', 'const_z_percent', 'const_i_percent', 'min_q_mvar', 'min_p_mw', 'max_q_mvar'
-                #   , 'max_p_mw']
-                #element_data_static = {key: element_data[key] for key in element_data if key not in keys_to_del}
-
-                # time series calculation
-                # if 'profile' in element_data_static:
-                #     if type (element_data_static ['profile']) != float:
-                #        profile_name = element_data_static['profile']
-                #
-                #        datasource = pd.DataFrame()
-                #        datasource[profile_name+'_pload'] = self.net.profiles['load'][profile_name+'_pload']*element['p_mw']
-                #        datasource[profile_name +'_qload'] = self.net.profiles['load'][profile_name+'_qload']* element['q_mvar']
-                #
-                #        ds = DFData(datasource)
-                #
-                #        ConstControl(self.net, element='load', variable='p_mw', element_index=idx,
-                #                  data_source=ds, profile_name=profile_name+'_pload')
-                #
-                #        ConstControl(self.net, element='load', variable='q_mvar', element_index=idx,
-                #                  data_source=ds, profile_name=profile_name+'_qload')
-                #     else:
-                #         pass
-                # else:
-                #     pass
-
-                self.entity_map[eid] = {'etype': 'Load', 'idx': idx, 'static': element_data_static
-                    , 'related': [bid]}
-
-                loads.append((bid, element['p_mw'], element['q_mvar'], element['scaling']
-                              , element['in_service']))
-
-        return loads
+        # the time series of the loads are run by run_batch
+        return self._get_injections('load', 'Load', grid_idx)
 
 
 
     def _get_sgen(self, grid_idx):
         """Create static generator entities"""
-        sgens = []
-
-        for idx in self.sgen_id:
-             element = self.net.sgen.iloc[idx]
-             eid = make_eid(element['name'], grid_idx)
-             bid = make_eid(self.bus_id[element['bus']], grid_idx)
-
-
-             element_data = element.to_dict()
-             element_data_static = {key: element_data[key] for key in element_data}
-
-             #keys_to_del = ['name', 'min_q_mvar', 'min_p_mw', 'max_q_mvar', 'max_p_mw']
-             #element_data_static = {key: element_data[key] for key in element_data if key not in keys_to_del}
-
+        return self._get_injections('sgen', 'Sgen', grid_idx)
 
-             # time series calculation
-             # if 'profile' in element_data_static:
-             #     if type(element_data_static['profile']) != float:
-             #         profile_name = element_data_static['profile']
-             #
-             #         datasource = pd.DataFrame()
-             #         datasource[profile_name ] = self.net.profiles['renewables'][profile_name ] * element['p_mw']
-             #
-             #         ds = DFData(datasource)
-             #
-             #         ConstControl(self.net, element='sgen', variable='p_mw', element_index=idx
-             #                      , data_source=ds, profile_name=profile_name )
-             #     else:
-             #       pass
-             # else:
-             #     pass
 
 
-             self.entity_map[eid] = {'etype': 'Sgen', 'idx': idx, 'static': element_data_static
-                 , 'related': [bid]}
+    def _get_injections(self, type, etype, grid_idx):
+        """Create the entities of the loads or sgens, the table is read column-wise"""
+        table = self.net[type]
+        eids = self._eids(table['name'], grid_idx)
+        bids = self._eids(self.net.bus['name'].reindex(table['bus']), grid_idx)
 
+        for idx, eid, bid, element_data in zip(table.index, eids, bids, table.to_dict('records')):
+            self.entity_map[eid] = {'etype': etype, 'idx': idx, 'static': element_data, 'related': [bid]}
 
-             sgens.append((bid, element['p_mw'], element['q_mvar'], element['scaling']
-                           , element['in_service']))
-
-        return sgens
+        return list(zip(bids, table['p_mw'], table['q_mvar'], table['scaling'], table['in_service']))
 
 
 
     def _get_lines(self, grid_idx):
         """create branches entities"""
-        lines = []
-
-        for idx in self.line_id:
-            element = self.net.line.iloc[idx]
-            eid = make_eid(element['name'], grid_idx)
-            fbus = make_eid(self.bus_id[element['from_bus']], grid_idx)
-            tbus = make_eid(self.bus_id[element['to_bus']], grid_idx)
-
-
-            f_idx = self.entity_map[fbus]['idx']
-            t_idx = self.entity_map[tbus]['idx']
-
-
-            element_data= element.to_dict()
-            keys_to_del = ['name', 'from_bus', 'to_bus']
-            element_data_static = {key: element_data[key] for key in element_data if key not in keys_to_del }
-            #del element_data_static
+        table = self.net.line
+        eids = self._eids(table['name'], grid_idx)
+        fbuses = self._eids(self.net.bus['name'].reindex(table['from_bus']), grid_idx)
+        tbuses = self._eids(self.net.bus['name'].reindex(table['to_bus']), grid_idx)
+        static = table.drop(columns=['name', 'from_bus', 'to_bus']).to_dict('records')
 
+        for idx, eid, fbus, tbus, element_data_static in zip(table.index, eids, fbuses, tbuses, static):
             self.entity_map[eid] = {'etype': 'Line', 'idx': idx, 'static': element_data_static
                 , 'related': [fbus, tbus]}
 
-            lines.append((f_idx, t_idx, element['length_km'], element['r_ohm_per_km'], element['x_ohm_per_km'],
-                         element['c_nf_per_km'], element['max_i_ka'], element['in_service']))
-
-        return lines
+        return list(zip(table['from_bus'], table['to_bus'], table['length_km'], table['r_ohm_per_km'],
+                        table['x_ohm_per_km'], table['c_nf_per_km'], table['max_i_ka'], table['in_service']))
 
 
 
     def _get_trafos(self, grid_idx):
         """Create tranformer entities"""
-        trafos = []
-
-        for idx in self.trafo_id:
-            element = self.net.trafo.iloc[idx]
-            eid = make_eid(element['name'], grid_idx)
-            hv_bus = make_eid(self.bus_id[element['hv_bus']], grid_idx)
-            lv_bus = make_eid(self.bus_id[element['lv_bus']], grid_idx)
-
-
-            hv_idx = self.entity_map[hv_bus]['idx']
-            lv_idx = self.entity_map[lv_bus]['idx']
-
-            element_data = element.to_dict()
-            keys_to_del = ['name', 'hv_bus', 'lv_bus']
-            element_data_static = {key: element_data[key] for key in element_data if key not in keys_to_del}
-            # del element_data_static
+        table = self.net.trafo
+        eids = self._eids(table['name'], grid_idx)
+        hv_buses = self._eids(self.net.bus['name'].reindex(table['hv_bus']), grid_idx)
+        lv_buses = self._eids(self.net.bus['name'].reindex(table['lv_bus']), grid_idx)
+        static = table.drop(columns=['name', 'hv_bus', 'lv_bus']).to_dict('records')
 
+        for idx, eid, hv_bus, lv_bus, element_data_static in zip(table.index, eids, hv_buses, lv_buses, static):
             self.entity_map[eid] = {'etype': 'Transformer', 'idx': idx, 'static': element_data_static
                 , 'related': [hv_bus, lv_bus]}
 
-        trafos.append((hv_idx, lv_idx, element['sn_mva'], element['vn_hv_kv'], element['vn_lv_kv']
-                       , element['vk_percent'], element['vkr_percent'], element['pfe_kw'], element['i0_percent']
-                       , element['shift_degree'], element['tap_side'], element['tap_pos'], element['tap_neutral']
-                       , element['tap_min'], element['tap_max'], element['in_service']))
+        return list(zip(table['hv_bus'], table['lv_bus'], table['sn_mva'], table['vn_hv_kv'], table['vn_lv_kv'],
+                        table['vk_percent'], table['vkr_percent'], table['pfe_kw'], table['i0_percent'],
+                        table['shift_degree'], table['tap_side'], table['tap_pos'], table['tap_neutral'],
+                        table['tap_min'], table['tap_max'], table['in_service']))
 
-        return trafos
+    @staticmethod
+    def _eids(names, grid_idx):
+        """entity ids of a column of element names"""
+        return [make_eid(name, grid_idx) for name in names]
 
     def set_grid_price(self, price):
 
-        pp.create_poly_cost(self.net, 0, 'ext_grid',cp1_eur_per_mw=price) # NB the index is 0 cause only one ext_grid is considered
+        self.set_costs('ext_grid', [0], [price]) # NB the index is 0 cause only one ext_grid is considered
+
+    def set_costs(self, type, elements, prices):
+        """sets the linear cost (cp1_eur_per_mw) of elements of a type, keeping one poly_cost row per element:
+        the rows already present are updated in place with one assignment, only the missing ones are created"""
+        elements = np.asarray(elements)
+        prices = np.broadcast_to(np.asarray(prices, dtype=float), elements.shape)
+        rows = np.array([self.cost_index.get((type, element), -1) for element in elements], dtype=int)
+
+        found = rows >= 0
+        if found.any():
+            self.net.poly_cost.loc[rows[found], 'cp1_eur_per_mw'] = prices[found]
+        if not found.all():
+            new_rows = pp.create_poly_costs(self.net, elements[~found], type, cp1_eur_per_mw=prices[~found])
+            for element, row in zip(elements[~found], new_rows):
+                self.cost_index[(type, element)] = row
 
 
     def set_inputs(self, etype, idx, data, static):
@@ -298,78 +290,59 @@ class pandapower(object):
             - aggregated : regarding a specific BUS
             - indivdual : regarding a specific grid component"""
         #TODO COMPLETE THE MODELLING WITH ALL POSSIBLE COMPONENTS
-        if etype == 'Bus':
-            try:
-                self.set_loads(data['load'], idx)
-            except:
-                print('no loads from this entity')
-            try:
-                self.set_storages(data['storage'],idx)
-            except:
-                print('no storage from this entity')
-            try:
-                self.set_sgens(data['sgen'],idx)
-            except:
-                print('no sgens from this entity')
-        else: # single components
-            #todo in case passing single elements mosaik entities
-            pass
+        self.set_inputs_bulk([(etype, idx, data)])
+
+    def set_inputs_bulk(self, inputs):
+        """setting at once the inputs of all the entities of a step (see set_inputs)
+        inputs is a list of (etype, idx, data) of the grid entities receiving data"""
+        elements = {'load': [], 'sgen': [], 'storage': []}
+        for etype, idx, data in inputs:
+            if etype == 'Bus':
+                for element_type in elements:
+                    for src, values in (data.get(element_type) or {}).items():
+                        if values: #if no data just skip
+                            elements[element_type].append((src + '_' + element_type, idx, values))
+            else: # single components
+                #todo in case passing single elements mosaik entities
+                pass
+
+        for element_type, items in elements.items():
+            if items:
+                self.set_elements(element_type, items)
 
     def set_loads(self, load, bus_idx):
         '''used to create or fill data of load element is calle by set_inputs'''
-        if list(load.values())[0] : #if no data just skip
-
-            name = list(load.keys())[0]+'_load'
-
-            if name not in self.net.load['name']: #check if already present if not create it
-
-                self.create_element(bus_idx, name ,'load', load[list(load.keys())[0]])
-
-
-            else: #if load already present only edit info
-                idx = pp.get_element_index(self.net,'load',name, exact_match=True) # should be only one load
-                for key,value in load[list(load.keys())[0]].items():
-                    self.net.load.at[idx,key]=value
-
-        else:
-            pass
-
-
+        self.set_inputs_bulk([('Bus', bus_idx, {'load': load})])
 
     def set_storages (self, storage, bus_idx):
         '''used to create or fill data of storage element is calle by set_inputs'''
-        x= storage.values()
-        if list(storage.values())[0]:  # if no data just skip
-
-            name = list(storage.keys())[0] + '_storage'
-
-            if name not in self.net.storage['name']:  # check if already present if not create it
-                self.create_element(bus_idx, name, 'storage', storage[list(storage.keys())[0]])
-
-            else:  # if load already present only edit info
-                idx = pp.get_element_index(self.net, 'storage', name, exact_match=True)  # should be only one load
-                for key, value in storage[list(storage.keys())[0]].items():
-                    self.net.storage.at[idx, key] = value
-
-        else:
-            pass
+        self.set_inputs_bulk([('Bus', bus_idx, {'storage': storage})])
 
     def set_sgens(self, sgen, bus_idx):
         '''used to create or fill data of sgen element is calle by set_inputs'''
-        if list(sgen.values())[0]:  # if no data just skip
-
-            name = list(sgen.keys())[0] + '_sgen'
-
-            if name not in self.net.sgen['name']:  # check if already present if not create it
-                self.create_element(bus_idx, name, 'sgen', sgen[list(sgen.keys())[0]])
-
-            else:  # if load already present only edit info
-                idx = pp.get_element_index(self.net, 'sgen', name, exact_match=True)  # should be only one load
-                for key, value in sgen[list(sgen.keys())[0]].items():
-                    self.net.sgen.at[idx, key] = value
+        self.set_inputs_bulk([('Bus', bus_idx, {'sgen': sgen})])
+
+    def set_elements(self, type, items):
+        """creates the missing elements of a type (load, sgen, storage) and writes the data of the existing ones,
+        items is a list of (name, bus index, data). Element indices are resolved through the persistent
+        element_index map and each column is written with a single assignment"""
+        index = self.element_index[type]
+        existing = []
+        for name, bus, data in items:
+            if name not in index: #check if already present if not create it
+                self.create_element(bus, name, type, data)
+            else:
+                existing.append((index[name], data))
 
-        else:
-            pass
+        if existing:
+            table = self.net[type]
+            idx = np.array([i for i, _ in existing])
+            values = pd.DataFrame([data for _, data in existing])
+            for column in values.columns:
+                if column != 'cost':
+                    table.loc[idx, column] = values[column].values
+            if 'cost' in values.columns:
+                self.set_costs(type, idx, values['cost'].values)
 
 
     def create_element(self, bus, name, type, data):
@@ -380,42 +353,338 @@ class pandapower(object):
         if type == 'load':
             id = pp.create_load(self.net, bus, p_mw=data['p_mw'],q_mvar=data['q_mvar'], max_p_mw=data['max_p_mw'],min_p_mw=data['min_p_mw'],
                            max_q_mvar=data['max_q_mvar'],min_q_mvar=data['min_q_mvar'], controllable=data['controllable'], name = name)
-            pp.create_poly_cost(self.net, id, 'load', cp1_eur_per_mw=data['cost'])
+            self.set_costs('load', [id], [data['cost']])
             self.name2index [name] = id
+            self.element_index['load'][name] = id
 
         elif type == 'sgen':
             id = pp.create_sgen(self.net, bus, p_mw=data['p_mw'],q_mvar=data['q_mvar'], max_p_mw=data['max_p_mw'],min_p_mw=data['min_p_mw'],
                            max_q_mvar=data['max_q_mvar'],min_q_mvar=data['min_q_mvar'], controllable=data['controllable'], name = name)
-            pp.create_poly_cost(self.net, id, 'sgen', cp1_eur_per_mw=data['cost'])
+            self.set_costs('sgen', [id], [data['cost']])
             self.name2index[name] = id
+            self.element_index['sgen'][name] = id
 
         elif type == 'storage':
             #TODO add paramets when using storages
             id = pp.create_storage(self.net, bus, p_mw=data['p_mw'], q_mvar=data['q_mvar'], max_p_mw=data['max_p_mw'],min_p_mw=data['min_p_mw'],
                                 max_q_mvar=data['max_q_mvar'], min_q_mvar=data['min_q_mvar'],
                                 controllable=data['controllable'], name=name)
-            pp.create_poly_cost(self.net, id, 'storage', cp1_eur_per_mw=data['cost'])
+            self.set_costs('storage', [id], [data['cost']])
             self.name2index[name] = id
+            self.element_index['storage'][name] = id
 
         else :
             raise  ValueError('Not known grid element!\n')
 
 
     def reset_costs(self):
+        """drops all the costs, not needed between steps since set_costs updates the prices in place"""
         self.net.poly_cost = self.net.poly_cost.drop(self.net.poly_cost.index[0:])
-
-    def powerflow(self):
-        """Conduct power flow"""
+        self.cost_index = {}
+
+    def powerflow(self, warm_start=None, use_cache=True):
+        """Conduct power flow
+        with warm_start (default self.warm_start) the power flow starts from the voltages of the previous step and
+        reuses its lookups and admittance matrices, only the bus injections are updated. It falls back to a full
+        rebuild whenever the topology signature changes (see _topology_signature).
+        With use_cache False the result cache is not looked up, the results are still stored in it"""
+        if warm_start is None:
+            warm_start = self.warm_start
+        self._results_snapshot = None
+        key = self._result_key('pf') if self.result_cache is not None else None
+        if key is not None and use_cache and self.result_cache.restore(key, self.net):
+            print('power flow results from the cache')
+            return
+        signature = self._topology_signature() if warm_start else None
         print('running a power flow')
-        pp.runpp(self.net)
+        self._pf_signature = None # unknown state until the power flow succeeds
+        if warm_start and signature == self._pf_signature_last and _internal_stored(self.net):
+            pp.runpp(self.net, recycle=PF_RECYCLE) # initialized with the previous results
+        else:
+            self.net._ppc = None # stale structures of the previous topology are not reused
+            pp.runpp(self.net, recycle=PF_RECYCLE if warm_start else None)
+        self._pf_signature = self._pf_signature_last = signature
+        if key is not None:
+            self.result_cache.store(key, self.net)
         print(' power flow ended')
 
+    def solve_powerflow(self):
+        """power flow of a step (the fast one with fast_pf) followed by the retries of PF_RETRIES until one converges
+        when all of them fail the results are emptied, so the step serves nan instead of the results of the previous
+        one. returns the status record of the step, also kept in pf_status:
+        converged, attempt (name of the attempt that converged), attempts, fast (estimated by fast_powerflow),
+        error (of the last failed attempt) and elapsed seconds"""
+        start = time.perf_counter()
+        status = {'converged': False, 'attempt': None, 'attempts': 0, 'fast': False, 'error': None, 'elapsed': 0.}
+        for name, options in [('fast' if self.fast_pf else 'ac', None)] + PF_RETRIES:
+            status['attempts'] += 1
+            try:
+                if options is None and self.fast_pf:
+                    status['fast'] = self.fast_powerflow()
+                elif options is None:
+                    self.powerflow()
+                else:
+                    self._retry_powerflow(options)
+            except Exception as e:
+                status['error'] = '%s: %s' % (type(e).__name__, e)
+                print(' power flow attempt %s failed (%s)' % (name, status['error']))
+                continue
+            status['converged'] = True
+            status['attempt'] = name
+            break
+        else:
+            reset_results(self.net)
+            self._results_snapshot = None
+        status['elapsed'] = time.perf_counter() - start
+        self.pf_status = status
+        return status
+
+    def _retry_powerflow(self, options):
+        """power flow from scratch with the options of a retry, the warm start structures are rebuilt afterwards"""
+        self._pf_signature = self._pf_signature_last = None
+        self._results_snapshot = None
+        self.net._ppc = None
+        pp.runpp(self.net, **options)
+        if self.fast_pf:
+            self.build_sensitivities()
+
+    def fast_powerflow(self, margin=None, max_change=None):
+        """Estimates the slack power and the bus voltages with one matrix-vector product on the sensitivities of an
+        AC power flow (see build_sensitivities), for the steps that only screen P_rt
+        it escalates to a full AC power flow (and linearizes again around it) when there is no linearization for the
+        current topology, when the injections moved more than max_change from the linearization point or when an
+        estimated voltage is within margin of the limits of its bus.
+        An estimate updates res_ext_grid.p_mw, res_bus.vm_pu and res_bus.p_mw/q_mvar (from the injections), all the
+        other results are nan rather than the ones of the last AC power flow.
+        margin and max_change default to fast_pf_margin and fast_pf_max_change of the model
+        returns True when the results are estimated, False when the AC power flow was run"""
+        margin = self.fast_pf_margin if margin is None else margin
+        max_change = self.fast_pf_max_change if max_change is None else max_change
+        sens = self._sensitivities
+        if sens is None or sens['signature'] != self._topology_signature():
+            return self._escalate()
+        injections = self._bus_injections()
+        delta = injections - sens['injections']
+        if np.abs(delta).sum() > max_change * max(np.abs(sens['injections']).sum(), 1e-9):
+            return self._escalate()
+
+        estimate = sens['base'] + sens['matrix'].dot(delta)
+        p_slack, vm = estimate[0], estimate[1:]
+        valid = ~np.isnan(vm)
+        if np.any(vm[valid] < sens['vm_min'][valid] + margin) or np.any(vm[valid] > sens['vm_max'][valid] - margin):
+            return self._escalate()
+
+        self._results_snapshot = None
+        net = self.net
+        for table in [key for key in net.keys() if key.startswith('res_') and isinstance(net[key], pd.DataFrame)]:
+            if len(net[table]):
+                net[table].loc[:, :] = np.nan
+        res_ext_grid = net.res_ext_grid
+        res_ext_grid['p_mw'] = sens['slack_share'] * p_slack
+        # power drawn by each bus (load positive like pandapower), the slack buses give the power of the ext grid
+        # (its reactive power is not estimated)
+        n = len(net.bus)
+        p_mw, q_mvar = -injections[:n], -injections[n:]
+        slack_buses = pd.Series(np.arange(n), index=net.bus.index).loc[net.ext_grid['bus'].values].values
+        np.subtract.at(p_mw, slack_buses, res_ext_grid['p_mw'].values)
+        q_mvar[slack_buses] = np.nan
+        net.res_bus['vm_pu'] = vm
+        net.res_bus['p_mw'] = p_mw
+        net.res_bus['q_mvar'] = np.where(valid, q_mvar, np.nan)
+        net.res_bus.loc[~valid, 'p_mw'] = np.nan
+        return True
+
+    def _escalate(self):
+        # always a real AC power flow, the sensitivities linearize around its internal state (a result cache hit
+        # restores the results only, with the internal state of an older power flow)
+        self.powerflow(use_cache=False)
+        self.build_sensitivities()
+        return False
+
+    def build_sensitivities(self):
+        """linearizes the slack power and the bus voltages around the results of the last AC power flow
+        with the jacobian J of the power flow, the changes of the bus injections dS give the changes of the state
+        dx = J^-1 dS, of the voltages of the pq buses and of the power of the slack buses (their own injection and
+        dPcalc/dx dx). The rows are stored as one matrix over the injections of the pandapower buses"""
+        net = self.net
+        internal = net._ppc['internal']
+        baseMVA = internal['baseMVA']
+        ref, pv, pq = internal['ref'], internal['pv'], internal['pq']
+        pvpq = np.r_[pv, pq]
+        n = len(internal['V'])
+        dS_dVa, dS_dVm = dSbus_dV(internal['Ybus'], internal['V'])
+        dS_dVa, dS_dVm = dS_dVa.tocsr(), dS_dVm.tocsr()
+        J = np.block([[dS_dVa[pvpq][:, pvpq].real.toarray(), dS_dVm[pvpq][:, pq].real.toarray()],
+                      [dS_dVa[pq][:, pvpq].imag.toarray(), dS_dVm[pq][:, pq].imag.toarray()]])
+        # state sensitivities to the specified injections (P of the pv and pq buses, Q of the pq buses) in p.u.
+        select = np.zeros((len(pvpq) + len(pq), 2 * n))
+        select[np.arange(len(pvpq)), pvpq] = 1
+        select[len(pvpq) + np.arange(len(pq)), n + pq] = 1
+        dx = np.linalg.solve(J, select)
+        dvm = np.zeros((n, 2 * n))
+        dvm[pq] = dx[len(pvpq):]
+        dpcalc = np.hstack([dS_dVa[ref][:, pvpq].real.toarray(), dS_dVm[ref][:, pq].real.toarray()]).dot(dx)
+        dslack = dpcalc.sum(axis=0)
+        dslack[ref] -= 1 # the injections of the slack buses are balanced by the slack itself
+
+        # from the injections [P, Q] of the pandapower buses in MW to the internal buses in p.u.
+        ppc_bus = net._ppc['bus']
+        in_ppci = ppc_bus[:, BUS_TYPE] != NONE
+        ppci_index = np.where(in_ppci, np.cumsum(in_ppci) - 1, -1)[net._pd2ppc_lookups['bus'][net.bus.index.values]]
+        connected = ppci_index >= 0
+        to_ppci = np.zeros((2 * n, 2 * len(net.bus)))
+        buses = np.flatnonzero(connected)
+        to_ppci[ppci_index[buses], buses] = 1 / baseMVA
+        to_ppci[n + ppci_index[buses], len(net.bus) + buses] = 1 / baseMVA
+
+        vm_rows = np.full((len(net.bus), 2 * n), np.nan)
+        vm_rows[buses] = dvm[ppci_index[buses]]
+        matrix = np.vstack([baseMVA * dslack[None, :], vm_rows]).dot(to_ppci)
+        matrix[1:][~connected] = 0
+
+        p_ext_grid = net.res_ext_grid['p_mw'].values
+        vm_min = net.bus['min_vm_pu'].values if 'min_vm_pu' in net.bus else np.full(len(net.bus), np.nan)
+        vm_max = net.bus['max_vm_pu'].values if 'max_vm_pu' in net.bus else np.full(len(net.bus), np.nan)
+        self._sensitivities = {
+            'signature': self._topology_signature(),
+            'injections': self._bus_injections(),
+            'base': np.r_[p_ext_grid.sum(), net.res_bus['vm_pu'].values],
+            'matrix': matrix,
+            'slack_share': p_ext_grid / p_ext_grid.sum() if p_ext_grid.sum() else np.ones(len(p_ext_grid)) / len(p_ext_grid),
+            'vm_min': np.where(np.isnan(vm_min), self.fast_pf_vm_limits[0], vm_min),
+            'vm_max': np.where(np.isnan(vm_max), self.fast_pf_vm_limits[1], vm_max),
+        }
+
+    def _bus_injections(self):
+        """[P, Q] injected at the pandapower buses by the loads, sgens and storages in service [MW, MVAr]"""
+        net = self.net
+        position = pd.Series(np.arange(len(net.bus)), index=net.bus.index)
+        injections = np.zeros(2 * len(net.bus))
+        for table, sign in [('load', -1), ('sgen', 1), ('storage', -1)]:
+            elements = net[table]
+            if not len(elements):
+                continue
+            factor = sign * elements['scaling'].values * elements['in_service'].values
+            buses = position.loc[elements['bus'].values].values
+            injections[:len(net.bus)] += np.bincount(buses, factor * elements['p_mw'].values, len(net.bus))
+            if 'q_mvar' in elements:
+                injections[len(net.bus):] += np.bincount(buses, factor * elements['q_mvar'].values, len(net.bus))
+        return injections
+
+    def enable_result_cache(self, size=256, tolerance=1e-4):
+        """memoizes the results of the (optimal) power flows, see ResultCache"""
+        self.result_cache = ResultCache(size, tolerance)
+
+    def _result_key(self, kind):
+        """key of the current operating point: topology, quantized injections and for the opf the costs and limits"""
+        net = self.net
+        values = [net.ext_grid['vm_pu'].values]
+        columns = ['p_mw', 'q_mvar']
+        if kind == 'opf':
+            columns += ['min_p_mw', 'max_p_mw', 'min_q_mvar', 'max_q_mvar']
+            values.append(net.poly_cost[['cp0_eur', 'cp1_eur_per_mw', 'cq1_eur_per_mvar']].values.ravel())
+        for table in ['load', 'sgen', 'storage']:
+            for column in columns:
+                if column in net[table]:
+                    values.append(net[table][column].values)
+                elif column in ['p_mw', 'q_mvar']: # storages without reactive power
+                    values.append(np.zeros(len(net[table])))
+            if kind == 'opf' and 'controllable' in net[table]:
+                values.append(net[table]['controllable'].values)
+        values = np.nan_to_num(np.concatenate([np.asarray(v, dtype=float) for v in values]))
+        injections = np.round(values / self.result_cache.tolerance).astype(np.int64).tobytes()
+        return (kind, self._topology_signature(), injections)
+
+    def _topology_signature(self):
+        """what the power flow structures depend on: switch positions, in service flags and number of elements,
+        tap positions and the set points of the ext grids and gens (not recycled, see PF_RECYCLE)"""
+        net = self.net
+        signature = [net.switch['closed'].values.tobytes()]
+        for table in ['bus', 'line', 'trafo', 'trafo3w', 'ext_grid', 'gen', 'load', 'sgen', 'storage', 'shunt']:
+            if table in net:
+                signature.append(net[table].index.values.tobytes())
+                signature.append(net[table]['in_service'].values.astype(bool).tobytes())
+        for table, columns in [('trafo', ['tap_pos']), ('trafo3w', ['tap_pos']), ('ext_grid', ['vm_pu', 'va_degree']),
+                               ('gen', ['vm_pu', 'p_mw', 'scaling'])]:
+            if table in net:
+                for column in columns:
+                    if column in net[table]:
+                        signature.append(net[table][column].values.astype(float).tobytes())
+        return tuple(signature)
+
+    def run_batch(self, profiles, time_steps=None, output_dir=None, log_variables=OUTPUT_VARIABLES, verbose=False):
+        """Time series power flow over a whole horizon in one call, for offline studies without the mosaik round trip
+        profiles maps (element type, column) to the values over the horizon, e.g. {('load', 'p_mw'): df}:
+        a DataFrame with one row per time step and one column per element (pandapower index or name), or a 2d array
+        with one column per element of the table in the order of the table.
+        The profiles are applied through ConstControl, the power flows of consecutive steps reuse the structures of
+        the previous one (see pandapower run_timeseries). The profiled columns are restored at the end.
+        returns the logged results as {'res_bus.vm_pu': DataFrame (time steps x elements)}, they are also written
+        to output_dir when given"""
+        sources = []
+        for (type, variable), values in profiles.items():
+            if isinstance(values, pd.DataFrame):
+                index = self.element_index.get(type, {})
+                columns = [index.get(c, c) for c in values.columns]
+                values = pd.DataFrame(values.values, index=values.index, columns=columns)
+            else:
+                values = pd.DataFrame(np.asarray(values, dtype=float), columns=self.net[type].index)
+            sources.append((type, variable, values))
+        if time_steps is None:
+            time_steps = range(min(len(values) for _, _, values in sources))
+
+        saved = {(type, variable): self.net[type][variable].copy() for type, variable, _ in sources}
+        n_controllers = len(self.net.controller)
+        for type, variable, values in sources:
+            ConstControl(self.net, element=type, variable=variable, element_index=list(values.columns),
+                         data_source=DFData(values), profile_name=list(values.columns))
+        ow = OutputWriter(self.net, time_steps, output_path=output_dir, output_file_type='.csv',
+                          log_variables=list(log_variables))
+        try:
+            print('running a time series power flow of %s steps' % len(time_steps))
+            run_timeseries(self.net, time_steps, continue_on_divergence=True, verbose=verbose)
+            print(' time series power flow ended')
+        finally:
+            self.net.controller = self.net.controller.iloc[:n_controllers]
+            for (type, variable), values in saved.items():
+                self.net[type][variable] = values
+            self._pf_signature_last = None # the time series leaves its own internal structures
+            self._results_snapshot = None
+
+        return dict(ow.output)
+
     def optimalpowerflow(self):
         print('running an Optimal power flow')
         #pp.opf_task(self.net)
+        self._pf_signature_last = None # the opf overwrites the internal structures of the power flow
+        self._results_snapshot = None
+        key = self._result_key('opf') if self.result_cache is not None else None
+        if key is not None and self.result_cache.restore(key, self.net):
+            print('Optimal power flow results from the cache')
+            return
         pp.runopp(self.net, verbose = False)
+        if key is not None:
+            self.result_cache.store(key, self.net)
         print( 'Optimal power flow ended')
 
+    def result_cache_report(self):
+        return self.result_cache.report() if self.result_cache is not None else None
+
+    def export_results(self):
+        """result tables (not empty) and convergence flag of the last power flow, all a worker sends back"""
+        net = self.net
+        tables = {name: net[name] for name in net.keys()
+                  if name.startswith('res_') and isinstance(net[name], pd.DataFrame) and len(net[name])}
+        return {'tables': tables, 'converged': net['converged']}
+
+    def import_results(self, status, results):
+        """takes the results of a power flow run by a worker on a copy of the model (see export_results)"""
+        for name, table in results['tables'].items():
+            self.net[name] = table
+        self.net['converged'] = results['converged']
+        self.pf_status = status
+        self._results_snapshot = None
+
     def opf_results(self):
         results = {}
         results['res_load'] = self.net.res_load
@@ -425,95 +694,258 @@ class pandapower(object):
         results['name2index'] = self.name2index
         return results
 
-    def get_cache_entries(self):
-        """cache the results of the power flow to be communicated to other simulators"""
-
-        cache = {}
-        case = self.net
+    def bus_powers(self):
+        """active power of the buses [MW] but the ones of the external grids, whose power balances the whole grid"""
+        net = self.net
+        return net.res_bus['p_mw'].values[~net.bus.index.isin(net.ext_grid.bus.values)]
+
+    def flexibility(self):
+        """power, bounds and linear cost of the elements created by the inputs (see set_inputs_bulk), as sent by the
+        buildings, for the demand response of the dso (see Dso.DsoModel.dispatch)"""
+        costs = self.net.poly_cost
+        results = {'name2index': self.name2index}
+        for type, index in self.element_index.items():
+            ids = np.fromiter(index.values(), dtype=int, count=len(index))
+            table = self.net[type].reindex(index=ids, columns=['p_mw', 'q_mvar', 'min_p_mw', 'max_p_mw'])
+            rows = np.array([self.cost_index.get((type, id), -1) for id in ids], dtype=int)
+            cost = np.full(len(ids), np.nan)
+            cost[rows >= 0] = costs.loc[rows[rows >= 0], 'cp1_eur_per_mw'].values
+            table['cost'] = cost
+            results[type] = table
+        return results
 
+    def _index_results(self):
+        """precomputes for each entity type the eids and the rows of the result table they read"""
+        index = {}
         for eid, attrs in self.entity_map.items():
             etype = attrs['etype']
-            idx = attrs['idx']
-            data = {}
-
-            if not case.res_bus.empty:
-
-                if etype == 'Bus':
-                    bus = case.res_bus.iloc[idx]
-                    data['p_mw'] = bus['p_mw']
-                    data['q_mvar'] = bus['q_mvar']
-                    data['vm_pu'] = bus['vm_pu']
-                    data['va_degree'] = bus['va_degree']
+            if etype == 'Ext_grid': # the entity idx is the slack bus
+                row = int(np.flatnonzero(self.net.ext_grid.bus.values == attrs['idx'])[0])
+            else:
+                row = attrs['idx']
+            eids, rows = index.setdefault(etype, ([], []))
+            eids.append(eid)
+            rows.append(row)
+        self.result_index = {etype: (eids, np.array(rows, dtype=int)) for etype, (eids, rows) in index.items()}
+        self._results_snapshot = None
+
+    def results_snapshot(self):
+        """results of the last (optimal) power flow as a ResultSnapshot, extracted once per power flow"""
+        if self._results_snapshot is None:
+            self._results_snapshot = ResultSnapshot(self.net, self.result_index)
+        return self._results_snapshot
 
-                elif etype == 'Load':
-                    load = case.res_load.iloc[idx]
-                    data['p_mw'] = load['p_mw']
-                    data['q_mvar'] = load['q_mvar']
+    def get_cache_entries(self):
+        """cache the results of the power flow to be communicated to other simulators"""
+        return self.results_snapshot().to_dict()
+
+
+class ResultCache(object):
+    """
+    LRU memoization of the power flow results: operating points whose injections are equal once quantized to
+    tolerance (MW, MVAr, p.u.) and with the same topology share the res_* tables of the first one computed.
+    """
+
+    def __init__(self, size=256, tolerance=1e-4):
+        self.size = size
+        self.tolerance = tolerance
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def restore(self, key, net):
+        """copies the cached results of key into the net, returns False when there are none"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False
+        self._entries.move_to_end(key)
+        self.hits += 1
+        tables, flags = entry
+        for table, res in tables.items():
+            net[table] = res.copy()
+        for flag, value in flags.items():
+            net[flag] = value
+        return True
+
+    def store(self, key, net):
+        tables = {table: net[table].copy() for table in net.keys()
+                  if table.startswith('res_') and isinstance(net[table], pd.DataFrame)}
+        flags = {flag: net[flag] for flag in ['converged', 'OPF_converged'] if flag in net}
+        self._entries[key] = (tables, flags)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        calls = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / calls if calls else 0.,
+                'entries': len(self._entries), 'size': self.size, 'tolerance': self.tolerance}
+
+    def report(self):
+        stats = self.stats()
+        return 'result cache: %s hits / %s misses (hit rate %.1f%%), %s of %s entries, tolerance %g' % (
+            stats['hits'], stats['misses'], 100 * stats['hit_rate'], stats['entries'], stats['size'], stats['tolerance'])
+
+
+class ResultSnapshot(object):
+    """
+    results of a power flow extracted into numpy columns, one array per entity type and attribute aligned with the
+    eids of the type (see pandapower.result_index). Columns are extracted lazily, the first time an attribute of
+    the type is requested, from the result table or, for the static attributes, from the element table.
+    When the power flow failed to converge all the results are nan.
+    Attributes found in neither table are None.
+    """
+
+    def __init__(self, net, result_index):
+        self.net = net
+        self.converged = not net.res_bus.empty
+        self.rows = {etype: rows for etype, (_, rows) in result_index.items()}
+        self.eids = {etype: eids for etype, (eids, _) in result_index.items()}
+        self.columns = {etype: {} for etype in result_index} # entity type > attribute > array
+        self.position = {} # eid > (entity type, position in the arrays)
+        for etype, eids in self.eids.items():
+            for i, eid in enumerate(eids):
+                self.position[eid] = (etype, i)
+
+    def column(self, etype, attr):
+        """values of an attribute for all the entities of a type, None if the attribute is not available"""
+        columns = self.columns[etype]
+        if attr not in columns:
+            table, res_table = ENTITY_TABLES[etype]
+            rows = self.rows[etype]
+            res = self.net[res_table]
+            if attr in res.columns:
+                if self.converged and len(res):
+                    columns[attr] = res[attr].values[rows]
+                else: # Failed to converge.
+                    columns[attr] = np.full(len(rows), np.nan)
+            elif attr in self.net[table].columns:
+                columns[attr] = self.net[table][attr].values[rows]
+            else:
+                columns[attr] = None
+        return columns[attr]
 
+    def __contains__(self, eid):
+        return eid in self.position
 
-                elif etype == 'Sgen':
-                    sgen = case.res_sgen.iloc[idx]
-                    data['p_mw'] = sgen['p_mw']
-                    data['q_mvar'] = sgen['q_mvar']
+    def __getitem__(self, eid):
+        etype, i = self.position[eid]
+        return EntityResults(self, etype, i)
 
+    def get(self, eid, attr):
+        etype, i = self.position[eid]
+        return _item(self.column(etype, attr), i)
 
-                elif etype == 'Transformer':
-                    trafo = case.res_trafo.iloc[idx]
-                    data['va_lv_degree'] = trafo['va_lv_degree']
-                    data['loading_percent'] = trafo['loading_percent']
+    def to_dict(self, attrs=RESULT_ATTRS):
+        """the results as {eid: {attr: value}}, attrs maps the entity types to the attributes to include"""
+        cache = {}
+        for etype, eids in self.eids.items():
+            names = attrs[etype]
+            columns = [self.column(etype, attr) for attr in names]
+            columns = [[None] * len(eids) if c is None else c.tolist() for c in columns]
+            for eid, values in zip(eids, zip(*columns)):
+                cache[eid] = dict(zip(names, values))
+        return cache
 
-                elif etype == 'Line':
-                    line = case.res_line.iloc[idx]
-                    data['i_ka'] = line['i_ka']
-                    data['loading_percent'] = line ['loading_percent']
 
-                else:
-                    slack = case.res_ext_grid
-                    data['p_mw'] = slack['p_mw']
-                    data['q_mvar'] = slack['q_mvar']
+class EntityResults(Mapping):
+    """read only view on the results of an entity in a ResultSnapshot"""
+
+    __slots__ = ('_snapshot', '_etype', '_i')
+
+    def __init__(self, snapshot, etype, i):
+        self._snapshot = snapshot
+        self._etype = etype
+        self._i = i
+
+    def __getitem__(self, attr):
+        return _item(self._snapshot.column(self._etype, attr), self._i)
+
+    def __iter__(self):
+        return iter(RESULT_ATTRS[self._etype])
+
+    def __len__(self):
+        return len(RESULT_ATTRS[self._etype])
+
+
+def _item(column, i):
+    """python scalar of a column value (mosaik serializes the data to json)"""
+    if column is None:
+        return None
+    value = column[i]
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def run_powerflow(model):
+    """runs the power flow of a step of a grid model (see pandapower.solve_powerflow)"""
+    model.solve_powerflow()
+    return model
+
+
+def step_powerflow(model, inputs, price):
+    """step of a grid model held by a worker process (see grid_worker.GridWorker): applies the inputs of the step and
+    the grid price, runs the power flow and returns only the status and the result tables"""
+    model.set_inputs_bulk(inputs)
+    model.set_grid_price(price)
+    status = model.solve_powerflow()
+    return status, model.export_results()
+
+
+def read_case(path):
+    """reads a pandapower network from a json or excel file or creates one of the pandapower networks by name"""
+    #TO DO aggiungere il load da matlab con ,a conversione in pandapower net
+    loaders = {
+      '.json': 1,
+      '.xlsx': 2,
+      '': 3
+      }
+    try:
+       ext = os.path.splitext(path)[-1]
+       loader = loaders[ext]
+    except KeyError:
+        raise ValueError("Don't know how to open '%s'" % path)
+
+    if loader == 1:
+        return pp.from_json(path)
+    elif loader == 2:
+        return pp.from_excel(path)
+    elif path == 'cigre_hv':
+        return ppn.create_cigre_network_hv()
+    elif path == 'cigre_mv_all':
+        return ppn.create_cigre_network_mv(with_der='all')
+    elif path == 'cigre_mv_pv_wind':
+        return ppn.create_cigre_network_mv(with_der='pv_wind')
+    elif path == 'cigre_lv':
+        return ppn.create_cigre_network_lv()
+    elif path == 'test_pp':
+        return ppn.simple_four_bus_system()
+    raise ValueError("Don't know the network '%s'" % path)
+
+
+def case_cache_path(cache_dir, path, grid_idx):
+    """file of the case cache of a grid: keyed by the grid file (name and content) or the network name, the grid
+    index of its entities and the pandapower version"""
+    sha = hashlib.sha1()
+    sha.update(json.dumps([CASE_CACHE_VERSION, os.path.basename(path), grid_idx, pp.__version__]).encode())
+    if os.path.isfile(path):
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+    return os.path.join(cache_dir, 'case_%s.pickle' % sha.hexdigest()[:16])
 
-            else:
-                # Failed to converge.
-                if etype in 'Bus':
-                    data['p_mw'] = float('nan')
-                    data['q_mvar'] = float('nan')
-                    data['vm_pu'] = float('nan')
-                    data['va_degree'] = float('nan')
-                elif etype in 'Line':
-                    data['i_ka'] = float('nan')
-                    data['p_from_mw'] = float('nan')
-                    data['q_from_mvar'] = float('nan')
-                    data['p_to_mw'] = float('nan')
-                    data['q_to_mvar'] = float('nan')
-                elif etype in 'Transformer':
-                    data['va_lv_degree'] = float('nan')
-                    data['loading_percent'] = float('nan')
-
-
-            cache[eid] = data
-        return cache
 
 def make_eid(name, grid_idx):
     return '%s-%s' % (grid_idx, name)
 
 
 
-def create_output_writer(net, time_steps, output_dir):
+def create_output_writer(net, time_steps, output_dir, output_file_type=".xls", log_variables=OUTPUT_VARIABLES):
     """Pandapower output to save results"""
-    ow = OutputWriter(net, time_steps, output_path=output_dir, output_file_type=".xls")
+    ow = OutputWriter(net, time_steps, output_path=output_dir, output_file_type=output_file_type)
     # these variables are saved to the harddisk after / during the time series loop
-    ow.log_variable('res_load', 'p_mw')
-    ow.log_variable('res_load', 'q_mvar')
-    ow.log_variable('res_bus', 'vm_pu')
-    ow.log_variable('res_bus', 'q_mvar')
-    ow.log_variable('res_bus', 'va_degree')
-    ow.log_variable('res_bus', 'p_mw')
-    ow.log_variable('res_line', 'loading_percent')
-    ow.log_variable('res_line', 'i_ka')
-    ow.log_variable('res_trafo', 'va_lv_degree')
-    ow.log_variable('res_trafo', 'loading_percent')
-    ow.log_variable('res_sgen', 'p_mw')
-    ow.log_variable('res_sgen', 'q_mvar')
+    for table, variable in log_variables:
+        ow.log_variable(table, variable)
 
     return ow
 
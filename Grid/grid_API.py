@@ -1,19 +1,40 @@
+import os
 import mosaik_api
 from .GridModule import make_eid
 from .GridModule import pandapower
+from .GridModule import OUTPUT_VARIABLES
+from .GridModule import run_powerflow
+from .GridModule import FAST_PF_VM_LIMITS, FAST_PF_MARGIN, FAST_PF_MAX_CHANGE
+from .result_writer import ResultWriter
+from .grid_worker import GridWorker
 
 meta = { #todo add storage and controllable generators
 	#todo sgen should not have min and max
-	'type': 'time-based',
+	'type': 'hybrid', # stepped every step_size and, at the same time, by the opf requests of the dso
 	'models': {
 		'Grid': {
 			'public': True,
 			'params': [
 				'gridfile',  # Name of the file containing the grid topology.
 				'sheetnames',  # Mapping of Excel sheet names, optional.
-				'threshold'
+				'threshold',
+				'output_dir',  # Folder of the results, optional (see result_writer.ResultWriter).
+				'output_variables',  # List of (result table, column) to save, optional.
+				'cache_dir',  # Folder caching the loaded grids, optional (see GridModule.case_cache_path).
+				'result_cache',  # Size of the LRU memoizing the power flow results, optional (see GridModule.ResultCache).
+				'result_cache_tolerance',  # Quantization of the injections in the keys of the result cache.
+				'fast_pf',  # Linearized power flow at the steps, escalated to AC near limits (see GridModule.fast_powerflow).
+				'fast_pf_vm_limits',  # (min, max) voltage of the buses without limits for the fast power flow [p.u.].
+				'fast_pf_margin',  # Distance to the voltage limits escalating the fast power flow to AC [p.u.].
+				'fast_pf_max_change',  # Relative change of the injections escalating the fast power flow to AC.
 			],
-			'attrs': ['P_rt','proceed', 'results'],
+			'attrs': ['P_rt','proceed', 'results', 'pf_status',
+					  'opf_request', # {'price', 'iteration'} of the opf asked by the dso, addressed by the grid full id
+					  'flexibility', # bounds and costs of the elements of the buildings (see GridModule.flexibility)
+					  'P_buses', # active power of the buses but the slack ones [MW], for the forecasts of the dso
+					  ],
+			'trigger': ['opf_request'],
+			'persistent': ['pf_status'], # P_rt, flexibility and P_buses after a power flow and results after an opf are events
 		},
 		'Ext_grid': {
 			'public': False,
@@ -124,11 +145,14 @@ class GridApi(mosaik_api.Simulator):
 		super(GridApi, self).__init__(meta)
 		# self.eid_prefix = 'Grid_' >>>>>>> use this when dealing with multiple model instantiation
 		# self.eid = 'Grid'
-		self.simulator = pandapower()  # instance of the model imported from GridSim.py
+		self.simulators = {}  # grid index > instance of the model imported from GridModule.py, one per grid
 		self._entities = {}  # Maps EIDs to model instances/entities in case we want more grid entities DO NOT need now
+		self._entity_grid = {}  # Maps the EIDs of the entities and of the grids to their grid index
 		self._relations = []  # List of pair-wise related entities (IDs)
 		self._dso_relations = [] # List of reltions that communicate with the whole grid thus with the dso (e.g. aggregators, market)
 		self._ppcs = []  # The pandapower cases
+		self._writers = {}  # grid index > ResultWriter saving the results of each step
+		self._workers = {}  # grid index > GridWorker running the power flows of the grid (more than one grid)
 
 	def init(self, sid, step_size, pos_loads=True):
 		'''
@@ -142,10 +166,16 @@ class GridApi(mosaik_api.Simulator):
 		self.sameTime = True
 		self.OPF_res = None
 		self.step_size = step_size
+		self.sid = sid
+		self._events = {} # grid index > 'P_rt' or 'results', the event sent by get_data after the step
+		self._opf = {} # grid index > outcome of the last opf asked by the dso
 
 		return self.meta
 
-	def create(self, num, modelname, gridfile, sheetnames=None):
+	def create(self, num, modelname, gridfile, sheetnames=None, output_dir=None, output_variables=None,
+			   cache_dir=None, result_cache=None, result_cache_tolerance=1e-4,
+			   fast_pf=False, fast_pf_vm_limits=FAST_PF_VM_LIMITS, fast_pf_margin=FAST_PF_MARGIN,
+			   fast_pf_max_change=FAST_PF_MAX_CHANGE):
 		#TODO for now is only possible to charge multiple grid with same topologyfile
 		if modelname != 'Grid':
 			raise ValueError('Unknown model: "%s"' % modelname)
@@ -155,13 +185,23 @@ class GridApi(mosaik_api.Simulator):
 		grids = []
 		for i in range(num):
 			grid_idx = len(self._ppcs)
-			ppc, entities = self.simulator.load_case(gridfile, grid_idx) #loading the grid networks
+			simulator = pandapower()
+			ppc, entities = simulator.load_case(gridfile, grid_idx, cache_dir) #loading the grid networks
+			simulator.fast_pf = fast_pf
+			simulator.fast_pf_vm_limits = tuple(fast_pf_vm_limits)
+			simulator.fast_pf_margin = fast_pf_margin
+			simulator.fast_pf_max_change = fast_pf_max_change
+			if result_cache:
+				simulator.enable_result_cache(result_cache, result_cache_tolerance)
+			self.simulators[grid_idx] = simulator
 			self._ppcs.append(ppc)
+			self._entity_grid[make_eid('grid', grid_idx)] = grid_idx
 
 			children = []
 			for eid, attrs in sorted(entities.items()):
 				assert eid not in self._entities
 				self._entities[eid] = attrs
+				self._entity_grid[eid] = grid_idx
 
 				# We'll only add relations from line to nodes (and not from
 				# nodes to lines) because this is sufficient for mosaik to
@@ -182,6 +222,9 @@ class GridApi(mosaik_api.Simulator):
 				'rel': [],
 				'children': children,
 			})
+			if output_dir: # one folder per grid
+				self._writers[grid_idx] = ResultWriter(os.path.join(output_dir, make_eid('grid', grid_idx)),
+													   output_variables or OUTPUT_VARIABLES)
 		print('====================')
 		print('created grid entities')
 		print('====================')
@@ -200,6 +243,14 @@ class GridApi(mosaik_api.Simulator):
 
 		self.time = time
 		self.proceed = False
+		self._events = {}
+
+		#************* SAME TIME OPF asked by the dso ******************
+		requests = self._opf_requests(inputs)
+		if requests:
+			for grid_idx, request in requests.items():
+				self._run_opf(grid_idx, request)
+			return self.time+self.step_size
 
 		#************* SAVING RELATIONS only once ******************
 		if time == 0: # getting the related entities at the first time step
@@ -215,41 +266,105 @@ class GridApi(mosaik_api.Simulator):
 	#if self.sameTime: #separate information for the grid sub-component
 		print('============TS START==============\n')
 		print('Grid start cycle at time %s \n'%self.time)
-		self.simulator.reset_costs()
 
 
+		#inputs of all the entities are applied at once, grid by grid
+		grid_inputs = {grid_idx: [] for grid_idx in self.simulators}
 		for eid, attrs in inputs.items():
-			if 'grid' not in eid :
+			if 'grid' not in eid and eid in self._entities:
 				idx = self._entities[eid]['idx'] # indice pp
 				etype = self._entities[eid]['etype'] #type of pp component
-				static = self._entities[eid]['static']
-
-				self.simulator.set_inputs(etype, idx, attrs, static) # static will be only used for transformers
-	
-		self.simulator.set_grid_price(2) # will be a values passed by the inputs from market the grid cost
+				grid_inputs[self._entity_grid[eid]].append((etype, idx, attrs))
+		price = 2 # will be a values passed by the inputs from market the grid cost
+		for grid_idx, simulator in self.simulators.items():
+			simulator.set_inputs_bulk(grid_inputs[grid_idx])
+			simulator.set_grid_price(price)
 	 # >>> STEP2 performing PF in case to extract primary substation power value
-		
-		try:
-			#TODO the try block is only for testing the simulation flow must be avoided
-			self.simulator.powerflow()
-		except:
-			pass
+		self.powerflows(grid_inputs, price)
+		for grid_idx, writer in self._writers.items():
+			writer.append(self.time, self.simulators[grid_idx].net)
+		self._events = {grid_idx: 'P_rt' for grid_idx in self.simulators}
 		#scatta get_data per consegnare P_rt al DSO
 		#self.P_rt = self.simulator.net.res_ext_grid.values[0][0]
 
 		return self.time+self.step_size
 
+	def _opf_requests(self, inputs):
+		'''grid index > last opf request of the dso addressed to the grid (requests are keyed by the grid full id)'''
+		requests = {}
+		for eid, attrs in inputs.items():
+			if eid not in self._entity_grid or eid in self._entities:
+				continue
+			for src, grid_requests in attrs.get('opf_request', {}).items(): # a dso can supervise several grids
+				request = (grid_requests or {}).get('%s.%s' % (self.sid, eid))
+				if request is not None:
+					requests[self._entity_grid[eid]] = request
+		return requests
+
+	def _run_opf(self, grid_idx, request):
+		'''opf of a grid at the price of the request, a failure is reported to the dso instead of stopping the
+		simulation'''
+		simulator = self.simulators[grid_idx]
+		simulator.set_grid_price(request['price'])
+		try:
+			simulator.optimalpowerflow()
+			converged = bool(simulator.net.get('OPF_converged', True))
+		except Exception as e: # pandapower raises OPFNotConverged
+			print('Optimal power flow of %s failed at iteration %s: %s' % (make_eid('grid', grid_idx),
+																		   request.get('iteration'), e))
+			converged = False
+		self._opf[grid_idx] = {'converged': converged, 'iteration': request.get('iteration')}
+		self._events[grid_idx] = 'results'
+
+	def powerflows(self, grid_inputs, price):
+		'''runs the power flow of every grid (the inputs of the step are already set on the models), with more than
+		one grid the power flows run concurrently in one persistent worker per grid (see grid_worker.GridWorker):
+		the model is sent once, then each step only exchanges the inputs and the result tables'''
+		if len(self.simulators) == 1: # convergence failures are handled by the retries of solve_powerflow
+			for simulator in self.simulators.values():
+				run_powerflow(simulator)
+			return
+
+		if not self._workers: # the models already hold the inputs of this step, applying them again is harmless
+			self._workers = {grid_idx: GridWorker(simulator, make_eid('grid', grid_idx))
+							 for grid_idx, simulator in self.simulators.items()}
+		for grid_idx, worker in self._workers.items():
+			worker.submit(grid_inputs[grid_idx], price)
+		for grid_idx, worker in self._workers.items():
+			self.simulators[grid_idx].import_results(*worker.result())
 
 	def get_data(self, outputs):
+		'''serves the attributes declared in meta for the grid and its entities, the results are read from the result
+		snapshot of the step (see GridModule.ResultSnapshot) that only extracts the requested attributes'''
 		data = {}
-		
+
 		for eid, attrs in outputs.items():
 			data[eid] = {}
+			simulator = self.simulators[self._entity_grid[eid]]
+			results = simulator.results_snapshot()
+			if eid in self._entities:
+				model = self._entities[eid]['etype']
+			else:
+				model = 'Grid'
 			for attr in attrs:
-				if attr not in ['P_rt', 'results']:
+				if attr not in self.meta['models'][model]['attrs']:
 					raise ValueError('Unknown output attribute "%s"' % attr)
-				if attr == 'P_rt':
-					data[eid][attr] = self.simulator.net.res_ext_grid.values[0][0]
+				if model != 'Grid':
+					data[eid][attr] = results.get(eid, attr)
+				elif attr == 'P_rt':
+					if self._events.get(self._entity_grid[eid]) == 'P_rt': # after a power flow only
+						data[eid][attr] = results.get(simulator.slack_eid, 'p_mw')
+				elif attr == 'P_buses':
+					if self._events.get(self._entity_grid[eid]) == 'P_rt':
+						data[eid][attr] = simulator.bus_powers().tolist()
+				elif attr == 'flexibility':
+					if self._events.get(self._entity_grid[eid]) == 'P_rt':
+						data[eid][attr] = simulator.flexibility()
+				elif attr == 'results':
+					if self._events.get(self._entity_grid[eid]) == 'results': # after an opf only
+						data[eid][attr] = self._opf_data(self._entity_grid[eid])
+				elif attr == 'pf_status':
+					data[eid][attr] = simulator.pf_status
 				else:
 					data[eid][attr] = None
 
@@ -257,6 +372,28 @@ class GridApi(mosaik_api.Simulator):
 
 		return data
 
+	def _opf_data(self, grid_idx):
+		'''results of the last opf sent to the dso, P_opf is the power of the slack (nan when the opf failed)'''
+		simulator = self.simulators[grid_idx]
+		opf = self._opf[grid_idx]
+		data = simulator.opf_results()
+		data['converged'] = opf['converged']
+		data['iteration'] = opf['iteration']
+		data['P_opf'] = float(simulator.net.res_ext_grid.p_mw.values[0]) if opf['converged'] else float('nan')
+		return data
+
+	def finalize(self):
+		for grid_idx, simulator in self.simulators.items():
+			if simulator.result_cache is not None:
+				print('%s %s' % (make_eid('grid', grid_idx), simulator.result_cache.report()))
+				if grid_idx in self._workers: # the power flows were cached by the worker
+					print('%s power flows %s' % (make_eid('grid', grid_idx),
+												 self._workers[grid_idx].call('result_cache_report')))
+		for writer in self._writers.values():
+			writer.close()
+		for worker in self._workers.values():
+			worker.close()
+
 
 
 def main():
@@ -0,0 +1,65 @@
+import multiprocessing
+from .GridModule import step_powerflow
+
+
+class GridWorker(object):
+    """
+    Process holding the model of one grid for the whole simulation, so the grids step their power flows concurrently.
+
+    The model is handed to the process once, when the worker starts. After that every step only sends the inputs of
+    the entities and the grid price, and gets back the power flow status and the result tables (see
+    GridModule.step_powerflow). The warm start structures and the result cache of the grid stay in the worker.
+    The model of the simulator keeps the same inputs (for the opf and the get_data) and takes the results with
+    pandapower.import_results.
+    """
+
+    def __init__(self, model, name='grid-worker'):
+        self._conn, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve, args=(child, model), name=name, daemon=True)
+        self._process.start()
+        child.close()
+
+    def submit(self, inputs, price):
+        """starts the power flow of a step, the results are read with result"""
+        self._conn.send(('step', (inputs, price)))
+
+    def result(self):
+        """(status, results) of the step submitted"""
+        return self._reply()
+
+    def call(self, method):
+        """calls a method without arguments of the model of the worker (e.g. the report of its result cache)"""
+        self._conn.send(('call', method))
+        return self._reply()
+
+    def close(self):
+        if self._process is None:
+            return
+        self._conn.send(None)
+        self._process.join()
+        self._conn.close()
+        self._process = None
+
+    def _reply(self):
+        ok, value = self._conn.recv()
+        if not ok:
+            raise value
+        return value
+
+
+def _serve(conn, model):
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        command, args = message
+        try:
+            if command == 'step':
+                reply = step_powerflow(model, *args)
+            else:
+                reply = getattr(model, args)()
+        except Exception as e:
+            conn.send((False, e))
+            continue
+        conn.send((True, reply))
+    conn.close()
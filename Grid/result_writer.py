@@ -0,0 +1,136 @@
+import os
+import json
+import queue
+import threading
+import numpy as np
+import pandas as pd
+
+
+class ResultWriter(object):
+    """
+    Streaming sink of the grid results, replaces the .xls OutputWriter for long simulations.
+
+    Every append copies the selected result columns of the net into preallocated chunk buffers (one row per step),
+    full chunks are handed to a background thread that writes them as compressed column files::
+
+        <path>/
+            manifest.json         # variables and chunks written
+            chunk_000000.npz      # time, and per variable the values (steps x elements) and the element index
+
+    Memory is bounded: at most max_pending chunks wait for the writer thread, append blocks beyond that.
+    The elements of a table are fixed within a chunk, when their number changes (e.g. loads created by the
+    inputs) the chunk is closed and a new one starts. Results are read back with read_results.
+    """
+
+    def __init__(self, path, variables, chunk_size=168, max_pending=4):
+        """
+        :param path: folder of the results
+        :param variables: list of (result table, column) to log e.g. [('res_bus', 'vm_pu')]
+        :param chunk_size: steps per chunk
+        :param max_pending: chunks waiting to be written before append blocks
+        """
+        self.path = path
+        self.variables = [tuple(v) for v in variables]
+        self.chunk_size = chunk_size
+        self.chunks = []
+        self._buffer = None
+        self._error = None
+        self._queue = queue.Queue(maxsize=max_pending)
+        os.makedirs(path, exist_ok=True)
+        self._thread = threading.Thread(target=self._write_loop, name='grid-result-writer', daemon=True)
+        self._thread.start()
+
+    def append(self, time, net):
+        """stores the results of the net at time"""
+        if self._error is not None:
+            raise self._error
+        if self._buffer is not None and not self._same_elements(net):
+            self._flush()
+        if self._buffer is None:
+            self._new_buffer(net)
+        buffer = self._buffer
+        n = buffer['n']
+        buffer['time'][n] = time
+        for table, column in self.variables:
+            res = net[table]
+            if len(res) and column in res:
+                buffer['values'][(table, column)][n] = res[column].values
+        buffer['n'] = n + 1
+        if buffer['n'] == self.chunk_size:
+            self._flush()
+
+    def close(self):
+        """writes the last chunk and waits for the writer thread"""
+        if self._thread is None:
+            return
+        if self._buffer is not None:
+            self._flush()
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._write_manifest()
+        if self._error is not None:
+            raise self._error
+
+    def _new_buffer(self, net):
+        index, values = {}, {}
+        for table, column in self.variables:
+            index[table] = net[table].index.values.copy()
+            values[(table, column)] = np.full((self.chunk_size, len(index[table])), np.nan)
+        self._buffer = {'n': 0, 'time': np.zeros(self.chunk_size), 'index': index, 'values': values}
+
+    def _same_elements(self, net):
+        index = self._buffer['index']
+        return all(len(net[table]) == len(index[table]) for table in index)
+
+    def _flush(self):
+        buffer, self._buffer = self._buffer, None
+        n = buffer['n']
+        if n == 0:
+            return
+        name = 'chunk_%06d.npz' % len(self.chunks)
+        self.chunks.append(name)
+        arrays = {'time': buffer['time'][:n]}
+        for (table, column), values in buffer['values'].items():
+            arrays['%s.%s' % (table, column)] = values[:n]
+            arrays['%s.%s.index' % (table, column)] = buffer['index'][table]
+        self._queue.put((name, arrays)) # blocks when max_pending chunks are waiting
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self._error is not None:
+                continue
+            name, arrays = item
+            try:
+                np.savez_compressed(os.path.join(self.path, name), **arrays)
+            except Exception as e:
+                self._error = e
+
+    def _write_manifest(self):
+        manifest = {'variables': ['%s.%s' % v for v in self.variables], 'chunks': self.chunks}
+        with open(os.path.join(self.path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=1)
+
+
+def read_results(path, variables=None):
+    """
+    reads the results written by a ResultWriter
+
+    :param variables: names of the variables to read e.g. ['res_bus.vm_pu'], all by default
+    :return: {variable: DataFrame (time x elements)}
+    """
+    with open(os.path.join(path, 'manifest.json')) as f:
+        manifest = json.load(f)
+    if variables is None:
+        variables = manifest['variables']
+    frames = {variable: [] for variable in variables}
+    for name in manifest['chunks']:
+        with np.load(os.path.join(path, name)) as chunk:
+            time = chunk['time']
+            for variable in variables:
+                frames[variable].append(pd.DataFrame(chunk[variable], index=time,
+                                                     columns=chunk[variable + '.index']))
+    return {variable: pd.concat(chunks) if chunks else pd.DataFrame() for variable, chunks in frames.items()}
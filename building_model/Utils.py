@@ -1,22 +1,130 @@
-import sys 
+import sys
 sys.path.append('building_model/')
+import os
+import json
+import pickle
 import numpy as np
 from config import *
 import pandas as pd
+try:
+	from collections.abc import MutableMapping
+except ImportError:
+	from collections import MutableMapping
 
-def tsd_log_initilizer(building_names, building_properties, weather, locator):
+
+# time step data (tsd) variables, initialized with nan values
+TSD_KEYS_WEATHER = {'T_ext': 'drybulb_C',
+					'T_ext_wetbulb': 'wetbulb_C',
+					'rh_ext': 'relhum_percent',
+					'T_sky': 'skytemp_C',
+					'u_wind': 'windspd_ms'}
+TSD_KEYS_ELECTRICITY = ['Eaux', 'Eaux_hs', 'Eaux_cs', 'Eaux_ww', 'Eaux_fw', 'Ehs_lat_aux',
+						'Eve',
+						'GRID',
+						'GRID_a',
+						'GRID_l',
+						'GRID_v',
+						'GRID_ve',
+						'GRID_data',
+						'GRID_pro',
+						'GRID_aux',
+						'GRID_ww',
+						'GRID_hs',
+						'GRID_cs',
+						'GRID_cdata',
+						'GRID_cre',
+						'PV', 'Eal', 'Edata', 'Epro', 'E_sys',
+						'E_ww', 'E_hs','E_hs_prev', 'E_cs', 'E_cre', 'E_cdata']
+TSD_KEYS_INTERNAL_LOADS = ['Ea', 'El', 'Ev']
+TSD_KEYS_FUELS_AND_FLOWS = ['mcpww_sys', 'mcptw',
+							'mcpcre_sys',
+							'mcpcdata_sys',
+							'SOLAR_ww',
+							'SOLAR_hs',
+							'NG_hs',
+							'COAL_hs',
+							'OIL_hs',
+							'WOOD_hs',
+							'NG_ww',
+							'COAL_ww',
+							'OIL_ww',
+							'WOOD_ww',
+							'vfw_m3perh']
+TSD_KEYS_HEATING_LOADS = ['Qhs_sen_rc', 'Qhs_sen_shu', 'Qhs_sen_ahu', 'Qhs_lat_ahu', 'Qhs_sen_aru', 'Qhs_lat_aru',
+						  'Qhs_sen_sys', 'Qhs_lat_sys', 'Qhs_em_ls', 'Qhs_dis_ls', 'Qhs_sys_shu', 'Qhs_sys_ahu',
+						  'Qhs_sys_aru',
+						  'DH_hs', 'Qhs', 'Qhs_sys', 'QH_sys',
+						  'DH_ww', 'Qww_sys', 'Qww', 'Qhpro_sys']
+TSD_KEYS_COOLING_LOADS = ['Qcs_sen_rc', 'Qcs_sen_scu', 'Qcs_sen_ahu', 'Qcs_lat_ahu', 'Qcs_sen_aru', 'Qcs_lat_aru',
+						  'Qcs_sen_sys', 'Qcs_lat_sys', 'Qcs_em_ls', 'Qcs_dis_ls', 'Qcs_sys_scu', 'Qcs_sys_ahu',
+						  'Qcs_sys_aru',
+						  'DC_cs', 'Qcs', 'Qcs_sys', 'QC_sys',
+						  'DC_cre', 'Qcre_sys', 'Qcre',
+						  'DC_cdata', 'Qcdata_sys', 'Qcdata', 'Qcpro_sys']
+TSD_KEYS_HEATING_TEMP = ['ta_re_hs_ahu', 'ta_sup_hs_ahu', 'ta_re_hs_aru', 'ta_sup_hs_aru','ta_hs_set']
+TSD_KEYS_HEATING_FLOWS = ['ma_sup_hs_ahu', 'ma_sup_hs_aru']
+TSD_KEYS_COOLING_TEMP = ['ta_re_cs_ahu', 'ta_sup_cs_ahu', 'ta_re_cs_aru', 'ta_sup_cs_aru','ta_cs_set']
+TSD_KEYS_COOLING_FLOWS = ['ma_sup_cs_ahu', 'ma_sup_cs_aru']
+TSD_KEYS_COOLING_SUPPLY_FLOWS = ['mcpcs_sys_ahu', 'mcpcs_sys_aru', 'mcpcs_sys_scu', 'mcpcs_sys']
+TSD_KEYS_COOLING_SUPPLY_TEMP = ['Tcs_sys_re_ahu', 'Tcs_sys_re_aru', 'Tcs_sys_re_scu', 'Tcs_sys_sup_ahu',
+								'Tcs_sys_sup_aru',
+								'Tcs_sys_sup_scu', 'Tcs_sys_sup', 'Tcs_sys_re',
+								'Tcdata_sys_re', 'Tcdata_sys_sup',
+								'Tcre_sys_re', 'Tcre_sys_sup']
+TSD_KEYS_HEATING_SUPPLY_FLOWS = ['mcphs_sys_ahu', 'mcphs_sys_aru', 'mcphs_sys_shu', 'mcphs_sys']
+TSD_KEYS_HEATING_SUPPLY_TEMP = ['Ths_sys_re_ahu', 'Ths_sys_re_aru', 'Ths_sys_re_shu', 'Ths_sys_sup_ahu',
+								'Ths_sys_sup_aru',
+								'Ths_sys_sup_shu', 'Ths_sys_sup', 'Ths_sys_re',
+								'Tww_sys_sup', 'Tww_sys_re']
+TSD_KEYS_RC_TEMP = ['T_int','T_int_prev', 'theta_m', 'theta_c', 'theta_o', 'theta_ve_mech']
+TSD_KEYS_MOISTURE = ['x_int', 'x_ve_inf', 'x_ve_mech', 'g_hu_ld', 'g_dhu_ld']
+TSD_KEYS_VENTILATION_FLOWS = ['m_ve_window', 'm_ve_mech', 'm_ve_rec', 'm_ve_inf', 'm_ve_required']
+TSD_KEYS_ENERGY_BALANCE_DASHBOARD = ['Q_gain_sen_light', 'Q_gain_sen_app', 'Q_gain_sen_peop', 'Q_gain_sen_data',
+									 'Q_loss_sen_ref', 'Q_gain_sen_wall', 'Q_gain_sen_base', 'Q_gain_sen_roof',
+									 'Q_gain_sen_wind', 'Q_gain_sen_vent', 'Q_gain_lat_peop', 'Q_gain_sen_pro']
+TSD_KEYS_SOLAR = ['I_sol', 'I_rad', 'I_sol_and_I_rad']
+TSD_KEYS_PEOPLE = ['people', 've', 've_lps', 'Qs', 'w_int']
+
+# variable groups of the time step data, `FleetState` stores each group in one contiguous block
+TSD_GROUPS = {'weather': list(TSD_KEYS_WEATHER),
+			  'electricity': TSD_KEYS_ELECTRICITY + TSD_KEYS_INTERNAL_LOADS,
+			  'fuels_and_flows': TSD_KEYS_FUELS_AND_FLOWS,
+			  'heating_loads': TSD_KEYS_HEATING_LOADS,
+			  'cooling_loads': TSD_KEYS_COOLING_LOADS,
+			  'heating_temp': TSD_KEYS_HEATING_TEMP + TSD_KEYS_HEATING_FLOWS,
+			  'cooling_temp': TSD_KEYS_COOLING_TEMP + TSD_KEYS_COOLING_FLOWS,
+			  'heating_supply': TSD_KEYS_HEATING_SUPPLY_TEMP + TSD_KEYS_HEATING_SUPPLY_FLOWS,
+			  'cooling_supply': TSD_KEYS_COOLING_SUPPLY_TEMP + TSD_KEYS_COOLING_SUPPLY_FLOWS,
+			  'rc_temp': TSD_KEYS_RC_TEMP,
+			  'moisture': TSD_KEYS_MOISTURE,
+			  'ventilation_flows': TSD_KEYS_VENTILATION_FLOWS,
+			  'energy_balance_dashboard': TSD_KEYS_ENERGY_BALANCE_DASHBOARD,
+			  'solar': TSD_KEYS_SOLAR,
+			  'people': TSD_KEYS_PEOPLE}
+
+# system status logs, stored as codes of `SYS_STATUS_CODES` by `FleetState`
+TSD_KEYS_SYS_STATUS = ['sys_status_ahu', 'sys_status_aru', 'sys_status_sen']
+SYS_STATUS_CODES = ['unknown', 'no system', 'system off', 'Off', 'On', 'On:over heating', 'On:R', 'On:T', 'On:T/R']
+
+
+def tsd_log_initilizer(building_names, building_properties, weather, locator, fleet_state=None, fleet_state_ref=None):
+
+		if fleet_state is None:
+			fleet_state = FleetState(building_names)
+		if fleet_state_ref is None:
+			fleet_state_ref = FleetState(building_names)
 
 		tsd_log = {}
 		tsd_ref_log = {}
 		schedules_ref = {}
 		schedules = {}
 		for name in building_names:
-			
+
 			bpr = building_properties[name]
-			schedule, tsd = initialize_inputs(bpr, weather,locator)
-			_schedule, _tsd = initialize_inputs(bpr, weather, locator)
-			tsd_log[name] = tsd #a dict for all the parameters needed
-			schedules[name] = schedule #a dataframe with 8760 rows
+			schedule, tsd = initialize_inputs(bpr, weather,locator, fleet_state.building(name))
+			_schedule, _tsd = initialize_inputs(bpr, weather, locator, fleet_state_ref.building(name))
+			tsd_log[name] = tsd #a view on the fleet arrays for all the parameters needed
+			schedules[name] = schedule #a dict of arrays with 8760 values
 			tsd_ref_log[name] = _tsd
 			schedules_ref[name] = _schedule
 
@@ -29,7 +137,26 @@ def tsd_log_initilizer(building_names, building_properties, weather, locator):
 		#exit()
 		return schedules, tsd_log, tsd_ref_log, schedules_ref
 
-def initialize_inputs(bpr, weather, locator):
+def compile_schedules(occupancy_yearly_schedules, hours=HOURS_IN_YEAR):
+	"""
+	compiles the occupancy schedules of a building into typed arrays, so that the time step functions only need
+	plain array indexing (``schedules['X_gh'][t]``) instead of pandas label lookups.
+	Non numeric entries of the csv (the 'OFF' set points) are encoded as nan.
+
+	:param occupancy_yearly_schedules: the occupancy schedules of the building as read from the csv (one row per hour)
+	:type occupancy_yearly_schedules: pandas.DataFrame
+	:param hours: number of time steps to keep
+	:type hours: int
+	:returns: dict mapping the schedule column names to float arrays of length `hours`
+	:rtype: dict
+	"""
+	schedules = {}
+	for column in occupancy_yearly_schedules.columns:
+		values = pd.to_numeric(occupancy_yearly_schedules[column], errors='coerce')
+		schedules[column] = np.ascontiguousarray(values.values[:hours], dtype=np.float64)
+	return schedules
+
+def initialize_inputs(bpr, weather, locator, tsd=None):
 		"""
 		:param bpr: a collection of building properties for the building used for thermal loads calculation
 		:type bpr: BuildingPropertiesRow
@@ -40,7 +167,9 @@ def initialize_inputs(bpr, weather, locator):
 		:type date_range: pd.date_range
 		:param locator: the input locator
 		:type locator: cea.inpultlocator.InputLocator
-		:returns: one dict of schedules, one dict of time step data
+		:param tsd: time step data to fill (e.g. a view of a `FleetState`), a new dict is created if not given
+		:type tsd: dict
+		:returns: one dict of compiled schedules (see `compile_schedules`), one dict of time step data
 		:rtype: dict
 		"""
 		# TODO: documentation, this function is actually two functions
@@ -49,11 +178,11 @@ def initialize_inputs(bpr, weather, locator):
 		building_name = bpr.name
 
 		# this is used in the NN please do not erase or change!!
-		tsd = initialize_timestep_data(bpr, weather)
+		tsd = initialize_timestep_data(bpr, weather, tsd)
 
 		# get occupancy file è serie oraria per 8760
 		# baseline/outputs/data/occupancy
-		occupancy_yearly_schedules = pd.read_csv(locator.get_schedule_model_file(building_name))
+		occupancy_yearly_schedules = compile_schedules(pd.read_csv(locator.get_schedule_model_file(building_name)))
 
 		tsd['people'] = occupancy_yearly_schedules['people_pax']
 		tsd['ve_lps'] = occupancy_yearly_schedules['Ve_lps']
@@ -61,7 +190,7 @@ def initialize_inputs(bpr, weather, locator):
 
 		return occupancy_yearly_schedules, tsd
 
-def initialize_timestep_data(bpr, weather_data):
+def initialize_timestep_data(bpr, weather_data, tsd=None):
 	"""
 	initializes the time step data with the weather data and the minimum set of variables needed for computation.
 
@@ -70,114 +199,328 @@ def initialize_timestep_data(bpr, weather_data):
 	:param weather_data: data from the .epw weather file. Each row represents an hour of the year. The columns are:
 		``drybulb_C``, ``relhum_percent``, and ``windspd_ms``
 	:type weather_data: pandas.DataFrame
+	:param tsd: view of a `FleetState` to fill, already initialized with nan values and 'unknown' status. If not
+		given a new dict with one array per variable is created.
+	:type tsd: BuildingStateView
 
 	:return: returns the `tsd` variable, a dictionary of time step data mapping variable names to ndarrays for each hour of the year.
 	:rtype: dict
 	"""
 
-	# Initialize dict with weather variables
-	tsd = {'T_ext': weather_data.drybulb_C.values[:3000],
-		   'T_ext_wetbulb': weather_data.wetbulb_C.values[:3000],
-		   'rh_ext': weather_data.relhum_percent.values[:3000],
-		   'T_sky': weather_data.skytemp_C.values[:3000],
-		   'u_wind': weather_data.windspd_ms[:3000]}
-
-	# fill data with nan values
-
-	nan_fields_electricity = ['Eaux', 'Eaux_hs', 'Eaux_cs', 'Eaux_ww', 'Eaux_fw', 'Ehs_lat_aux',
-							  'Eve',
-							  'GRID',
-							  'GRID_a',
-							  'GRID_l',
-							  'GRID_v',
-							  'GRID_ve',
-							  'GRID_data',
-							  'GRID_pro',
-							  'GRID_aux',
-							  'GRID_ww',
-							  'GRID_hs',
-							  'GRID_cs',
-							  'GRID_cdata',
-							  'GRID_cre',
-							  'PV', 'Eal', 'Edata', 'Epro', 'E_sys',
-							  'E_ww', 'E_hs','E_hs_prev', 'E_cs', 'E_cre', 'E_cdata']
-	nan_fields = ['mcpww_sys', 'mcptw',
-				  'mcpcre_sys',
-				  'mcpcdata_sys',
-				  'SOLAR_ww',
-				  'SOLAR_hs',
-				  'NG_hs',
-				  'COAL_hs',
-				  'OIL_hs',
-				  'WOOD_hs',
-				  'NG_ww',
-				  'COAL_ww',
-				  'OIL_ww',
-				  'WOOD_ww',
-				  'vfw_m3perh']
-
-	TSD_KEYS_HEATING_LOADS = ['Qhs_sen_rc', 'Qhs_sen_shu', 'Qhs_sen_ahu', 'Qhs_lat_ahu', 'Qhs_sen_aru', 'Qhs_lat_aru',
-						  'Qhs_sen_sys', 'Qhs_lat_sys', 'Qhs_em_ls', 'Qhs_dis_ls', 'Qhs_sys_shu', 'Qhs_sys_ahu',
-						  'Qhs_sys_aru',
-						  'DH_hs', 'Qhs', 'Qhs_sys', 'QH_sys',
-						  'DH_ww', 'Qww_sys', 'Qww', 'Qhs', 'Qhpro_sys']
-	TSD_KEYS_COOLING_LOADS = ['Qcs_sen_rc', 'Qcs_sen_scu', 'Qcs_sen_ahu', 'Qcs_lat_ahu', 'Qcs_sen_aru', 'Qcs_lat_aru',
-							  'Qcs_sen_sys', 'Qcs_lat_sys', 'Qcs_em_ls', 'Qcs_dis_ls', 'Qcs_sys_scu', 'Qcs_sys_ahu',
-							  'Qcs_sys_aru',
-							  'DC_cs', 'Qcs', 'Qcs_sys', 'QC_sys',
-							  'DC_cre', 'Qcre_sys', 'Qcre',
-							  'DC_cdata', 'Qcdata_sys', 'Qcdata', 'Qcpro_sys']
-	TSD_KEYS_HEATING_TEMP = ['ta_re_hs_ahu', 'ta_sup_hs_ahu', 'ta_re_hs_aru', 'ta_sup_hs_aru','ta_hs_set']
-	TSD_KEYS_HEATING_FLOWS = ['ma_sup_hs_ahu', 'ma_sup_hs_aru']
-	TSD_KEYS_COOLING_TEMP = ['ta_re_cs_ahu', 'ta_sup_cs_ahu', 'ta_re_cs_aru', 'ta_sup_cs_aru','ta_cs_set']
-	TSD_KEYS_COOLING_FLOWS = ['ma_sup_cs_ahu', 'ma_sup_cs_aru']
-	TSD_KEYS_COOLING_SUPPLY_FLOWS = ['mcpcs_sys_ahu', 'mcpcs_sys_aru', 'mcpcs_sys_scu', 'mcpcs_sys']
-	TSD_KEYS_COOLING_SUPPLY_TEMP = ['Tcs_sys_re_ahu', 'Tcs_sys_re_aru', 'Tcs_sys_re_scu', 'Tcs_sys_sup_ahu',
-									'Tcs_sys_sup_aru',
-									'Tcs_sys_sup_scu', 'Tcs_sys_sup', 'Tcs_sys_re',
-									'Tcdata_sys_re', 'Tcdata_sys_sup',
-									'Tcre_sys_re', 'Tcre_sys_sup']
-	TSD_KEYS_HEATING_SUPPLY_FLOWS = ['mcphs_sys_ahu', 'mcphs_sys_aru', 'mcphs_sys_shu', 'mcphs_sys']
-	TSD_KEYS_HEATING_SUPPLY_TEMP = ['Ths_sys_re_ahu', 'Ths_sys_re_aru', 'Ths_sys_re_shu', 'Ths_sys_sup_ahu',
-									'Ths_sys_sup_aru',
-									'Ths_sys_sup_shu', 'Ths_sys_sup', 'Ths_sys_re',
-									'Tww_sys_sup', 'Tww_sys_re']
-	TSD_KEYS_RC_TEMP = ['T_int','T_int_prev', 'theta_m', 'theta_c', 'theta_o', 'theta_ve_mech']
-	TSD_KEYS_MOISTURE = ['x_int', 'x_ve_inf', 'x_ve_mech', 'g_hu_ld', 'g_dhu_ld']
-	TSD_KEYS_VENTILATION_FLOWS = ['m_ve_window', 'm_ve_mech', 'm_ve_rec', 'm_ve_inf', 'm_ve_required']
-	TSD_KEYS_ENERGY_BALANCE_DASHBOARD = ['Q_gain_sen_light', 'Q_gain_sen_app', 'Q_gain_sen_peop', 'Q_gain_sen_data',
-										 'Q_loss_sen_ref', 'Q_gain_sen_wall', 'Q_gain_sen_base', 'Q_gain_sen_roof',
-										 'Q_gain_sen_wind', 'Q_gain_sen_vent', 'Q_gain_lat_peop', 'Q_gain_sen_pro']
-	TSD_KEYS_SOLAR = ['I_sol', 'I_rad', 'I_sol_and_I_rad']
-	TSD_KEYS_PEOPLE = ['people', 've', 'Qs', 'w_int']
-
-
-	nan_fields.extend(TSD_KEYS_HEATING_LOADS)
-	nan_fields.extend(TSD_KEYS_COOLING_LOADS)
-	nan_fields.extend(TSD_KEYS_HEATING_TEMP)
-	nan_fields.extend(TSD_KEYS_COOLING_TEMP)
-	nan_fields.extend(TSD_KEYS_COOLING_FLOWS)
-	nan_fields.extend(TSD_KEYS_HEATING_FLOWS)
-	nan_fields.extend(TSD_KEYS_COOLING_SUPPLY_FLOWS)
-	nan_fields.extend(TSD_KEYS_COOLING_SUPPLY_TEMP)
-	nan_fields.extend(TSD_KEYS_HEATING_SUPPLY_FLOWS)
-	nan_fields.extend(TSD_KEYS_HEATING_SUPPLY_TEMP)
-	nan_fields.extend(TSD_KEYS_RC_TEMP)
-	nan_fields.extend(TSD_KEYS_MOISTURE)
-	nan_fields.extend(TSD_KEYS_ENERGY_BALANCE_DASHBOARD)
-	nan_fields.extend(TSD_KEYS_SOLAR)
-	nan_fields.extend(TSD_KEYS_VENTILATION_FLOWS)
-	nan_fields.extend(nan_fields_electricity)
-	nan_fields.extend(TSD_KEYS_PEOPLE)
-
-	tsd.update(dict((x, np.zeros(HOURS_IN_YEAR) * np.nan) for x in nan_fields))
-
-	# initialize system status log
-	tsd['sys_status_ahu'] = np.chararray(HOURS_IN_YEAR, itemsize=20)
-	tsd['sys_status_aru'] = np.chararray(HOURS_IN_YEAR, itemsize=20)
-	tsd['sys_status_sen'] = np.chararray(HOURS_IN_YEAR, itemsize=20)
-	tsd['sys_status_ahu'][:] = 'unknown'
-	tsd['sys_status_aru'][:] = 'unknown'
-	tsd['sys_status_sen'][:] = 'unknown'
+	if tsd is None:
+		# fill data with nan values
+		tsd = {}
+		for keys in TSD_GROUPS.values():
+			tsd.update(dict((x, np.zeros(HOURS_IN_YEAR) * np.nan) for x in keys))
+
+		# initialize system status log
+		for key in TSD_KEYS_SYS_STATUS:
+			tsd[key] = np.chararray(HOURS_IN_YEAR, itemsize=20)
+			tsd[key][:] = 'unknown'
+
+	# weather variables
+	for key, column in TSD_KEYS_WEATHER.items():
+		tsd[key] = weather_data[column].values[:HOURS_IN_YEAR]
 
 	return tsd
+
+
+class FleetState(object):
+	"""
+	Time step data of a fleet of buildings stored as struct-of-arrays: each variable group of `TSD_GROUPS` is one
+	contiguous float block of shape (variables, buildings, hours) and the system status logs are one int8 block of
+	codes. Variables can be processed column-wise across buildings with ``fleet['T_int'][:, t]``, while
+	``fleet.building(name)`` returns a `tsd`-like view so that ``tsd['X'][t]`` keeps working in the demand modules.
+	"""
+
+	def __init__(self, building_names, hours=HOURS_IN_YEAR, groups=None):
+		if groups is None:
+			groups = TSD_GROUPS
+		self.building_names = list(building_names)
+		self.building_index = dict((name, i) for i, name in enumerate(self.building_names))
+		self.hours = hours
+
+		n = len(self.building_names)
+		self.blocks = {}  # group name > ndarray (variables, buildings, hours)
+		self.keys = {}  # variable name > (group name, position in the block)
+		for group, keys in groups.items():
+			keys = [key for key in keys if key not in self.keys]
+			self.blocks[group] = np.full((len(keys), n, hours), np.nan)
+			for i, key in enumerate(keys):
+				self.keys[key] = (group, i)
+
+		self.status_codes = list(SYS_STATUS_CODES)
+		self.status_keys = dict((key, i) for i, key in enumerate(TSD_KEYS_SYS_STATUS))
+		self.status = np.zeros((len(TSD_KEYS_SYS_STATUS), n, hours), dtype=np.int8)  # all 'unknown'
+
+		# variables outside of the groups (e.g. set by a single module) are kept per building
+		self.extras = [{} for _ in range(n)]
+		self._views = {}  # building index > its BuildingStateView
+
+	def __len__(self):
+		return len(self.building_names)
+
+	def __contains__(self, key):
+		return key in self.keys
+
+	def __getitem__(self, key):
+		"""return the (buildings, hours) array of a variable"""
+		group, i = self.keys[key]
+		return self.blocks[group][i]
+
+	def building(self, name):
+		"""return the `tsd` of a building as a view on the fleet arrays"""
+		index = self.building_index[name]
+		view = self._views.get(index)
+		if view is None:
+			view = self._views[index] = BuildingStateView(self, index)
+		return view
+
+	def _refresh_views(self):
+		"""rebuilds the rows of the views of the buildings after the blocks were replaced"""
+		for view in self._views.values():
+			view.refresh()
+
+	def encode_status(self, status):
+		if isinstance(status, bytes):
+			status = status.decode()
+		try:
+			return self.status_codes.index(status)
+		except ValueError:
+			self.status_codes.append(status)
+			return len(self.status_codes) - 1
+
+	def decode_status(self, codes):
+		return np.array(self.status_codes, dtype=object)[codes]
+
+	def share_memory(self):
+		"""
+		moves the blocks into shared memory and returns a picklable handle, so that worker processes can fill them in
+		place with `FleetState.attach_shared` instead of pickling their results back. Call `release_shared_memory` when
+		the workers are done.
+
+		:rtype: dict
+		"""
+		from multiprocessing import shared_memory
+
+		self._shared_memory = []
+		segments = {}
+		for group, block in list(self.blocks.items()) + [(None, self.status)]:
+			shm = shared_memory.SharedMemory(create=True, size=max(block.nbytes, 1))
+			shared = np.ndarray(block.shape, dtype=block.dtype, buffer=shm.buf)
+			shared[...] = block
+			if group is None:
+				self.status = shared
+			else:
+				self.blocks[group] = shared
+			self._shared_memory.append(shm)
+			segments[group] = (shm.name, block.shape, block.dtype.str)
+		self._refresh_views()
+
+		return {'building_names': self.building_names,
+				'hours': self.hours,
+				'keys': self.keys,
+				'status_codes': self.status_codes,
+				'status_keys': self.status_keys,
+				'extras': self.extras,
+				'segments': segments}
+
+	@classmethod
+	def attach_shared(cls, handle):
+		"""
+		returns the fleet whose blocks were shared with `share_memory`, to be called in the worker processes
+
+		:param handle: the handle returned by `share_memory`
+		:type handle: dict
+		:rtype: FleetState
+		"""
+		from multiprocessing import shared_memory
+
+		fleet = cls.__new__(cls)
+		fleet.building_names = handle['building_names']
+		fleet.building_index = dict((name, i) for i, name in enumerate(fleet.building_names))
+		fleet.hours = handle['hours']
+		fleet.keys = handle['keys']
+		fleet.status_codes = list(handle['status_codes'])
+		fleet.status_keys = handle['status_keys']
+		fleet.extras = [dict(extras) for extras in handle['extras']]
+		fleet.blocks = {}
+		fleet._views = {}
+		fleet._shared_memory = []
+		for group, (name, shape, dtype) in handle['segments'].items():
+			# the pool workers share the resource tracker of the process that created the segments, which unlinks them
+			shm = shared_memory.SharedMemory(name=name)
+			block = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+			if group is None:
+				fleet.status = block
+			else:
+				fleet.blocks[group] = block
+			fleet._shared_memory.append(shm)
+		return fleet
+
+	def release_shared_memory(self):
+		"""copies the blocks back from shared memory (see `share_memory`) and frees the segments"""
+		shared_memory = getattr(self, '_shared_memory', None)
+		if not shared_memory:
+			return
+		for group in self.blocks:
+			self.blocks[group] = np.array(self.blocks[group])
+		self.status = np.array(self.status)
+		self._refresh_views()
+		for shm in shared_memory:
+			shm.close()
+			shm.unlink()
+		self._shared_memory = []
+
+	def merge_status_codes(self, index, status_codes):
+		"""
+		re-encodes the status logs of building `index`, written by another process with its own `status_codes`
+
+		:param index: position of the building in the fleet
+		:type index: int
+		:param status_codes: the status codes of the other process
+		:type status_codes: list
+		"""
+		if list(status_codes) == self.status_codes:
+			return
+		codes = np.array([self.encode_status(status) for status in status_codes], dtype=np.int8)
+		self.status[:, index] = codes[self.status[:, index]]
+
+	def save(self, path):
+		"""
+		saves the fleet in the folder `path`: one .npy file per block, the layout in fleet.json and the variables outside
+		of the groups in extras.pickle
+
+		:param path: folder of the fleet, created if it does not exist
+		:type path: str
+		"""
+		if not os.path.exists(path):
+			os.makedirs(path)
+		groups = {}
+		for group, block in self.blocks.items():
+			np.save(os.path.join(path, '%s.npy' % group), block)
+			groups[group] = sorted((key for key, (g, i) in self.keys.items() if g == group),
+								   key=lambda key: self.keys[key][1])
+		np.save(os.path.join(path, 'status.npy'), self.status)
+		layout = {'building_names': self.building_names,
+				  'hours': self.hours,
+				  'groups': groups,
+				  'status_codes': self.status_codes,
+				  'status_keys': sorted(self.status_keys, key=self.status_keys.get)}
+		with open(os.path.join(path, 'fleet.json'), 'w') as f:
+			json.dump(layout, f)
+		with open(os.path.join(path, 'extras.pickle'), 'wb') as f:
+			pickle.dump(self.extras, f, pickle.HIGHEST_PROTOCOL)
+
+	@classmethod
+	def load(cls, path, mmap_mode='c'):
+		"""
+		loads a fleet saved with `FleetState.save`, the blocks are memory mapped
+
+		:param path: folder of the fleet
+		:type path: str
+		:param mmap_mode: mode of `numpy.load`, the default 'c' (copy-on-write) reads the blocks lazily and keeps the
+			changes of the simulation in memory without touching the files. None loads the blocks in memory.
+		:type mmap_mode: str
+		:rtype: FleetState
+		"""
+		with open(os.path.join(path, 'fleet.json')) as f:
+			layout = json.load(f)
+		fleet = cls.__new__(cls)
+		fleet.building_names = layout['building_names']
+		fleet.building_index = dict((name, i) for i, name in enumerate(fleet.building_names))
+		fleet.hours = layout['hours']
+		fleet.blocks = {}
+		fleet.keys = {}
+		fleet._views = {}
+		for group, keys in layout['groups'].items():
+			fleet.blocks[group] = np.load(os.path.join(path, '%s.npy' % group), mmap_mode=mmap_mode)
+			for i, key in enumerate(keys):
+				fleet.keys[key] = (group, i)
+		fleet.status_codes = layout['status_codes']
+		fleet.status_keys = dict((key, i) for i, key in enumerate(layout['status_keys']))
+		fleet.status = np.load(os.path.join(path, 'status.npy'), mmap_mode=mmap_mode)
+		with open(os.path.join(path, 'extras.pickle'), 'rb') as f:
+			fleet.extras = pickle.load(f)
+		return fleet
+
+
+class BuildingStateView(MutableMapping):
+	"""
+	`tsd` of one building of a `FleetState`. Reading a variable returns a view on the fleet arrays, assigning a whole
+	variable copies the values into them (truncated to the hours of the fleet, the remainder filled with nan).
+	The rows of the building are kept in `rows`, rebuilt with `refresh` when the fleet replaces its blocks.
+	"""
+
+	def __init__(self, fleet, index):
+		self.fleet = fleet
+		self.index = index
+		self.refresh()
+
+	def refresh(self):
+		fleet = self.fleet
+		self.rows = dict((key, fleet.blocks[group][i, self.index]) for key, (group, i) in fleet.keys.items())
+		self.rows.update((key, StatusLogView(fleet, i, self.index)) for key, i in fleet.status_keys.items())
+
+	@property
+	def name(self):
+		return self.fleet.building_names[self.index]
+
+	def __getitem__(self, key):
+		try:
+			return self.rows[key]
+		except KeyError:
+			return self.fleet.extras[self.index][key]
+
+	def __setitem__(self, key, value):
+		fleet = self.fleet
+		if key in fleet.keys:
+			row = self.rows[key]
+			values = np.asarray(value, dtype=float)
+			if values.ndim == 0:
+				row[:] = values
+			elif not np.shares_memory(row, values):
+				n = min(len(values), fleet.hours)
+				row[:n] = values[:n]
+				row[n:] = np.nan
+		elif key in fleet.status_keys:
+			self.rows[key][:] = value
+		else:
+			fleet.extras[self.index][key] = value
+
+	def __delitem__(self, key):
+		del self.fleet.extras[self.index][key]
+
+	def __iter__(self):
+		for key in self.fleet.keys:
+			yield key
+		for key in self.fleet.status_keys:
+			yield key
+		for key in self.fleet.extras[self.index]:
+			yield key
+
+	def __len__(self):
+		return len(self.fleet.keys) + len(self.fleet.status_keys) + len(self.fleet.extras[self.index])
+
+
+class StatusLogView(object):
+	"""system status log of one building, reads and writes strings while the fleet stores int8 codes"""
+
+	def __init__(self, fleet, status_index, index):
+		self.fleet = fleet
+		self.codes = fleet.status[status_index, index]
+
+	def __len__(self):
+		return len(self.codes)
+
+	def __getitem__(self, t):
+		codes = self.codes[t]
+		if np.ndim(codes) == 0:
+			return self.fleet.status_codes[codes]
+		return self.fleet.decode_status(codes)
+
+	def __setitem__(self, t, status):
+		if isinstance(status, (str, bytes)):
+			self.codes[t] = self.fleet.encode_status(status)
+		else:
+			self.codes[t] = [self.fleet.encode_status(s) for s in status]
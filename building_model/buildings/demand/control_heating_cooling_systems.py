@@ -8,7 +8,9 @@ import numpy as np
 import pandas as pd
 import datetime
 from cea.constants import HOURS_IN_YEAR, SECONDS_PER_HOUR
+from config import SEC_IN_TS, SEC_IN_DAY, DAY_IN_YEAR
 import math
+import weakref
 
 __author__ = "Gabriel Happle"
 __copyright__ = "Copyright 2016, Architecture and Building Systems - ETH Zurich"
@@ -285,99 +287,173 @@ def convert_date_to_hour(date):
 
 
 #DONE >>>> limit to one year
-def is_heating_season(t, bpr):
+def convert_date_to_step(date, seconds_in_step=SEC_IN_TS):
     """
-    checks if time step is part of the heating season for the building
+    converts date in 'DD|MM' format into the time step of the year (first time step of the day)
+    i.e. '02|01' results in 24 for hourly and in 96 for 15 min time steps
 
-    :param t: hour of the year, simulation time step [0...HOURS_IN_YEAR]
-    :type t: int
-    :param bpr: BuildingPropertiesRow
-    :type bpr: cea.demand.building_properties.BuildingPropertiesRow
-    :return: True or False
-    :rtype: bool
+    :param date: date in 'DD|MM' format (from .xlsx database input)
+    :type date: str
+    :param seconds_in_step: length of the simulation time step [s]
+    :type seconds_in_step: int
+    :return: time step of the year (first time step of the day)
+    :rtype: int
     """
+    return convert_date_to_hour(date) * SECONDS_PER_HOUR // seconds_in_step
 
-    if bpr.hvac['has-heating-season']:
-        #DONE
 
-        #heating_start = convert_date_to_hour(bpr.hvac['heat_starts'])
-        #heating_end = convert_date_to_hour(bpr.hvac['heat_ends']) + 23  # end at the last hour of the day
+def calc_season_mask(has_season, season_start, season_end, seconds_in_step=SEC_IN_TS):
+    """
+    calculates for every time step of the year whether it is part of a (heating or cooling) season
 
+    :param has_season: whether the building has the season at all
+    :type has_season: bool
+    :param season_start: first day of the season in 'DD|MM' format
+    :type season_start: str
+    :param season_end: last day of the season in 'DD|MM' format
+    :type season_end: str
+    :param seconds_in_step: length of the simulation time step [s]
+    :type seconds_in_step: int
+    :return: boolean array with one value per time step of the year
+    :rtype: ndarray
+    """
+    steps_in_day = SEC_IN_DAY // seconds_in_step
+    mask = np.zeros(DAY_IN_YEAR * steps_in_day, dtype=bool)
+    if not has_season:
+        return mask
 
-        #TO USE FOR 15 min
-        heating_start = convert_date_to_hour(bpr.hvac['heat_start'])
-        heating_end = convert_date_to_hour(bpr.hvac['heat_ends']) + (23*4)  # end at the last hour of the day
+    start = convert_date_to_step(season_start, seconds_in_step)
+    end = convert_date_to_step(season_end, seconds_in_step) + steps_in_day - 1  # end at the last step of the day
 
-        
-        #TODO
-        # check if heating season is at the end of the year (north hemisphere) or in the middle of the year (south)
-        if heating_start < heating_end and \
-                heating_start <= t <= heating_end:
-           
-            # heating season time on south hemisphere
-            return True
+    if start < end:
+        # season in the middle of the year
+        mask[start:end + 1] = True
+    elif start > end:
+        # season over the year end
+        mask[start:] = True
+        mask[:end + 1] = True
+    return mask
 
-        elif heating_start > heating_end and \
-                (heating_start <= t <= HOURS_IN_YEAR or 0 <= t <= heating_end):
-         
-            # heating season over the year end (north hemisphere)
-            return True
 
-        else:
-            # not time of heating season
-           
-            return False
+def calc_season_table(bpr, seconds_in_step=SEC_IN_TS):
+    """
+    calculates the heating and cooling season masks of a building from `bpr.hvac`
 
-        
+    :param bpr: BuildingPropertiesRow
+    :type bpr: cea.demand.building_properties.BuildingPropertiesRow
+    :param seconds_in_step: length of the simulation time step [s]
+    :type seconds_in_step: int
+    :return: dict with the boolean arrays 'heating' and 'cooling'
+    :rtype: dict
+    """
+    return {'heating': calc_season_mask(bpr.hvac['has-heating-season'], bpr.hvac['heat_start'],
+                                        bpr.hvac['heat_ends'], seconds_in_step),
+            'cooling': calc_season_mask(bpr.hvac['has-cooling-season'], bpr.hvac['cool_start'],
+                                        bpr.hvac['cool_ends'], seconds_in_step)}
 
-    elif not bpr.hvac['has-heating-season']:
-        # no heating season
-        return False
+
+# season tables by season of the hvac: (has-heating-season, heat_start, heat_ends, has-cooling-season, cool_start,
+# cool_ends) > table. Keyed by value and kept out of the building properties, so they are never pickled with them
+_SEASON_TABLES = {}
+
+def get_season_table(bpr):
+    """
+    returns the season table of the building, it is calculated at the first call and then kept in `_SEASON_TABLES`
+    for all the buildings with the same seasons
+
+    :param bpr: BuildingPropertiesRow
+    :type bpr: cea.demand.building_properties.BuildingPropertiesRow
+    :return: dict with the boolean arrays 'heating' and 'cooling' (see `calc_season_table`)
+    :rtype: dict
+    """
+    hvac = bpr.hvac
+    key = tuple(hvac[column] for column in ['has-heating-season', 'heat_start', 'heat_ends',
+                                            'has-cooling-season', 'cool_start', 'cool_ends'])
+    season_table = _SEASON_TABLES.get(key)
+    if season_table is None:
+        season_table = _SEASON_TABLES[key] = calc_season_table(bpr)
+    return season_table
+
+
+#DONE >>>> limit to one year
+def is_heating_season(t, bpr):
+    """
+    checks if time step is part of the heating season for the building
+
+    :param t: time step of the year, simulation time step [0...HOURS_IN_YEAR]
+    :type t: int
+    :param bpr: BuildingPropertiesRow
+    :type bpr: cea.demand.building_properties.BuildingPropertiesRow
+    :return: True or False
+    :rtype: bool
+    """
+    heating = get_season_table(bpr)['heating']
+    return bool(heating[t % len(heating)])
 
 #DONE >>>> limit to one year
 def is_cooling_season(t, bpr):
     """
     checks if time step is part of the cooling season for the building
 
-    :param t: hour of the year, simulation time step [0...HOURS_IN_YEAR]
+    :param t: time step of the year, simulation time step [0...HOURS_IN_YEAR]
     :type t: int
     :param bpr: BuildingPropertiesRow
     :type bpr: cea.demand.building_properties.BuildingPropertiesRow
     :return: True or False
     :rtype: bool
-        """
-
-    if bpr.hvac['has-cooling-season']:
+    """
+    cooling = get_season_table(bpr)['cooling']
+    return bool(cooling[t % len(cooling)])
 
-        #cooling_start = convert_date_to_hour(bpr.hvac['cool_starts'])
-        #cooling_end = convert_date_to_hour(bpr.hvac['cool_ends']) + 23  # end at the last hour of the day
-        
-        #TO USE FOR 15 min
-        cooling_start = convert_date_to_hour(bpr.hvac['cool_start'])
-        cooling_end = convert_date_to_hour(bpr.hvac['cool_ends']) + (23*4)  # end at the last hour of the day
+# temperature controllers
 
+# set point tables of the live schedules: (building name, ids of the set point arrays) > (weak references to the
+# arrays, table). Kept per process and out of the building properties, so they are never pickled with them
+_SETPOINT_TABLES = {}
 
-        # check if cooling season is at the end of the year (south hemisphere) or in the middle of the year (north)
-        if cooling_start < cooling_end and \
-                cooling_start <= t <= cooling_end:
+def calc_setpoint_table(bpr, schedules):
+    """
+    calculates the heating and cooling set points of every time step of the schedules, nan outside of the season
+    or when the set point is off (nan in the compiled schedules)
 
-            # cooling season time on north hemisphere
-            return True
+    :param bpr: BuildingPropertiesRow
+    :type bpr: cea.demand.building_properties.BuildingPropertiesRow
+    :param schedules: the compiled schedules of the building (see `Utils.compile_schedules`)
+    :type schedules: dict
+    :return: dict with the float arrays 'ta_hs_set' and 'ta_cs_set'
+    :rtype: dict
+    """
+    season_table = get_season_table(bpr)
+    steps = np.arange(len(schedules['Ths_set_C']))
+    heating = season_table['heating'][steps % len(season_table['heating'])]
+    cooling = season_table['cooling'][steps % len(season_table['cooling'])]
+    return {'ta_hs_set': np.where(heating, schedules['Ths_set_C'], np.nan),
+            'ta_cs_set': np.where(cooling, schedules['Tcs_set_C'], np.nan)}
 
-        elif cooling_start > cooling_end and \
-                (cooling_start <= t <= HOURS_IN_YEAR or 0 <= t <= cooling_end):
-            # cooling season around the year end (south hemisphere)
-            return True
 
-        else:
-            # not time of cooling season
-            return False
+def get_setpoint_table(bpr, schedules):
+    """
+    returns the set point table of the building for the given schedules, it is calculated at the first call and then
+    kept in `_SETPOINT_TABLES` for as long as the set point arrays of the schedules are alive
 
-    elif not bpr.hvac['has-cooling-season']:
-        # no cooling season
-        return False
+    :param bpr: BuildingPropertiesRow
+    :type bpr: cea.demand.building_properties.BuildingPropertiesRow
+    :param schedules: the compiled schedules of the building (see `Utils.compile_schedules`)
+    :type schedules: dict
+    :return: dict with the float arrays 'ta_hs_set' and 'ta_cs_set' (see `calc_setpoint_table`)
+    :rtype: dict
+    """
+    # the reference and the step simulation use their own schedules of the same building
+    heating, cooling = schedules['Ths_set_C'], schedules['Tcs_set_C']
+    key = (bpr.name, id(heating), id(cooling))
+    entry = _SETPOINT_TABLES.get(key)
+    if entry is None:
+        # the entry is dropped when one of the arrays is collected, before its id can be given to another array
+        drop = lambda _: _SETPOINT_TABLES.pop(key, None)
+        entry = (weakref.ref(heating, drop), weakref.ref(cooling, drop), calc_setpoint_table(bpr, schedules))
+        _SETPOINT_TABLES[key] = entry
+    return entry[2]
 
-# temperature controllers
 
 #DONE >>> limit one year
 def get_temperature_setpoints_incl_seasonality(tsd, bpr, schedules,t):
@@ -391,13 +467,10 @@ def get_temperature_setpoints_incl_seasonality(tsd, bpr, schedules,t):
     :return: tsd with updated columns
     :rtype: dict
     """
-    #TODO
-    hour_in_the_year = t #the equivalent position in the iterations for the hour of timestep
-    tsd['ta_hs_set'][t] = get_heating_system_set_point(hour_in_the_year ,schedules.loc[t,'Ths_set_C'],bpr)
-    
-    tsd['ta_cs_set'][t] = get_cooling_system_set_point(hour_in_the_year,schedules.loc[t,'Tcs_set_C'],bpr)
+    setpoint_table = get_setpoint_table(bpr, schedules)
+    tsd['ta_hs_set'][t] = setpoint_table['ta_hs_set'][t]
+    tsd['ta_cs_set'][t] = setpoint_table['ta_cs_set'][t]
 
-    
     return tsd
 
 #DONE >>>> limit to one year
@@ -416,10 +489,7 @@ def get_heating_system_set_point(t, Ths_set_C, bpr):
     
 
     if is_heating_season(t, bpr):
-        if Ths_set_C == 'OFF':
-            return np.nan
-        else:
-            return Ths_set_C
+        return Ths_set_C  # nan when off in the compiled schedules
     else:
         return np.nan  # huge so the system will be off
 
@@ -438,9 +508,6 @@ def get_cooling_system_set_point(t, Tcs_set_C, bpr):
     """
 
     if is_cooling_season(t, bpr):
-        if Tcs_set_C == 'OFF':
-            return np.nan
-        else:
-            return Tcs_set_C
+        return Tcs_set_C  # nan when off in the compiled schedules
     else:
         return np.nan  # huge so the system will be off
@@ -36,7 +36,7 @@ HOURS_OP = constants.HOURS_OP
 GR = constants.GR
 
 
-def calc_Eal_Epro(tsd, schedules):
+def calc_Eal_Epro(tsd, schedules, t=None):
     """
     Calculate final internal electrical loads (without auxiliary loads)
 
@@ -46,19 +46,29 @@ def calc_Eal_Epro(tsd, schedules):
     :param bpr: building properties
     :type bpr: cea.demand.thermal_loads.BuildingPropertiesRow
 
-    :param schedules: The list of schedules defined for the project - in the same order as `list_uses`
-    :type schedules: List[numpy.ndarray]
+    :param schedules: The compiled schedules of the building (see `Utils.compile_schedules`)
+    :type schedules: Dict[str, numpy.ndarray]
+
+    :param t: time step to fill, the whole year is filled if not given
+    :type t: int
 
     :returns: `tsd` with new keys: `['Eaf', 'Elf', 'Ealf']`
     :rtype: Dict[str, numpy.ndarray]
     """
 
     # calculate final electrical consumption due to appliances and lights in W
-    tsd['Ea'] = schedules['Ea_W']
-    tsd['El'] = schedules['El_W']
-    tsd['Ev'] = schedules['Ev_W']
-    tsd['Eal'] = schedules['El_W'] + schedules['Ea_W']
-    tsd['Epro'] = schedules['Epro_W']
+    if t is None:
+        tsd['Ea'] = schedules['Ea_W']
+        tsd['El'] = schedules['El_W']
+        tsd['Ev'] = schedules['Ev_W']
+        tsd['Eal'] = schedules['El_W'] + schedules['Ea_W']
+        tsd['Epro'] = schedules['Epro_W']
+    else:
+        tsd['Ea'][t] = schedules['Ea_W'][t]
+        tsd['El'][t] = schedules['El_W'][t]
+        tsd['Ev'][t] = schedules['Ev_W'][t]
+        tsd['Eal'][t] = schedules['El_W'][t] + schedules['Ea_W'][t]
+        tsd['Epro'][t] = schedules['Epro_W'][t]
 
     return tsd
 
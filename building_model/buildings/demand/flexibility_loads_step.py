@@ -28,7 +28,7 @@ def calc_flexibility_loads_step(building_name, bpr, locator,use_dynamic_infiltra
 	#only working for heating season  with emission system supplied by electricity E_hs
 
 	#print('time-step: %i ********'%t)
-	tsd = electrical_loads.calc_Eal_Epro(tsd, schedules) #serve per riempire tsd['El'] e simili
+	tsd = electrical_loads.calc_Eal_Epro(tsd, schedules, t) #serve per riempire tsd['El'] e simili
 	# CALCULATE SPACE CONDITIONING DEMANDS
 	#lascio gli np.zeros perche tanto questo non ha impianti hvac
 	# if np.isclose(bpr.rc_model['Af'], 0.0):  # if building does not have conditioned area
@@ -80,8 +80,8 @@ def calc_set_points(bpr, tsd, building_name, config, locator,
 	else:
 		tsd['T_int'][t] = tsd['T_int'][t-1]
 
-	#T_hs_set = control_heating_cooling_systems.get_heating_system_set_point(t ,schedules.loc[t,'Ths_set_C'],bpr)
-	#T_cs_set = control_heating_cooling_systems.get_cooling_system_set_point(t,schedules.loc[t,'Tcs_set_C'],bpr)
+	#T_hs_set = control_heating_cooling_systems.get_heating_system_set_point(t ,schedules['Ths_set_C'][t],bpr)
+	#T_cs_set = control_heating_cooling_systems.get_cooling_system_set_point(t,schedules['Tcs_set_C'][t],bpr)
 	#le possibilità di setpoint sono 3 una temperatura, un nan perchè OFF o un nan perchè boh
 
 	if control_heating_cooling_systems.is_heating_season(t, bpr):
@@ -407,8 +407,8 @@ def calc_Qgain_lat(tsd, schedules, t):
     # Refactored from CalcThermalLoads
     """
 
-    :param schedules: The list of schedules defined for the project - in the same order as `list_uses`
-    :type schedules: list[ndarray[float]]
+    :param schedules: The compiled schedules of the building (see `Utils.compile_schedules`)
+    :type schedules: dict[str, ndarray[float]]
 
     :return w_int: yearly schedule
 
@@ -418,7 +418,7 @@ def calc_Qgain_lat(tsd, schedules, t):
     HOURS_PER_SEC = 1 / SECONDS_PER_HOUR
 
 
-    tsd['w_int'][t] = schedules.loc[t,'X_gh'] * KG_PER_GRAM * HOURS_PER_SEC # kg/s
+    tsd['w_int'][t] = schedules['X_gh'][t] * KG_PER_GRAM * HOURS_PER_SEC # kg/s
     tsd['Q_gain_lat_peop'][t] = tsd['w_int'][t] * H_WE # (J/s = W)
 
     return tsd
@@ -688,6 +688,214 @@ def _calc_rc_model_temperatures(Eaf, Elf, Epro, Htr_op, Htr_w, I_sol, Qs, T_ext,
     theta_o = calc_theta_o(T_int=T_int, theta_c=theta_c)
     return T_int, theta_c, theta_m, theta_o, theta_ea, theta_ec, theta_em, h_ea, h_ec, h_em, h_op_m
 
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# 2.3.2 vectorized over a fleet of buildings
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+# keys of `tsd` needed by the R-C-Model at each time step
+RC_MODEL_FLEET_INPUTS = ['El', 'Ea', 'Epro', 'I_sol_and_I_rad', 'T_ext', 'theta_ve_mech', 'Qs', 'm_ve_mech',
+                         'm_ve_window', 'm_ve_inf']
+
+
+def get_rc_model_fleet_properties(bprs):
+    """
+    Collects the R-C-Model properties of a fleet of buildings into arrays (one entry per building) and computes the
+    conductances and distribution factors of SIA 2044 that do not change over time. Meant to be called once per
+    fleet, the result is used by `calc_rc_model_temperatures_fleet` at every time step.
+
+    :param bprs: Building Properties of each building of the fleet
+    :type bprs: list[BuildingPropertiesRow]
+    :return: R-C-Model properties of the fleet
+    :rtype: dict
+    """
+
+    def collect(get):
+        return np.array([get(bpr) for bpr in bprs], dtype=float)
+
+    a_t = collect(lambda bpr: bpr.rc_model['Atot'])
+    a_m = collect(lambda bpr: bpr.rc_model['Am'])
+    a_w = collect(lambda bpr: bpr.rc_model['Awin_ag'])
+    Htr_op = collect(lambda bpr: bpr.rc_model['Htr_op'])
+    Htr_w = collect(lambda bpr: bpr.rc_model['Htr_w'])
+    Hs_ag = collect(lambda bpr: bpr.architecture.Hs_ag)
+
+    h_ec = Htr_w  # (12)
+    h_op_m = Htr_op  # (9)
+    h_mc = h_ic * a_m  # (7)
+
+    rc_fleet = {'name': [bpr.name for bpr in bprs],
+                'Hs_ag': Hs_ag,
+                'c_m': collect(lambda bpr: bpr.rc_model['Cm']) / SECONDS_PER_HOUR,  # (Wh/K)
+                # proportion of internal gains, see `calc_rc_model_temperatures`
+                'f_int_gains': np.minimum(collect(lambda bpr: bpr.rc_model['Af'] / bpr.rc_model['Aef']), 1.0),
+                # proportion of solar gains, see `calc_rc_model_temperatures`
+                'f_sol_gains': np.sqrt(Hs_ag),
+                'h_ec': h_ec,
+                'h_ac': a_t / (1 / h_cv_i - 1 / h_ic),  # (8)
+                'h_op_m': h_op_m,
+                'h_mc': h_mc,
+                'h_em': 1.0 / (1.0 / h_op_m - 1.0 / h_mc),  # (10)
+                'f_ic': (a_t - a_m - h_ec / h_ic) / a_t,  # (17)
+                'f_sc': (a_t - a_m - a_w - h_ec / h_ic) / (a_t - a_w),  # (18)
+                'f_im': a_m / a_t,  # (19)
+                'f_sm': a_m / (a_t - a_w)}  # (20)
+
+    return rc_fleet
+
+
+def get_rc_model_fleet_inputs(tsds, t):
+    """
+    Gathers the time step data needed by `calc_rc_model_temperatures_fleet` from the `tsd` of each building.
+
+    :param tsds: Time series data of each building of the fleet, in the same order as the fleet properties, or the
+        `Utils.FleetState` of the fleet (read column-wise)
+    :type tsds: list[dict]
+    :param t: time step / hour of the year
+    :type t: int
+    :return: one array per input variable (see `RC_MODEL_FLEET_INPUTS`) and `theta_m_t_1`
+    :rtype: dict
+    """
+
+    if hasattr(tsds, 'blocks'):
+        def column(key, t):
+            return tsds[key][:, t]
+    else:
+        def column(key, t):
+            return np.array([tsd[key][t] for tsd in tsds], dtype=float)
+
+    inputs = dict((key, column(key, t)) for key in RC_MODEL_FLEET_INPUTS)
+
+    # temperature of the thermal mass at the previous time step, same rules as `calc_rc_model_temperatures`
+    if t == 0:
+        inputs['theta_m_t_1'] = np.full(len(tsds), 2.0)
+    else:
+        theta_m_t_1 = column('theta_m', t - 1)
+        inputs['theta_m_t_1'] = np.where(np.isnan(theta_m_t_1), column('T_ext', t - 1), theta_m_t_1)
+
+    return inputs
+
+
+def calc_rc_model_temperatures_fleet(phi_hc_cv, phi_hc_r, rc_fleet, inputs):
+    """
+    Vectorized version of `calc_rc_model_temperatures`: solves the R-C-Model node temperatures of a whole fleet of
+    buildings for one time step in a single call.
+
+    :param phi_hc_cv: convective heating/cooling power of each building (or a scalar for all)
+    :type phi_hc_cv: numpy.ndarray
+    :param phi_hc_r: radiative heating/cooling power of each building (or a scalar for all)
+    :type phi_hc_r: numpy.ndarray
+    :param rc_fleet: R-C-Model properties of the fleet, see `get_rc_model_fleet_properties`
+    :type rc_fleet: dict
+    :param inputs: time step data of the fleet, see `get_rc_model_fleet_inputs`
+    :type inputs: dict
+    :return: R-C-Model node temperatures, one array entry per building
+    :rtype: dict
+    """
+
+    T_int, theta_c, theta_m, theta_o, theta_ea, theta_ec, theta_em, h_ea \
+        = _calc_rc_model_temperatures_fleet(rc_fleet, phi_hc_cv, phi_hc_r, **inputs)
+
+    out_of_bounds = (T_int < T_WARNING_LOW) | (theta_c < T_WARNING_LOW) | (theta_m < T_WARNING_LOW) \
+        | (T_int > T_WARNING_HIGH) | (theta_c > T_WARNING_HIGH) | (theta_m > T_WARNING_HIGH)
+    if np.any(out_of_bounds):
+        i = np.flatnonzero(out_of_bounds)[0]
+        raise Exception("Temperature in RC-Model of building {} out of bounds!"
+                        " The results were Tint = {}, theta_c = {}, theta_m = {},"
+                        " Check building geometry and internal loads! Building might be too small in size or"
+                        " architecture parameter Hs_ag = {} might be too small for this geometry. Current bounds of range"
+                        " for RC-model temperatures are between {} and {}.".format(rc_fleet['name'][i], T_int[i],
+                                                                                   theta_c[i], theta_m[i],
+                                                                                   rc_fleet['Hs_ag'][i],
+                                                                                   T_WARNING_LOW, T_WARNING_HIGH))
+
+    rc_model_temp = {'theta_m': theta_m, 'theta_c': theta_c, 'T_int': T_int, 'theta_o': theta_o, 'theta_ea': theta_ea,
+                     'theta_ec': theta_ec, 'theta_em': theta_em, 'h_ea': h_ea, 'h_ec': rc_fleet['h_ec'],
+                     'h_em': rc_fleet['h_em'], 'h_op_m': rc_fleet['h_op_m']}
+    return rc_model_temp
+
+
+def check_rc_model_fleet(bprs, tsds, t, phi_hc_cv=0.0, phi_hc_r=0.0, rtol=1e-9):
+    """
+    Debug check of `calc_rc_model_temperatures_fleet` against the scalar `calc_rc_model_temperatures` of each
+    building, so that the two versions of the equations cannot drift apart. Raises a ValueError naming the first
+    building and node whose temperatures differ by more than rtol.
+
+    :param bprs: Building Properties of each building of the fleet
+    :type bprs: list[BuildingPropertiesRow]
+    :param tsds: Time series data of each building of the fleet, in the same order as `bprs`
+    :type tsds: list[dict]
+    :param t: time step / hour of the year
+    :type t: int
+    :param phi_hc_cv: convective heating/cooling power of each building (or a scalar for all)
+    :type phi_hc_cv: numpy.ndarray
+    :param phi_hc_r: radiative heating/cooling power of each building (or a scalar for all)
+    :type phi_hc_r: numpy.ndarray
+    :param rtol: relative tolerance of the comparison
+    :type rtol: float
+    :return: the largest relative difference found
+    :rtype: float
+    """
+
+    phi_hc_cv = np.broadcast_to(np.asarray(phi_hc_cv, dtype=float), (len(bprs),))
+    phi_hc_r = np.broadcast_to(np.asarray(phi_hc_r, dtype=float), (len(bprs),))
+    fleet = calc_rc_model_temperatures_fleet(phi_hc_cv, phi_hc_r, get_rc_model_fleet_properties(bprs),
+                                             get_rc_model_fleet_inputs(tsds, t))
+
+    largest = 0.0
+    for i, (bpr, tsd) in enumerate(zip(bprs, tsds)):
+        scalar = calc_rc_model_temperatures(phi_hc_cv[i], phi_hc_r[i], bpr, tsd, t)
+        for key, value in scalar.items():
+            difference = abs(fleet[key][i] - value) / max(abs(value), 1.0)
+            if not difference <= rtol:  # also catches a nan on one side only
+                raise ValueError("R-C-Model of the fleet differs from the one of building {} at timestep = {}:"
+                                 " {} = {} instead of {}.".format(bpr.name, t, key, fleet[key][i], value))
+            largest = max(largest, difference)
+    return largest
+
+
+def _calc_rc_model_temperatures_fleet(rc_fleet, phi_hc_cv, phi_hc_r, El, Ea, Epro, I_sol_and_I_rad, T_ext,
+                                      theta_ve_mech, Qs, m_ve_mech, m_ve_window, m_ve_inf, theta_m_t_1):
+    # same equations as `_calc_rc_model_temperatures`, written out on arrays so that the numba_cc scalar versions of
+    # the helper functions are not involved and the time invariant terms come precomputed from `rc_fleet`
+    h_ec = rc_fleet['h_ec']
+    h_ac = rc_fleet['h_ac']
+    h_mc = rc_fleet['h_mc']
+    h_em = rc_fleet['h_em']
+
+    # internal and solar gains
+    phi_i_l = 0.9 * El * rc_fleet['f_int_gains']
+    phi_i_a = 0.9 * (Ea * rc_fleet['f_int_gains'] + Epro)
+    phi_i_p = Qs
+    phi_s = I_sol_and_I_rad * rc_fleet['f_sol_gains']
+    phi_i_rad = f_r_l * phi_i_l + f_r_p * phi_i_p + f_r_a * phi_i_a
+
+    # (13) adapted for mass flows instead of volume flows
+    m_ve = m_ve_mech + m_ve_window + m_ve_inf
+    h_ea = m_ve * SECONDS_PER_HOUR * 1.005 / 3.6
+
+    phi_a = f_sa * phi_s + (1 - f_r_l) * phi_i_l + (1 - f_r_p) * phi_i_p + (1 - f_r_a) * phi_i_a + phi_hc_cv  # (14)
+    phi_c = rc_fleet['f_ic'] * (phi_i_rad + phi_hc_r) + (1 - f_sa) * rc_fleet['f_sc'] * phi_s  # (15)
+    phi_m = rc_fleet['f_im'] * (phi_i_rad + phi_hc_r) + (1 - f_sa) * rc_fleet['f_sm'] * phi_s  # (16)
+
+    theta_ea = (m_ve_mech * theta_ve_mech + (m_ve_window + m_ve_inf) * T_ext) / m_ve  # (21)
+    theta_ec = T_ext  # (22) WORKAROUND
+    theta_em = T_ext  # (23) WORKAROUND
+
+    h_1 = 1 / (1 / h_ea + 1 / h_ac)  # (26)
+    h_2 = h_1 + h_ec  # (27)
+    h_3 = 1.0 / (1.0 / h_2 + 1.0 / h_mc)  # (28)
+
+    phi_m_tot = phi_m + h_em * theta_em + (h_3 * (phi_c + h_ec * theta_ec + h_1 * (phi_a / h_ea + theta_ea))) / h_2  # (29)
+    c_m = rc_fleet['c_m']
+    theta_m_t = (theta_m_t_1 * (c_m - 0.5 * (h_3 + h_em)) + phi_m_tot) / (c_m + 0.5 * (h_3 + h_em))  # (25)
+    theta_m = (theta_m_t + theta_m_t_1) / 2  # (30)
+    theta_c = (h_mc * theta_m + phi_c + h_ec * theta_ec + h_1 * (phi_a / h_ea + theta_ea)) / (h_mc + h_ec + h_1)  # (31)
+    T_int = (h_ac * theta_c + h_ea * theta_ea + phi_a) / (h_ac + h_ea)  # (32)
+    theta_o = T_int * 0.31 + theta_c * 0.69  # (33)
+
+    return T_int, theta_c, theta_m, theta_o, theta_ea, theta_ec, theta_em, h_ea
+
 #DONE
 def calc_rc_model_temperatures_heating(phi_hc, bpr, tsd, t):
     """
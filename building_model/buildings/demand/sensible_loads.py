@@ -212,6 +212,102 @@ def calc_Qhs_sys_Qcs_sys(tsd,t):
     return tsd
 
 
+# nominal (design) values of the emission/control systems
+# the key under which `get_nominal_values` keeps the nominal values in tsd_ref
+NOMINAL_VALUES_KEY = 'nominal_values'
+
+
+def calc_nominal_values(tsd_ref):
+    """
+    Calculate the nominal (design) values of the heating and cooling systems from the reference annual run:
+    design powers, design set points and the air mass flows and temperatures at the design point of the ahu/aru.
+    As in the reference run (`calc_Qhs_Qcs_loss_ref`, `calc_Qhs_sys_Qcs_sys_ref`), the losses are split between the
+    units with the load fractions of each hour of the reference year. The systems with a single cooling unit (local
+    AC, ceiling/floor cooling) take all the losses at every step, their design values (`*_full_0`) do the same.
+
+    :param tsd_ref: Time series data of the reference annual run of the building
+    :type tsd_ref: dict
+    :return: dict of nominal values
+    :rtype: dict
+    """
+
+    nominal_values = {'Ta_heating_0': np.nanmax(tsd_ref['ta_hs_set']),
+                      'Ta_cooling_0': np.nanmin(tsd_ref['ta_cs_set']),
+                      'Qhs_sys_0': np.nanmax(tsd_ref['Qhs_sys'])}  # in W  Nominal end-use space heating demand
+
+    # heating units, nominal values are the maxima
+    for unit in ['ahu', 'aru', 'shu']:
+        qhs_sen = tsd_ref['Qhs_sen_%s' % unit]
+        frac = _calc_load_fraction(qhs_sen, tsd_ref['Qhs_sen_sys'], heating=True)
+
+        nominal_values['Qhs_sen_%s_incl_em_ls_0' % unit] = np.nanmax(qhs_sen + tsd_ref['Qhs_em_ls'] * frac)
+        qhs_sys = np.nan_to_num(qhs_sen + (tsd_ref['Qhs_em_ls'] + tsd_ref['Qhs_dis_ls']) * frac)
+        if unit != 'shu':
+            nominal_values.update(_calc_design_point(tsd_ref, qhs_sys, 'Qhs_sys', 'hs', unit, np.argmax(qhs_sys)))
+
+    # cooling units, nominal values are the minima (cooling loads are negative)
+    for unit in ['ahu', 'aru', 'scu']:
+        qcs_sen = tsd_ref['Qcs_sen_%s' % unit]
+        qcs_lat = tsd_ref['Qcs_lat_%s' % unit] if unit != 'scu' else 0.
+        frac = _calc_load_fraction(qcs_sen, tsd_ref['Qcs_sen_sys'], heating=False)
+
+        nominal_values['Qcs_sen_%s_incl_em_ls_0' % unit] = np.nanmin(qcs_sen + qcs_lat + tsd_ref['Qcs_em_ls'] * frac)
+        qcs_sys = np.nan_to_num(qcs_sen + qcs_lat + (tsd_ref['Qcs_em_ls'] + tsd_ref['Qcs_dis_ls']) * frac)
+        qcs_sys_full = np.nan_to_num(qcs_sen + qcs_lat + (tsd_ref['Qcs_em_ls'] + tsd_ref['Qcs_dis_ls']))
+        if unit != 'scu':
+            nominal_values.update(_calc_design_point(tsd_ref, qcs_sys, 'Qcs_sys', 'cs', unit, np.argmin(qcs_sys)))
+            nominal_values.update(_calc_design_point(tsd_ref, qcs_sys_full, 'Qcs_sys', 'cs', unit,
+                                                     np.argmin(qcs_sys_full), suffix='_full'))
+        else:
+            nominal_values['Qcs_sys_scu_0'] = np.min(qcs_sys)
+            nominal_values['Qcs_sys_scu_full_0'] = np.min(qcs_sys_full)
+
+    return nominal_values
+
+
+def _calc_load_fraction(q_unit, q_sys, heating):
+    # share of the unit in the load of the system, 0 when the system is not running
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if heating:
+            return np.where(q_sys > 0, q_unit / q_sys, 0.)
+        return np.where(q_sys < 0, q_unit / q_sys, 0.)
+
+
+def _calc_design_point(tsd_ref, q_sys, prefix, mode, unit, index, suffix=''):
+    # state of the unit at the hour of its design load
+    return {'%s_%s%s_0' % (prefix, unit, suffix): q_sys[index],
+            'ma_sup_%s_%s%s_0' % (mode, unit, suffix): tsd_ref['ma_sup_%s_%s' % (mode, unit)][index],
+            'Ta_sup_%s_%s%s_0' % (mode, unit, suffix): tsd_ref['ta_sup_%s_%s' % (mode, unit)][index] + KELVIN_OFFSET,
+            'Ta_re_%s_%s%s_0' % (mode, unit, suffix): tsd_ref['ta_re_%s_%s' % (mode, unit)][index] + KELVIN_OFFSET}
+
+
+def get_nominal_values(tsd_ref):
+    """
+    Returns the nominal values of the building (see `calc_nominal_values`). They are calculated at the first call and
+    kept in tsd_ref, call `invalidate_nominal_values` whenever tsd_ref is recomputed.
+
+    :param tsd_ref: Time series data of the reference annual run of the building
+    :type tsd_ref: dict
+    :return: dict of nominal values
+    :rtype: dict
+    """
+    nominal_values = tsd_ref.get(NOMINAL_VALUES_KEY)
+    if nominal_values is None:
+        nominal_values = calc_nominal_values(tsd_ref)
+        tsd_ref[NOMINAL_VALUES_KEY] = nominal_values
+    return nominal_values
+
+
+def invalidate_nominal_values(tsd_ref):
+    """
+    Drops the nominal values kept in tsd_ref, they are recalculated at the next call of `get_nominal_values`.
+
+    :param tsd_ref: Time series data of the reference annual run of the building
+    :type tsd_ref: dict
+    """
+    tsd_ref.pop(NOMINAL_VALUES_KEY, None)
+
+
 #DONE BUT MUST FIX REFERENCE VALUES
 # temperature of emission/control system
 def calc_temperatures_emission_systems(bpr, tsd, t,tsd_ref):
@@ -232,6 +328,8 @@ def calc_temperatures_emission_systems(bpr, tsd, t,tsd_ref):
 
     from buildings.demand.technologies import radiators, heating_coils, tabs
 
+    nominal_values = get_nominal_values(tsd_ref)
+
     #
     # TEMPERATURES HEATING SYSTEMS
     #
@@ -251,9 +349,8 @@ def calc_temperatures_emission_systems(bpr, tsd, t,tsd_ref):
     #RADIATOR**************************************************************************
     elif control_heating_cooling_systems.has_radiator_heating_system(bpr):
         # if radiator heating system
-        #TODO
-        Ta_heating_0 = np.nanmax(tsd_ref['ta_hs_set'])
-        Qhs_sys_0 = np.nanmax(tsd_ref['Qhs_sys'])  # in W  Nominal end-use space heating demand
+        Ta_heating_0 = nominal_values['Ta_heating_0']
+        Qhs_sys_0 = nominal_values['Qhs_sys_0']  # in W  Nominal end-use space heating demand
         #Ta_heating_0 = 20. #testing value
         #Qhs_sys_0 = 3000 #testing values
         tsd['Ths_sys_sup_ahu'][t] = np.nan  # in C  #FIXME: I don't like that non-existing temperatures are 0
@@ -287,12 +384,10 @@ def calc_temperatures_emission_systems(bpr, tsd, t,tsd_ref):
         #Ta_sup_0 = tsd['ta_sup_hs_ahu'][t]#testing purpose
         #Ta_re_0 = tsd['ta_re_hs_ahu'][t]#testing purpose
 
-        qhs_sys_ahu_ref = tsd_ref['Qhs_sen_ahu'] + (tsd_ref['Qhs_em_ls'] + tsd_ref['Qhs_dis_ls']) * frac_ahu
-        #Qhs_sys_ahu_0 = np.nanmax(qhs_sys_ahu_ref)  # in W #MUST FIND A REF VALUES 
-        index = np.where(qhs_sys_ahu_ref == Qhs_sys_ahu_0)
-        ma_sup_0 = tsd_ref['ma_sup_hs_ahu'][index[0][0]]
-        Ta_sup_0 = tsd_ref['ta_sup_hs_ahu'][index[0][0]] + KELVIN_OFFSET
-        Ta_re_0 = tsd_ref['ta_re_hs_ahu'][index[0][0]] + KELVIN_OFFSET
+        Qhs_sys_ahu_0 = nominal_values['Qhs_sys_ahu_0']  # in W
+        ma_sup_0 = nominal_values['ma_sup_hs_ahu_0']
+        Ta_sup_0 = nominal_values['Ta_sup_hs_ahu_0']
+        Ta_re_0 = nominal_values['Ta_re_hs_ahu_0']
         
         Ths_sup, Ths_re, mcphs = heating_coils.calc_heating_coil(qhs_sys_ahu, Qhs_sys_ahu_0, tsd['ta_sup_hs_ahu'][t],
                                                                                tsd['ta_re_hs_ahu'][t],
@@ -312,7 +407,6 @@ def calc_temperatures_emission_systems(bpr, tsd, t,tsd_ref):
             frac_aru = 0
         
         qhs_sys_aru = tsd['Qhs_sen_aru'][t] + (tsd['Qhs_em_ls'][t] + tsd['Qhs_dis_ls'][t]) * frac_aru
-        qhs_sys_aru_ref = tsd_ref['Qhs_sen_aru'] + (tsd_ref['Qhs_em_ls'] + tsd_ref['Qhs_dis_ls']) * frac_aru
 
 
         # Qhs_sys_aru_0 = qhs_sys_aru # for testing purpose
@@ -320,11 +414,10 @@ def calc_temperatures_emission_systems(bpr, tsd, t,tsd_ref):
         # Ta_sup_0 = tsd['ta_sup_hs_aru'][t] # for testing purpose
         # Ta_re_0 = tsd['ta_re_hs_aru'][t] # for testing purpose
        
-        Qhs_sys_aru_0 = np.nanmax(qhs_sys_aru_ref)  # in W
-        index = np.where(qhs_sys_aru_ref == Qhs_sys_aru_0)
-        ma_sup_0 = tsd_ref['ma_sup_hs_aru'][index[0][0]]
-        Ta_sup_0 = tsd_ref['ta_sup_hs_aru'][index[0][0]] + KELVIN_OFFSET
-        Ta_re_0 = tsd_ref['ta_re_hs_aru'][index[0][0]] + KELVIN_OFFSET
+        Qhs_sys_aru_0 = nominal_values['Qhs_sys_aru_0']  # in W
+        ma_sup_0 = nominal_values['ma_sup_hs_aru_0']
+        Ta_sup_0 = nominal_values['Ta_sup_hs_aru_0']
+        Ta_re_0 = nominal_values['Ta_re_hs_aru_0']
        
         Ths_sup, Ths_re, mcphs = heating_coils.calc_heating_coil(qhs_sys_aru, Qhs_sys_aru_0,
                                                                                tsd['ta_sup_hs_aru'][t],
@@ -345,8 +438,8 @@ def calc_temperatures_emission_systems(bpr, tsd, t,tsd_ref):
     elif control_heating_cooling_systems.has_floor_heating_system(bpr):
         
        
-        Ta_heating_0 = np.nanmax(tsd_ref['ta_hs_set'])
-        Qhs_sys_0 = np.nanmax(tsd_ref['Qhs_sys'])  # in W
+        Ta_heating_0 = nominal_values['Ta_heating_0']
+        Qhs_sys_0 = nominal_values['Qhs_sys_0']  # in W
    
         #Ta_heating_0 = tsd['ta_hs_set'][t]#for testing purpose
         #Qhs_sys_0 = tsd['Qhs_sys'][t]#for testing puprose
@@ -394,14 +487,12 @@ def calc_temperatures_emission_systems(bpr, tsd, t,tsd_ref):
         else:
             frac_ahu = 0
         qcs_sys_ahu = tsd['Qcs_sen_ahu'][t] + tsd['Qcs_lat_ahu'][t] + (tsd['Qcs_em_ls'][t] + tsd['Qcs_dis_ls'][t]) * frac_ahu
-        qcs_sys_ahu_ref = tsd_ref['Qcs_sen_ahu'][t] + tsd_ref['Qcs_lat_ahu'][t] + (tsd_ref['Qcs_em_ls'][t] + tsd_ref['Qcs_dis_ls'][t]) * frac_ahu
 
       
-        Qcs_sys_ahu_0 = np.nanmin(qcs_sys_ahu_ref)  # in W
-        index = np.where(qcs_sys_ahu_ref == Qcs_sys_ahu_0)
-        ma_sup_0 = tsd_ref['ma_sup_cs_ahu'][index[0][0]]
-        Ta_sup_0 = tsd_ref['ta_sup_cs_ahu'][index[0][0]] + KELVIN_OFFSET
-        Ta_re_0 = tsd_ref['ta_re_cs_ahu'][index[0][0]] + KELVIN_OFFSET
+        Qcs_sys_ahu_0 = nominal_values['Qcs_sys_ahu_0']  # in W
+        ma_sup_0 = nominal_values['ma_sup_cs_ahu_0']
+        Ta_sup_0 = nominal_values['Ta_sup_cs_ahu_0']
+        Ta_re_0 = nominal_values['Ta_re_cs_ahu_0']
       
         # Qcs_sys_ahu_0 = qcs_sys_ahu # testing purpose
         # ma_sup_0 = tsd['ma_sup_cs_ahu'][t] # testing purpose
@@ -425,16 +516,14 @@ def calc_temperatures_emission_systems(bpr, tsd, t,tsd_ref):
         else:
             frac_aru = 0
         qcs_sys_aru = tsd['Qcs_sen_aru'][t] + tsd['Qcs_lat_aru'][t] + (tsd['Qcs_em_ls'][t] + tsd['Qcs_dis_ls'][t]) * frac_aru
-        qcs_sys_aru_ref = tsd_ref['Qcs_sen_aru'] + tsd_ref['Qcs_lat_aru'] + (tsd_ref['Qcs_em_ls'] + tsd_ref['Qcs_dis_ls']) * frac_aru
         
         if pd.isnull(qcs_sys_aru):
             qcs_sys_aru = 0
         
-        Qcs_sys_aru_0 = np.nanmin(qcs_sys_aru_ref)  # in W
-        index = np.where(qcs_sys_aru_ref == Qcs_sys_aru_0)
-        ma_sup_0 = tsd_ref['ma_sup_cs_aru'][index[0][0]]
-        Ta_sup_0 = tsd_ref['ta_sup_cs_aru'][index[0][0]] + KELVIN_OFFSET
-        Ta_re_0 = tsd_ref['ta_re_cs_aru'][index[0][0]] + KELVIN_OFFSET
+        Qcs_sys_aru_0 = nominal_values['Qcs_sys_aru_0']  # in W
+        ma_sup_0 = nominal_values['ma_sup_cs_aru_0']
+        Ta_sup_0 = nominal_values['Ta_sup_cs_aru_0']
+        Ta_re_0 = nominal_values['Ta_re_cs_aru_0']
         
         # Qcs_sys_aru_0 = qcs_sys_aru #testing purpose
         # ma_sup_0 = tsd['ma_sup_cs_aru'][t] #testing purpose
@@ -466,20 +555,17 @@ def calc_temperatures_emission_systems(bpr, tsd, t,tsd_ref):
         # ARU
         # consider losses according to loads of systems
         qcs_sys_aru = tsd['Qcs_sen_aru'][t] + tsd['Qcs_lat_aru'][t] + (tsd['Qcs_em_ls'][t] + tsd['Qcs_dis_ls'][t])
-        qcs_sys_aru_ref = tsd_ref['Qcs_sen_aru'] + tsd_ref['Qcs_lat_aru'] + (tsd_ref['Qcs_em_ls'] + tsd_ref['Qcs_dis_ls'])
         
         if pd.isnull(qcs_sys_aru):
             qcs_sys_aru = 0
    
         
        
-        qcs_sys_aru_ref = np.nan_to_num(qcs_sys_aru_ref) #ORIGINAL fill the nan values
         # Calc nominal temperatures of systems
-        Qcs_sys_aru_0 = np.nanmin(qcs_sys_aru_ref)  # in W
-        index = np.where(qcs_sys_aru_ref == Qcs_sys_aru_0)
-        ma_sup_0 = tsd_ref['ma_sup_cs_aru'][index[0][0]]
-        Ta_sup_0 = tsd_ref['ta_sup_cs_aru'][index[0][0]] + KELVIN_OFFSET
-        Ta_re_0 = tsd_ref['ta_re_cs_aru'][index[0][0]] + KELVIN_OFFSET
+        Qcs_sys_aru_0 = nominal_values['Qcs_sys_aru_full_0']  # in W, with all the losses as qcs_sys_aru
+        ma_sup_0 = nominal_values['ma_sup_cs_aru_full_0']
+        Ta_sup_0 = nominal_values['Ta_sup_cs_aru_full_0']
+        Ta_re_0 = nominal_values['Ta_re_cs_aru_full_0']
         
 
         Tcs_sup, Tcs_re, mcpcs = heating_coils.calc_cooling_coil(qcs_sys_aru, Qcs_sys_aru_0,
@@ -507,19 +593,16 @@ def calc_temperatures_emission_systems(bpr, tsd, t,tsd_ref):
         else:
             frac_ahu = 0
         qcs_sys_ahu = tsd['Qcs_sen_ahu'][t] + tsd['Qcs_lat_ahu'][t] + (tsd['Qcs_em_ls'][t] + tsd['Qcs_dis_ls'][t]) * frac_ahu
-        qcs_sys_ahu_ref = tsd_ref['Qcs_sen_ahu'] + tsd_ref['Qcs_lat_ahu'] + (tsd_ref['Qcs_em_ls'] + tsd_ref['Qcs_dis_ls']) * frac_ahu
         
         if pd.isnull(qcs_sys_ahu):
             qcs_sys_ahu = 0
 
         
         
-        qcs_sys_ahu_ref = np.nan_to_num(qcs_sys_ahu_ref)
-        Qcs_sys_ahu_0 = np.nanmin(qcs_sys_ahu_ref)  # in W
-        index = np.where(qcs_sys_ahu_ref == Qcs_sys_ahu_0)
-        ma_sup_0 = tsd_ref['ma_sup_cs_ahu'][index[0][0]]
-        Ta_sup_0 = tsd_ref['ta_sup_cs_ahu'][index[0][0]] + KELVIN_OFFSET
-        Ta_re_0 = tsd_ref['ta_re_cs_ahu'][index[0][0]] + KELVIN_OFFSET
+        Qcs_sys_ahu_0 = nominal_values['Qcs_sys_ahu_0']  # in W
+        ma_sup_0 = nominal_values['ma_sup_cs_ahu_0']
+        Ta_sup_0 = nominal_values['Ta_sup_cs_ahu_0']
+        Ta_re_0 = nominal_values['Ta_re_cs_ahu_0']
         
         # Qcs_sys_ahu_0 = qcs_sys_ahu #testing purpose
         # ma_sup_0 = tsd['ma_sup_cs_ahu'][t] #testing purpose
@@ -546,19 +629,16 @@ def calc_temperatures_emission_systems(bpr, tsd, t,tsd_ref):
             frac_aru = 0
 
         qcs_sys_aru = tsd['Qcs_sen_aru'][t] + tsd['Qcs_lat_aru'][t] + (tsd['Qcs_em_ls'][t] + tsd['Qcs_dis_ls'][t]) * frac_aru
-        qcs_sys_aru_ref = tsd_ref['Qcs_sen_aru'] + tsd_ref['Qcs_lat_aru'] + (tsd_ref['Qcs_em_ls'] + tsd_ref['Qcs_dis_ls']) * frac_aru
         
         if pd.isnull(qcs_sys_aru):
             qcs_sys_aru = 0
 
       
-        qcs_sys_aru_ref = np.nan_to_num(qcs_sys_aru_ref)
         # Calc nominal temperatures of systems
-        Qcs_sys_aru_0 = np.nanmin(qcs_sys_aru_ref)  # in W
-        index = np.where(qcs_sys_aru_ref == Qcs_sys_aru_0)
-        ma_sup_0 = tsd_ref['ma_sup_cs_aru'][index[0][0]]
-        Ta_sup_0 = tsd_ref['ta_sup_cs_aru'][index[0][0]] + KELVIN_OFFSET
-        Ta_re_0 = tsd_ref['ta_re_cs_aru'][index[0][0]] + KELVIN_OFFSET
+        Qcs_sys_aru_0 = nominal_values['Qcs_sys_aru_0']  # in W
+        ma_sup_0 = nominal_values['ma_sup_cs_aru_0']
+        Ta_sup_0 = nominal_values['Ta_sup_cs_aru_0']
+        Ta_re_0 = nominal_values['Ta_re_cs_aru_0']
        
         # Qcs_sys_aru_0 = qcs_sys_aru# testing purpose
         # ma_sup_0 = tsd['ma_sup_cs_aru'][t]# testing purpose
@@ -585,14 +665,12 @@ def calc_temperatures_emission_systems(bpr, tsd, t,tsd_ref):
 
 
         qcs_sys_scu = tsd['Qcs_sen_scu'][t] + (tsd['Qcs_em_ls'][t] + tsd['Qcs_dis_ls'][t]) * frac_scu
-        qcs_sys_scu_ref = tsd_ref['Qcs_sen_scu'] + (tsd_ref['Qcs_em_ls'] + tsd_ref['Qcs_dis_ls']) * frac_scu
         if pd.isnull(qcs_sys_scu):
             qcs_sys_scu = 0
 
       
-        qcs_sys_scu_ref = np.nan_to_num(qcs_sys_scu_ref)
-        Qcs_sys_scu_0 = np.nanmin(qcs_sys_scu_ref)  # in W
-        Ta_cooling_0 = np.nanmin(tsd_ref['ta_cs_set'])
+        Qcs_sys_scu_0 = nominal_values['Qcs_sys_scu_0']  # in W
+        Ta_cooling_0 = nominal_values['Ta_cooling_0']
        
         # Qcs_sys_scu_0 = qcs_sys_scu
         # Ta_cooling_0 = tsd['ta_cs_set'][t]
@@ -612,14 +690,12 @@ def calc_temperatures_emission_systems(bpr, tsd, t,tsd_ref):
         # SCU
         # consider losses according to loads of systems
         qcs_sys_scu = tsd['Qcs_sen_scu'][t] + (tsd['Qcs_em_ls'][t] + tsd['Qcs_dis_ls'][t])
-        qcs_sys_scu_ref = tsd_ref['Qcs_sen_scu'] + (tsd_ref['Qcs_em_ls'] + tsd_ref['Qcs_dis_ls'])
         if pd.isnull(qcs_sys_scu):
             qcs_sys_scu = 0
         
         
-        qcs_sys_scu_ref = np.nan_to_num(qcs_sys_scu_ref)
-        Qcs_sys_scu_0 = np.nanmin(qcs_sys_scu_ref)  # in W
-        Ta_cooling_0 = np.nanmin(tsd_ref['ta_cs_set'])
+        Qcs_sys_scu_0 = nominal_values['Qcs_sys_scu_full_0']  # in W, with all the losses as qcs_sys_scu
+        Ta_cooling_0 = nominal_values['Ta_cooling_0']
        
         # qcs_sys_scu = qcs_sys_scu#testing purpose
         # Qcs_sys_scu_0 = qcs_sys_scu#testing purpose
@@ -779,6 +855,8 @@ def calc_Qhs_Qcs_loss(bpr, tsd,t,tsd_ref):
 
     
 
+    nominal_values = get_nominal_values(tsd_ref)
+
     tair = tsd['T_int'][t]
     text = tsd['T_ext'][t]
 
@@ -793,13 +871,12 @@ def calc_Qhs_Qcs_loss(bpr, tsd,t,tsd_ref):
             frac_ahu = 0
         #frac_ahu = [ahu / sys if sys > 0 else 0 for ahu, sys in zip(tsd['Qhs_sen_ahu'], tsd['Qhs_sen_sys'])] ##CANCEL
         qhs_sen_ahu_incl_em_ls = tsd['Qhs_sen_ahu'][t] + tsd['Qhs_em_ls'][t] * frac_ahu
-        qhs_sen_ahu_incl_em_ls_ref = tsd_ref['Qhs_sen_ahu'] + tsd_ref['Qhs_em_ls'] * frac_ahu
 
         if pd.isnull(qhs_sen_ahu_incl_em_ls):
             qhs_sen_ahu_incl_em_ls = 0
         
         Qhs_d_ls_ahu = ((tsh_ahu + trh_ahu) / 2 - tamb) * (
-        qhs_sen_ahu_incl_em_ls / np.nanmax(qhs_sen_ahu_incl_em_ls_ref)) * (Lv * Y) #ORIGINAL
+        qhs_sen_ahu_incl_em_ls / nominal_values['Qhs_sen_ahu_incl_em_ls_0']) * (Lv * Y) #ORIGINAL
 
     else:
         Qhs_d_ls_ahu = 0
@@ -814,13 +891,12 @@ def calc_Qhs_Qcs_loss(bpr, tsd,t,tsd_ref):
             frac_aru = 0
        
         qhs_sen_aru_incl_em_ls = tsd['Qhs_sen_aru'][t] + tsd['Qhs_em_ls'][t] * frac_aru
-        qhs_sen_aru_incl_em_ls_ref = tsd_ref['Qhs_sen_aru'] + tsd_ref['Qhs_em_ls'] * frac_aru
         
-        if pd.isull(qhs_sen_aru_incl_em_ls):
+        if pd.isnull(qhs_sen_aru_incl_em_ls):
             qhs_sen_aru_incl_em_ls = 0
             
         Qhs_d_ls_aru = ((tsh_aru + trh_aru) / 2 - tamb) * (
-        qhs_sen_aru_incl_em_ls / np.nanmax(qhs_sen_aru_incl_em_ls_ref)) * (
+        qhs_sen_aru_incl_em_ls / nominal_values['Qhs_sen_aru_incl_em_ls_0']) * (
                            Lv * Y)
     else:
         Qhs_d_ls_aru = 0
@@ -834,13 +910,12 @@ def calc_Qhs_Qcs_loss(bpr, tsd,t,tsd_ref):
             frac_shu = 0
        
         qhs_sen_shu_incl_em_ls = tsd['Qhs_sen_shu'][t] + tsd['Qhs_em_ls'][t] * frac_shu
-        qhs_sen_shu_incl_em_ls_ref = tsd_ref['Qhs_sen_shu'] + tsd_ref['Qhs_em_ls'] * frac_shu
 
         if pd.isnull(qhs_sen_shu_incl_em_ls):
             qhs_sen_shu_incl_em_ls = 0
     
         qhs_d_ls_shu = ((tsh_shu + trh_shu) / 2 - tamb) * (
-        qhs_sen_shu_incl_em_ls / np.nanmax(qhs_sen_shu_incl_em_ls_ref)) * (
+        qhs_sen_shu_incl_em_ls / nominal_values['Qhs_sen_shu_incl_em_ls_0']) * (
                            Lv * Y)
     else:
         qhs_d_ls_shu = 0
@@ -856,12 +931,11 @@ def calc_Qhs_Qcs_loss(bpr, tsd,t,tsd_ref):
             frac_ahu = 0
        
         qcs_sen_ahu_incl_em_ls = tsd['Qcs_sen_ahu'][t] + tsd['Qcs_lat_ahu'][t] + tsd['Qcs_em_ls'][t] * frac_ahu
-        qcs_sen_ahu_incl_em_ls_ref = tsd_ref['Qcs_sen_ahu'] + tsd_ref['Qcs_lat_ahu'] + tsd_ref['Qcs_em_ls'] * frac_ahu
         
         if pd.isnull(qcs_sen_ahu_incl_em_ls):
             qcs_sen_ahu_incl_em_ls = 0
        
-        qcs_d_ls_ahu = ((tsc_ahu + trc_ahu) / 2 - tamb) * (qcs_sen_ahu_incl_em_ls / np.nanmin(qcs_sen_ahu_incl_em_ls_ref))\
+        qcs_d_ls_ahu = ((tsc_ahu + trc_ahu) / 2 - tamb) * (qcs_sen_ahu_incl_em_ls / nominal_values['Qcs_sen_ahu_incl_em_ls_0'])\
                        * (Lv * Y) #here it uses the min
     else:
         qcs_d_ls_ahu = 0
@@ -875,12 +949,11 @@ def calc_Qhs_Qcs_loss(bpr, tsd,t,tsd_ref):
             frac_aru = 0
 
         qcs_sen_aru_incl_em_ls = tsd['Qcs_sen_aru'][t] + tsd['Qcs_lat_aru'][t] + tsd['Qcs_em_ls'][t] * frac_aru
-        qcs_sen_aru_incl_em_ls_ref = tsd_ref['Qcs_sen_aru'] + tsd_ref['Qcs_lat_aru'] + tsd_ref['Qcs_em_ls'] * frac_aru
 
         if pd.isnull(qcs_sen_aru_incl_em_ls) :
             qcs_sen_aru_incl_em_ls = 0
            
-        qcs_d_ls_aru = ((tsc_aru + trc_aru) / 2 - tamb) * (qcs_sen_aru_incl_em_ls / np.nanmin(qcs_sen_aru_incl_em_ls_ref))\
+        qcs_d_ls_aru = ((tsc_aru + trc_aru) / 2 - tamb) * (qcs_sen_aru_incl_em_ls / nominal_values['Qcs_sen_aru_incl_em_ls_0'])\
                         * (Lv * Y)
     else:
         qcs_d_ls_aru = 0
@@ -895,13 +968,12 @@ def calc_Qhs_Qcs_loss(bpr, tsd,t,tsd_ref):
             frac_scu = 0
         
         qcs_sen_scu_incl_em_ls = tsd['Qcs_sen_scu'][t] + tsd['Qcs_em_ls'][t] * frac_scu
-        qcs_sen_scu_incl_em_ls_ref = tsd_ref['Qcs_sen_scu'] + tsd_ref['Qcs_em_ls'] * frac_scu
 
         if pd.isnull(qcs_sen_scu_incl_em_ls):
             qcs_sen_scu_incl_em_ls = 0
             
      
-        Qcs_d_ls_scu = ((tsc_scu + trc_scu) / 2 - tamb) * (qcs_sen_scu_incl_em_ls / np.nanmin(qcs_sen_scu_incl_em_ls_ref)) * (
+        Qcs_d_ls_scu = ((tsc_scu + trc_scu) / 2 - tamb) * (qcs_sen_scu_incl_em_ls / nominal_values['Qcs_sen_scu_incl_em_ls_0']) * (
         Lv * Y)
     else:
         Qcs_d_ls_scu = 0
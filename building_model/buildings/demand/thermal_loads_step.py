@@ -29,7 +29,7 @@ from cea.utilities import reporting
 
 def calc_thermal_loads_ref( building_name, date_range, locator, bpr, config, schedules, 
                             tsd_ref, t, use_dynamic_infiltration_calculation):
-    tsd_ref = electrical_loads.calc_Eal_Epro(tsd_ref, schedules) #serve per riempire tsd['El'] e simili
+    tsd_ref = electrical_loads.calc_Eal_Epro(tsd_ref, schedules, t) #serve per riempire tsd['El'] e simili
     # CALCULATE SPACE CONDITIONING DEMANDS
     #lascio gli np.zeros perche tanto questo non ha impianti hvac
     
@@ -100,7 +100,7 @@ def calc_thermal_loads_step(building_name, bpr, weather_data, date_range, locato
     #tsd : dict
     
     #consumpiotn due to light and appliances is scheduled for all the year
-    tsd = electrical_loads.calc_Eal_Epro(tsd, schedules) #serve per riempire tsd['El'] e simili
+    tsd = electrical_loads.calc_Eal_Epro(tsd, schedules, t) #serve per riempire tsd['El'] e simili
 
 
    
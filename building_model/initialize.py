@@ -3,12 +3,16 @@ sys.path.append('building_model/')
 import Utils
 import sys
 import random
+import multiprocessing
 from itertools import islice
 import os
 import cea.config 
 import cea.inputlocator as inputlocator
 from cea.utilities import epwreader
 from building_properties import BuildingProperties
+import buildings.demand.sensible_loads as sensible_loads
+import scenario_cache
+from config import N_cores_OFF
 import pandapower as pp
 from model import Mpc as MPC
 
@@ -23,15 +27,34 @@ from model import Mpc as MPC
 	# - RUN DEMAND SCHEDULING
 
 class Initialize(object):
-	def __init__(self, config, locator):
+	def __init__(self, config, locator, cache_root=None, processes=1):
 		self.config = config
 		self.locator = locator
+		self.building_names = ['B1000'] # extremely hard coded must avoided...
+		self.processes = processes #processes of the reference annual run, None uses all the cores but N_cores_OFF
+		self.not_conditioned_buildings = []
+		self.failed_buildings = {}
+
+		#reuse the scenario cached for the same CEA inputs, if any
+		cache = None
+		if cache_root is not None:
+			cache = scenario_cache.ScenarioCache(cache_root, locator, self.building_names)
+			if cache.exists():
+				cache.load(self)
+				print('Scenario loaded from cache %s: READY to create the Simulation Agents!\n' % cache.path)
+				return
+
 		self.weather_data = self.weather()
 		self.bpr_log = self.bpr()
-		self.building_names = ['B1000'] # extremely hard coded must avoided...
 		self.schedules_log, self.tsd_log, self.tsd_ref_log, self.schedules_ref_log = self.tsd()	
 
 		self.tsd_ref()
+
+		if cache is not None and self.failed_buildings: #half written reference runs are never cached
+			print('Scenario NOT saved in cache, the reference run failed for some buildings\n')
+		elif cache is not None:
+			cache.save(self)
+			print('Scenario saved in cache %s\n' % cache.path)
 		
 		print('Scenario initialized: READY to create the Simulation Agents!\n')
 	
@@ -52,31 +75,106 @@ class Initialize(object):
 		return building_properties
 	
 	def tsd(self):
+		#struct-of-arrays storage of all the buildings, tsd_log and tsd_ref_log hold views on it
+		self.fleet_state = Utils.FleetState(self.building_names)
+		self.fleet_state_ref = Utils.FleetState(self.building_names)
 		schedules, tsd_log, tsd_log_ref, schedules_ref = Utils.tsd_log_initilizer(self.building_names,self.bpr_log, 
-																			self.weather_data, self.locator)
+																			self.weather_data, self.locator,
+																			self.fleet_state, self.fleet_state_ref)
 		
 		print('3) TSD dicts created!\n')
 		return schedules, tsd_log, tsd_log_ref, schedules_ref
 	
 	def tsd_ref (self):
-		mpc = MPC(self.config, self.locator)
+		#the reference annual runs of the buildings are independent, with processes > 1 they are sharded on a pool
+		processes = self.processes
+		if processes is None:
+			processes = max(1, multiprocessing.cpu_count() - N_cores_OFF)
+		processes = min(processes, len(self.building_names))
+
 		print('============================')
-		for name in self.building_names:
-			print('compiling tsd_ref for building: %s'%name)
-			bpr = self.bpr_log[name]
-			print(bpr.rc_model)
-			tsd_ref = self.tsd_ref_log[name]
-			schedule_ref = self.schedules_ref_log[name]
-
-			tsd_ref = mpc.calc_reference_annual(tsd_ref, name, bpr, schedule_ref) #could be problem with the file path when saving pickle
-			
-			if tsd_ref == 'not_conditioned':
+		if processes > 1:
+			results = self._tsd_ref_parallel(processes)
+		else:
+			results = self._tsd_ref_serial()
+
+		for i, (name, status, error) in enumerate(results):
+			print('[%i/%i] tsd_ref for building %s: %s' % (i + 1, len(self.building_names), name,
+														   status if error is None else '%s (%s)' % (status, error)))
+			if status == 'not_conditioned':
 				self.not_conditioned_buildings.append(name)
-
-			self.tsd_ref_log[name] = tsd_ref #saving in the object
+			elif status == 'failed':
+				self.failed_buildings[name] = error
+		if self.failed_buildings:
+			print('tsd_ref FAILED for buildings: %s' % ', '.join(sorted(self.failed_buildings)))
 		print('============================\n')
 		
 		print('4) TSD ANNUAL REFERENCE done! \n')
+
+	def _tsd_ref_serial(self):
+		mpc = MPC(self.config, self.locator)
+		for name in self.building_names:
+			#serially a failure stops the initialization as before, only the pool reports it per building
+			status, error = calc_reference_annual(mpc, self.tsd_ref_log[name], name, self.bpr_log[name],
+												  self.schedules_ref_log[name], raise_errors=True)
+			yield name, status, error
+
+	def _tsd_ref_parallel(self, processes):
+		#the workers write the reference runs directly in the shared blocks of fleet_state_ref, only the per
+		#building extras (e.g. the nominal values) and status codes are pickled back
+		handle = self.fleet_state_ref.share_memory()
+		try:
+			tasks = [(name, self.bpr_log[name], self.schedules_ref_log[name]) for name in self.building_names]
+			pool = multiprocessing.Pool(processes, _init_tsd_ref_worker, (self.config, self.locator, handle))
+			try:
+				for name, status, error, extras, status_codes in pool.imap_unordered(_tsd_ref_worker, tasks):
+					index = self.fleet_state_ref.building_index[name]
+					self.fleet_state_ref.extras[index] = extras
+					self.fleet_state_ref.merge_status_codes(index, status_codes)
+					yield name, status, error
+			finally:
+				pool.close()
+				pool.join()
+		finally:
+			self.fleet_state_ref.release_shared_memory()
+
+
+def calc_reference_annual(mpc, tsd_ref, name, bpr, schedule_ref, raise_errors=False):
+	"""
+	runs the reference annual simulation of a building in its tsd_ref and caches its nominal values
+
+	:param raise_errors: re-raise the error of a failure instead of returning it
+	:returns: the status 'ok', 'not_conditioned' or 'failed' and the error message of a failure
+	:rtype: tuple
+	"""
+	sensible_loads.invalidate_nominal_values(tsd_ref) #the nominal values of a previous reference run are stale
+	try:
+		result = mpc.calc_reference_annual(tsd_ref, name, bpr, schedule_ref) #could be problem with the file path when saving pickle
+		if isinstance(result, str) and result == 'not_conditioned':
+			return 'not_conditioned', None
+		if result is not tsd_ref:
+			tsd_ref.update(result)
+		sensible_loads.get_nominal_values(tsd_ref) #computed once here, the time steps only look them up
+	except Exception as e:
+		if raise_errors:
+			raise
+		return 'failed', '%s: %s' % (type(e).__name__, e)
+	return 'ok', None
+
+
+#state of the tsd_ref pool workers, set once per process by _init_tsd_ref_worker
+_tsd_ref_worker_state = {}
+
+def _init_tsd_ref_worker(config, locator, handle):
+	_tsd_ref_worker_state['mpc'] = MPC(config, locator)
+	_tsd_ref_worker_state['fleet'] = Utils.FleetState.attach_shared(handle)
+
+def _tsd_ref_worker(task):
+	name, bpr, schedule_ref = task
+	fleet = _tsd_ref_worker_state['fleet']
+	tsd_ref = fleet.building(name)
+	status, error = calc_reference_annual(_tsd_ref_worker_state['mpc'], tsd_ref, name, bpr, schedule_ref)
+	return name, status, error, fleet.extras[fleet.building_index[name]], fleet.status_codes
 	
 
 
@@ -0,0 +1,156 @@
+import sys
+sys.path.append('building_model/')
+import os
+import json
+import shutil
+import pickle
+import hashlib
+import numpy as np
+import pandas as pd
+from config import *
+import Utils
+
+
+# bump when the layout of the cache or the content of the time step data changes
+CACHE_VERSION = 2
+
+
+class ScenarioCache(object):
+	"""
+	Persistent cache of an initialized CEA scenario (see `initialize.Initialize`).
+
+	The cache of a scenario is a folder named after the hash of its CEA inputs, so a new one is built whenever the
+	zone shapefile, the property/technology databases, the weather file or the occupancy schedules change.
+	The time step data is stored column-wise per building and loaded memory mapped::
+
+		<root>/<key>/
+			manifest.json                # version, building names, schedule and weather columns
+			tsd/ tsd_ref/                # `Utils.FleetState.save`, one .npy block per variable group
+			schedules.npy                # (buildings, columns, hours) compiled schedules
+			weather.npy                  # (columns, hours)
+			building_properties.pickle   # BuildingProperties
+	"""
+
+	def __init__(self, root, locator, building_names):
+		self.root = root
+		self.locator = locator
+		self.building_names = list(building_names)
+		self.key = hash_inputs(locator, self.building_names)
+		self.path = os.path.join(root, self.key)
+
+	def exists(self):
+		return os.path.exists(os.path.join(self.path, 'manifest.json'))
+
+	def save(self, scenario):
+		"""
+		saves the initialized scenario (only complete ones, see `initialize.Initialize`), the folder is written aside and renamed at the end so that an interrupted save
+		never leaves a cache that looks valid
+
+		:param scenario: the initialized scenario
+		:type scenario: initialize.Initialize
+		"""
+		tmp_path = self.path + '.tmp'
+		if os.path.exists(tmp_path):
+			shutil.rmtree(tmp_path)
+		os.makedirs(tmp_path)
+
+		scenario.fleet_state.save(os.path.join(tmp_path, 'tsd'))
+		scenario.fleet_state_ref.save(os.path.join(tmp_path, 'tsd_ref'))
+
+		schedule_columns = list(scenario.schedules_log[self.building_names[0]].keys())
+		schedules = np.stack([np.stack([scenario.schedules_log[name][column] for column in schedule_columns])
+							  for name in self.building_names])
+		np.save(os.path.join(tmp_path, 'schedules.npy'), schedules)
+
+		weather_columns = list(scenario.weather_data.columns)
+		np.save(os.path.join(tmp_path, 'weather.npy'), scenario.weather_data.values.T.astype(np.float64))
+
+		with open(os.path.join(tmp_path, 'building_properties.pickle'), 'wb') as f:
+			pickle.dump(scenario.bpr_log, f, pickle.HIGHEST_PROTOCOL)
+
+		manifest = {'version': CACHE_VERSION,
+					'key': self.key,
+					'building_names': self.building_names,
+					'not_conditioned_buildings': list(scenario.not_conditioned_buildings),
+					'schedule_columns': schedule_columns,
+					'weather_columns': weather_columns}
+		with open(os.path.join(tmp_path, 'manifest.json'), 'w') as f:
+			json.dump(manifest, f, indent=1)
+
+		if os.path.exists(self.path):
+			shutil.rmtree(self.path)
+		os.rename(tmp_path, self.path)
+
+	def load(self, scenario, mmap_mode='c'):
+		"""
+		restores the cached scenario into `scenario`
+
+		:param scenario: the scenario to fill (its `config`, `locator` and `building_names` are kept)
+		:type scenario: initialize.Initialize
+		:param mmap_mode: see `Utils.FleetState.load`
+		:type mmap_mode: str
+		"""
+		with open(os.path.join(self.path, 'manifest.json')) as f:
+			manifest = json.load(f)
+		if manifest['version'] != CACHE_VERSION:
+			raise ValueError('scenario cache %s has version %s, expected %s' % (self.path, manifest['version'],
+																				CACHE_VERSION))
+
+		weather = np.load(os.path.join(self.path, 'weather.npy'))
+		scenario.weather_data = pd.DataFrame(dict(zip(manifest['weather_columns'], weather)),
+											 columns=manifest['weather_columns'])
+		with open(os.path.join(self.path, 'building_properties.pickle'), 'rb') as f:
+			scenario.bpr_log = pickle.load(f)
+
+		scenario.fleet_state = Utils.FleetState.load(os.path.join(self.path, 'tsd'), mmap_mode)
+		scenario.fleet_state_ref = Utils.FleetState.load(os.path.join(self.path, 'tsd_ref'), mmap_mode)
+		schedules = np.load(os.path.join(self.path, 'schedules.npy'), mmap_mode=mmap_mode)
+
+		scenario.schedules_log, scenario.tsd_log, scenario.tsd_ref_log, scenario.schedules_ref_log = {}, {}, {}, {}
+		for i, name in enumerate(manifest['building_names']):
+			scenario.tsd_log[name] = scenario.fleet_state.building(name)
+			scenario.tsd_ref_log[name] = scenario.fleet_state_ref.building(name)
+			# the reference and the step simulation read the same occupancy file
+			scenario.schedules_log[name] = dict(zip(manifest['schedule_columns'], schedules[i]))
+			scenario.schedules_ref_log[name] = dict(zip(manifest['schedule_columns'], schedules[i]))
+		scenario.not_conditioned_buildings = manifest['not_conditioned_buildings']
+		scenario.failed_buildings = {} # scenarios with failed reference runs are not cached
+
+
+def scenario_input_files(locator, building_names):
+	"""
+	returns the files the initialization of the scenario depends on: everything in the inputs folder of the scenario
+	(zone shapefile, building properties and technology databases), the weather file and the occupancy schedules
+
+	:param locator: the input locator
+	:type locator: cea.inputlocator.InputLocator
+	:rtype: list
+	"""
+	files = []
+	for folder, _, names in os.walk(locator.get_input_folder()):
+		files.extend(os.path.join(folder, name) for name in names)
+	files.sort()
+	files.append(locator.get_weather_file())
+	files.extend(locator.get_schedule_model_file(name) for name in building_names)
+	return files
+
+
+def hash_inputs(locator, building_names):
+	"""
+	hash of the content of the scenario inputs, of the buildings simulated and of the time step configuration
+
+	:rtype: str
+	"""
+	sha = hashlib.sha1()
+	sha.update(json.dumps([CACHE_VERSION, list(building_names), HOURS_IN_YEAR, SEC_IN_TS]).encode())
+	input_folder = locator.get_input_folder()
+	for path in scenario_input_files(locator, building_names):
+		if path.startswith(input_folder):
+			sha.update(os.path.relpath(path, input_folder).encode())
+		else:
+			sha.update(os.path.basename(path).encode())
+		if os.path.exists(path):
+			with open(path, 'rb') as f:
+				for chunk in iter(lambda: f.read(1 << 20), b''):
+					sha.update(chunk)
+	return sha.hexdigest()[:16]
@@ -1,7 +1,6 @@
 import cea.config
 import cea.inputlocator
 from initialize import Initialize
-import pickle
 from building_model import Mpc
 
 
@@ -9,19 +8,15 @@ from building_model import Mpc
 
 #here must be a new scenario do it with only one building change cea.config
 def initialize (config, locator, sc_path):
-	scenario_cea = Initialize(config, locator)
+	#builds the scenario and saves it in the cache (only if the CEA inputs changed)
+	scenario_cea = Initialize(config, locator, cache_root=sc_path)
 	print(scenario_cea.__dict__)
 
-	#step2 save the scenario as pickle object
-	with open (sc_path, 'wb') as f:
-		pickle.dump(scenario_cea, f, pickle.HIGHEST_PROTOCOL)
-
 
 def test_simulation(config, locator, end, sc_path):
 	model = Mpc(config, locator)
 	bui_name = 'B1000'
-	with open (sc_path,'rb') as f:
-		scenario = pickle.load(f)
+	scenario = Initialize(config, locator, cache_root=sc_path)
 	print(scenario.__dict__.keys())
 
 	tsd = scenario.tsd_log[bui_name]
@@ -46,9 +41,9 @@ def test_simulation(config, locator, end, sc_path):
 if __name__ == '__main__':
 	config= cea.config.Configuration()
 	locator = cea.inputlocator.InputLocator(scenario = config.scenario)
-	sc_path = 'scenario_obj.pickle'
+	sc_path = 'scenario_cache'
 	
-	# STEP1 initialize and save the scenario obj
+	# STEP1 initialize and save the scenario in the cache
 	#initialize(config, locator, sc_path)
 
 	#STEP2 SIMULATION
@@ -11,7 +11,6 @@ import sys
 from building_model.initialize import Initialize 
 import cea.config
 import cea.inputlocator
-import pickle
 #from pyvis.network import Network
 
 #***SCENARIO CREATION***
@@ -75,21 +74,18 @@ METEO_PATH = 'meteo/meteo_mosaik_1h.csv'
 #GRID_FILE = 'test_pp'
 #NB the grid must already have loads/gen/storages and transf created
 Threshold_DSO = 0.05
+Intraday_horizon_DSO = 4 # steps of the schedule forecast again at every step
 
 
 
 def main():
 
-    #initialize the CEA scenario
+    #initialize the CEA scenario, rebuilt only when the CEA inputs change
     #config = cea.config.Configuration()
     #locator = cea.inputlocator.InputLocator(scenario = config.scenario)
-    #scenario_cea = Initialize(config, locator)
+    #scenario_cea = Initialize(config, locator, cache_root='building_model/scenario_cache')
     #print(scenario_cea.__dict__)
 
-    #step2 save the scenario as pickle object
-    #with open ('building_model/scenario_obj.pickle', 'wb') as f:
-    #    pickle.dump(scenario_cea, f, pickle.HIGHEST_PROTOCOL)
-
     #exit()
 
     """Compose the mosaik scenario and run the simulation."""
@@ -98,7 +94,8 @@ def main():
 
 #SIMULATORS START init()
 
-    dsosim = world.start('DSO', step_size = 60 * 60, TH = Threshold_DSO)
+    dsosim = world.start('DSO', step_size = 60 * 60, TH = Threshold_DSO, intraday_horizon = Intraday_horizon_DSO,
+                         bus_forecast = True)
 
     #mas = world.start('MAS', start_date = START)
 
@@ -152,7 +149,8 @@ def main():
         world.connect(pv, grid_bus[j], 'sgen')
         j+=1
 
-    world.connect(grid, dso, 'P_rt')
+    world.connect(grid, dso, 'P_rt', 'flexibility', 'P_buses', 'results')
+    world.connect(dso, grid, 'opf_request', weak=True) # same time opf negotiation, when dispatching with 'opf'
 
     #aggrs.setup_done()
     #drawing the entity graph